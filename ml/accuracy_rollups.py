@@ -0,0 +1,267 @@
+# accuracy_rollups.py - running error sums per (model version, stat, game day), kept up to date by reconciliation
+# usage: python3 accuracy_rollups.py [--days 30] [--window 7] [--version v]
+import argparse
+import math
+from collections import deque
+from datetime import date, timedelta
+from data_access import log_pool as pool #wherever the prediction log lives, see data_access.py
+
+"""
+get_model_accuracy() used to AVG every completed row in MLPredictions and should_retrain() counted them
+again, both got slower as the log grew and neither could say which stat or model version was off
+
+MLAccuracyRollups keeps one row per (ModelVersion, Stat, Day) with
+    Predictions       how many predictions were checked
+    SumAbsError       sum of |predicted - actual|          -> MAE
+    SumError          sum of (predicted - actual)          -> bias, positive means we predict too high
+    SumSquaredError   sum of (predicted - actual)^2        -> RMSE
+Day is the day the game was played. update_with_actual_results() folds every batch it completes into these
+rows in the same transaction (roll_up_range), and marks the predictions RolledUp so nothing is counted twice
+
+a question about any window ("last 7 days", "version x", "blocks only") only reads the rollup rows for it,
+at most days x stats x versions rows however many predictions have been logged
+"""
+
+STATS = ['points', 'rebounds', 'assists', 'steals', 'blocks', 'turnovers']
+ROLLING_WINDOW = 7 #days in a rolling MAE / bias
+UNKNOWN_VERSION = 'unknown' #predictions logged before the model version was stored
+
+CREATE_ROLLUP_SQL = """
+    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='MLAccuracyRollups' AND xtype='U')
+    CREATE TABLE MLAccuracyRollups (
+        ModelVersion NVARCHAR(64) NOT NULL,
+        Stat NVARCHAR(20) NOT NULL,
+        Day DATE NOT NULL,
+        Predictions INT NOT NULL,
+        SumAbsError FLOAT NOT NULL,
+        SumError FLOAT NOT NULL,
+        SumSquaredError FLOAT NOT NULL,
+        LastUpdated DATETIME DEFAULT GETDATE(),
+        PRIMARY KEY (ModelVersion, Stat, Day)
+    )
+"""
+
+#one (stat, |error|, signed error) row per stat of each prediction
+_ERRORS = ', '.join(f"('{stat}', p.{stat.capitalize()}Error, p.Predicted{stat.capitalize()} - p.Actual{stat.capitalize()})"
+                    for stat in STATS)
+
+#adds the completed, not yet counted predictions with ids in a range to the rollups
+#sql server merges, sqlite (no MERGE or lateral VALUES) upserts from a CASE per stat
+ROLLUP_SQL = {}
+ROLLUP_SQL['mssql'] = f"""
+    MERGE MLAccuracyRollups AS r
+    USING (
+        SELECT ISNULL(p.ModelVersion, '{UNKNOWN_VERSION}') AS ModelVersion,
+               v.Stat,
+               CAST(ISNULL(p.GameDate, p.CreatedDate) AS DATE) AS Day,
+               COUNT(*) AS Predictions,
+               SUM(v.AbsError) AS SumAbsError,
+               SUM(v.Error) AS SumError,
+               SUM(v.Error * v.Error) AS SumSquaredError
+        FROM MLPredictions p
+        CROSS APPLY (VALUES {_ERRORS}) v (Stat, AbsError, Error)
+        WHERE p.Id BETWEEN ? AND ?
+        AND p.GameCompleted = 1
+        AND p.RolledUp = 0
+        AND v.AbsError IS NOT NULL
+        GROUP BY ISNULL(p.ModelVersion, '{UNKNOWN_VERSION}'), v.Stat, CAST(ISNULL(p.GameDate, p.CreatedDate) AS DATE)
+    ) AS d
+    ON r.ModelVersion = d.ModelVersion AND r.Stat = d.Stat AND r.Day = d.Day
+    WHEN MATCHED THEN UPDATE SET
+        r.Predictions = r.Predictions + d.Predictions,
+        r.SumAbsError = r.SumAbsError + d.SumAbsError,
+        r.SumError = r.SumError + d.SumError,
+        r.SumSquaredError = r.SumSquaredError + d.SumSquaredError,
+        r.LastUpdated = GETDATE()
+    WHEN NOT MATCHED THEN
+        INSERT (ModelVersion, Stat, Day, Predictions, SumAbsError, SumError, SumSquaredError)
+        VALUES (d.ModelVersion, d.Stat, d.Day, d.Predictions, d.SumAbsError, d.SumError, d.SumSquaredError);
+"""
+_STAT_ROWS = ' UNION ALL '.join(f"SELECT '{stat}' AS Stat" for stat in STATS)
+ROLLUP_SQL['sqlite'] = f"""
+    INSERT INTO MLAccuracyRollups (ModelVersion, Stat, Day, Predictions, SumAbsError, SumError, SumSquaredError)
+    SELECT ModelVersion, Stat, Day, COUNT(*), SUM(AbsError), SUM(Error), SUM(Error * Error)
+    FROM (
+        SELECT IFNULL(p.ModelVersion, '{UNKNOWN_VERSION}') AS ModelVersion,
+               v.Stat,
+               date(IFNULL(p.GameDate, p.CreatedDate)) AS Day,
+               CASE v.Stat {' '.join(f"WHEN '{stat}' THEN p.{stat.capitalize()}Error" for stat in STATS)} END AS AbsError,
+               CASE v.Stat {' '.join(f"WHEN '{stat}' THEN p.Predicted{stat.capitalize()} - p.Actual{stat.capitalize()}" for stat in STATS)} END AS Error
+        FROM MLPredictions p
+        CROSS JOIN ({_STAT_ROWS}) v
+        WHERE p.Id BETWEEN ? AND ?
+        AND p.GameCompleted = 1
+        AND p.RolledUp = 0
+    ) e
+    WHERE AbsError IS NOT NULL
+    GROUP BY ModelVersion, Stat, Day
+    ON CONFLICT (ModelVersion, Stat, Day) DO UPDATE SET
+        Predictions = Predictions + excluded.Predictions,
+        SumAbsError = SumAbsError + excluded.SumAbsError,
+        SumError = SumError + excluded.SumError,
+        SumSquaredError = SumSquaredError + excluded.SumSquaredError,
+        LastUpdated = datetime('now')
+"""
+
+MARK_ROLLED_UP_SQL = """
+    UPDATE MLPredictions
+    SET RolledUp = 1
+    WHERE Id BETWEEN ? AND ?
+    AND GameCompleted = 1
+    AND RolledUp = 0
+"""
+
+#a local snapshot gets the table from schema.sql
+def create_rollup_table(cursor):
+    if pool.dialect == 'mssql':
+        cursor.execute(CREATE_ROLLUP_SQL)
+
+#folds one id range into the rollups, the caller commits (together with the reconciliation of the same range)
+#returns how many predictions were counted
+def roll_up_range(cursor, first_id, last_id):
+    cursor.execute(ROLLUP_SQL[pool.dialect], first_id, last_id)
+    cursor.execute(MARK_ROLLED_UP_SQL, first_id, last_id)
+    return max(cursor.rowcount, 0)
+
+#counts completed predictions that were never rolled up (completed before the rollups existed, or by another job)
+def roll_up_completed(conn, batch_size):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT Id
+        FROM MLPredictions
+        WHERE GameCompleted = 1
+        AND RolledUp = 0
+        ORDER BY Id
+    """)
+    ids = [row[0] for row in cursor.fetchall()]
+    rolled_up = 0
+    for i in range(0, len(ids), batch_size):
+        batch = ids[i:i + batch_size]
+        rolled_up += roll_up_range(cursor, batch[0], batch[-1])
+        conn.commit()
+    return rolled_up
+
+#WHERE clause and parameters for a window of the last days days and/or one model version
+def _window(days, model_version):
+    clauses, params = [], []
+    if days is not None:
+        clauses.append('Day >= ?')
+        params.append(date.today() - timedelta(days=days))
+    if model_version is not None:
+        clauses.append('ModelVersion = ?')
+        params.append(model_version)
+    return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+def _summary(n, sum_abs, sum_error, sum_squared):
+    return {
+        'predictions': n,
+        'mae': round(sum_abs / n, 3),
+        'bias': round(sum_error / n, 3),
+        'rmse': round(math.sqrt(max(sum_squared / n, 0.0)), 3)
+    }
+
+#{stat: {predictions, mae, bias, rmse}} over the last days days (None = everything), optionally one model version
+def get_accuracy(days=None, model_version=None):
+    where, params = _window(days, model_version)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT Stat, SUM(Predictions), SUM(SumAbsError), SUM(SumError), SUM(SumSquaredError)
+            FROM MLAccuracyRollups
+            {where}
+            GROUP BY Stat
+        """, *params)
+        rows = cursor.fetchall()
+    return {stat: _summary(*sums) for stat, *sums in rows if sums[0]}
+
+#{model version: {stat: {predictions, mae, bias, rmse}}}, to compare versions over the same window
+def accuracy_by_version(days=None):
+    where, params = _window(days, None)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT ModelVersion, Stat, SUM(Predictions), SUM(SumAbsError), SUM(SumError), SUM(SumSquaredError)
+            FROM MLAccuracyRollups
+            {where}
+            GROUP BY ModelVersion, Stat
+        """, *params)
+        rows = cursor.fetchall()
+    versions = {}
+    for version, stat, *sums in rows:
+        if sums[0]:
+            versions.setdefault(version, {})[stat] = _summary(*sums)
+    return versions
+
+#trailing window MAE and bias for one stat, one entry per game day over the last days days
+#returns a list of {day, predictions, mae, bias} where predictions counts the whole window
+def get_rolling_accuracy(stat, window=ROLLING_WINDOW, days=30, model_version=None):
+    #read window - 1 extra days so the first day shown has a full window behind it
+    where, params = _window(days + window - 1, model_version)
+    where += (' AND ' if where else 'WHERE ') + 'Stat = ?'
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT Day, SUM(Predictions), SUM(SumAbsError), SUM(SumError)
+            FROM MLAccuracyRollups
+            {where}
+            GROUP BY Day
+            ORDER BY Day
+        """, *params, stat)
+        daily = cursor.fetchall()
+
+    first_day = date.today() - timedelta(days=days)
+    rolling = []
+    in_window = deque()
+    n = sum_abs = sum_error = 0
+    for day, count, day_abs, day_error in daily:
+        day = day if isinstance(day, date) else date.fromisoformat(str(day)[:10])
+        in_window.append((day, count, day_abs, day_error))
+        n, sum_abs, sum_error = n + count, sum_abs + day_abs, sum_error + day_error
+        #drop the days that fell out of the window
+        while in_window[0][0] <= day - timedelta(days=window):
+            _, old_n, old_abs, old_error = in_window.popleft()
+            n, sum_abs, sum_error = n - old_n, sum_abs - old_abs, sum_error - old_error
+        if day >= first_day and n:
+            rolling.append({'day': day.isoformat(), 'predictions': n,
+                            'mae': round(sum_abs / n, 3), 'bias': round(sum_error / n, 3)})
+    return rolling
+
+#predictions checked against a game in the last days days (each prediction counted once, through points)
+def recent_completed(days=7):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT ISNULL(SUM(Predictions), 0)
+            FROM MLAccuracyRollups
+            WHERE Day >= ?
+            AND Stat = 'points'
+        """, date.today() - timedelta(days=days))
+        return cursor.fetchone()[0]
+
+def print_accuracy(accuracy, indent='  '):
+    for stat in STATS:
+        if stat in accuracy:
+            a = accuracy[stat]
+            print(f"{indent}{stat:10s} n={a['predictions']:<6d} MAE {a['mae']:6.2f}  bias {a['bias']:+6.2f}  RMSE {a['rmse']:6.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Prediction accuracy from the rollups')
+    parser.add_argument('--days', type=int, default=30, help='how many days back to look (default: 30)')
+    parser.add_argument('--window', type=int, default=ROLLING_WINDOW, help=f'days in the rolling MAE (default: {ROLLING_WINDOW})')
+    parser.add_argument('--version', default=None, help='only this model version')
+    args = parser.parse_args()
+
+    print(f"\nAccuracy over the last {args.days} days" + (f" for models {args.version}" if args.version else ''))
+    print_accuracy(get_accuracy(args.days, args.version))
+
+    if not args.version:
+        for version, accuracy in sorted(accuracy_by_version(args.days).items()):
+            print(f"\nModels {version}")
+            print_accuracy(accuracy)
+
+    print(f"\nRolling {args.window} day points MAE / bias")
+    for entry in get_rolling_accuracy('points', args.window, args.days, args.version):
+        print(f"  {entry['day']}  n={entry['predictions']:<5d} MAE {entry['mae']:6.2f}  bias {entry['bias']:+6.2f}")
+
+if __name__ == "__main__":
+    main()
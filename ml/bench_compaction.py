@@ -0,0 +1,52 @@
+# bench_compaction.py - compacts freshly trained models and prints the size, memory, latency and accuracy changes
+# usage: python3 bench_compaction.py [--rows 50000] [--prune]
+# uses a synthetic training frame so no database is needed
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np #math operations
+from bench_fixtures import make_training_frame
+from forest_compiler import compile_models
+from model_bundle import load_bundle
+from model_compaction import compact_forest, compact_saved_models, print_compaction_report
+from train_model import MODEL_SPECS, STATS, save_models
+from train_parallel import train_all, build_training_arrays
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--prune', action='store_true')
+    args = parser.parse_args()
+
+    df = make_training_frame(args.rows, seed=3)
+    print(f"Training on {len(df)} synthetic games...")
+    results = train_all(df)
+    models = {stat: results[stat]['model'] for stat in STATS}
+    feature_lists = {stat: MODEL_SPECS[stat]['features'] for stat in STATS}
+
+    #without pruning the trees have to make exactly the same decisions, only the leaf rounding may differ
+    compiled = compile_models(models, feature_lists)
+    compact = compact_forest(compiled.forest)
+    X = build_training_arrays(df.iloc[:2000])[0]
+    leaves = np.abs(compiled.forest.tree_predictions(X) - compact.tree_predictions(X))
+    largest_step = compact.value_scale.max()
+    if leaves.max() > largest_step / 2 + 1e-9:
+        print(f"✗ compacted trees differ by {leaves.max():.6f}, more than half a leaf step ({largest_step / 2:.6f})")
+        sys.exit(1)
+    print(f"✓ Compacted trees match, largest leaf rounding {leaves.max():.6f}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        cwd = os.getcwd()
+        os.chdir(folder) #save_models writes to the current folder
+        try:
+            save_models(*[models[stat] for stat in STATS], *[feature_lists[stat] for stat in STATS], training_rows=len(df))
+            report = compact_saved_models(df, '.', prune=args.prune)
+            mapped, manifest = load_bundle('.', verify=True)
+            assert manifest['training_stats']['compaction']['pruned'] == args.prune
+        finally:
+            os.chdir(cwd)
+    print_compaction_report(report)
+
+if __name__ == "__main__":
+    main()
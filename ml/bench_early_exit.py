@@ -0,0 +1,108 @@
+# bench_early_exit.py - latency against accuracy loss for early exit tree walking, compared with every tree
+# usage: python3 bench_early_exit.py [--models-dir .] [--batch-sizes 1,150] [--repeats 50] [--chunk 50]
+#                                    [--output bench_early_exit.json]
+# without --models-dir it builds fixture forests the same size as the real ones
+import argparse
+import json #writes the results
+import time
+import numpy as np #math operations
+from bench_fixtures import STATS, load_or_make_models, make_feature_rows
+from ensemble_engine import build_feature_matrix
+from forest_compiler import compile_models, EXIT_CHUNK, EXIT_MIN_ROWS
+
+"""
+every setting is run on the same rows and compared with predict_matrix (every tree):
+    p50 ms       - median time of one call
+    trees        - share of the trees walked, averaged over the rows
+    pred dev     - mean and largest difference in the predictions, relative to the full prediction
+                   (values under 1 count as 1, same as the early exit tolerance)
+    std dev      - mean difference in the uncertainty, same scale
+tolerance settings trade accuracy for speed through convergence, budget settings (tolerance 0, so
+only the time limit stops them) show what a hard latency cap costs. under each chart is the full walk
+estimate run_models compares budgets against (CompiledModelSet.full_walk_ms) and whether the service would
+walk in chunks at all for that many rows (EXIT_MIN_ROWS)
+"""
+
+TOLERANCES = [0.05, 0.02, 0.01, 0.005, 0.002]
+BUDGETS_MS = [0.5, 1, 2, 5]
+REPEATS = 50
+
+def p50_ms(fn, repeats):
+    fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+def deviation(full, early):
+    pred, spread = [], []
+    for stat in STATS:
+        scale = np.maximum(np.abs(full[stat][0]), 1.0)
+        pred.append(np.abs(early[stat][0] - full[stat][0]) / scale)
+        spread.append(np.abs(early[stat][1] - full[stat][1]) / np.maximum(full[stat][1], 1.0))
+    pred = np.concatenate(pred)
+    return float(pred.mean()), float(pred.max()), float(np.concatenate(spread).mean())
+
+def bench_batch(compiled, n_rows, repeats, chunk=EXIT_CHUNK):
+    matrix, _ = build_feature_matrix(make_feature_rows(n_rows, seed=n_rows), compiled.feature_lists)
+    total_trees = compiled.forest.n_trees
+    full = compiled.predict_matrix(matrix)
+    rows = [{'setting': 'all trees', 'p50Ms': p50_ms(lambda: compiled.predict_matrix(matrix), repeats), 'trees': 1.0,
+             'predMeanDev': 0.0, 'predMaxDev': 0.0, 'stdMeanDev': 0.0}]
+    settings = [(f'tolerance {t}', t, None) for t in TOLERANCES] + [(f'budget {b} ms', 0.0, b) for b in BUDGETS_MS]
+    for label, tolerance, budget in settings:
+        run = lambda: compiled.predict_matrix_early_exit(matrix, chunk, tolerance, budget)
+        results, used, _ = run()
+        mean_dev, max_dev, std_dev = deviation(full, results)
+        rows.append({'setting': label, 'p50Ms': p50_ms(run, repeats), 'trees': sum(u.sum() for u in used.values()) / (total_trees * n_rows),
+                     'predMeanDev': mean_dev, 'predMaxDev': max_dev, 'stdMeanDev': std_dev})
+    return rows
+
+#a table with a bar for the latency of each setting, next to how far the predictions moved
+def print_chart(n_rows, rows):
+    slowest = max(r['p50Ms'] for r in rows)
+    print(f"\n{n_rows} row(s) per call")
+    print(f"  {'setting':16s} {'p50 ms':>8s} {'trees':>6s} {'pred dev mean/max %':>20s} {'std dev %':>10s}  latency")
+    for r in rows:
+        bar = '█' * max(1, round(r['p50Ms'] / slowest * 30))
+        devs = f"{r['predMeanDev'] * 100:.2f} / {r['predMaxDev'] * 100:.2f}"
+        print(f"  {r['setting']:16s} {r['p50Ms']:8.3f} {r['trees'] * 100:5.0f}% {devs:>20s} {r['stdMeanDev'] * 100:10.2f}  {bar}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models-dir', default=None, help='directory with the real *_model.pkl files')
+    parser.add_argument('--batch-sizes', default='1,150')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--chunk', type=int, default=EXIT_CHUNK, help='trees per model in each round')
+    parser.add_argument('--output', default=None, help='also save the results as json')
+    args = parser.parse_args()
+
+    print("Loading models...")
+    models, feature_lists = load_or_make_models(args.models_dir)
+    compiled = compile_models(models, feature_lists)
+
+    #with every chunk walked the early exit path has to give the full answer
+    check, _ = build_feature_matrix(make_feature_rows(200, seed=1), feature_lists)
+    full = compiled.predict_matrix(check)
+    everything, used, reason = compiled.predict_matrix_early_exit(check, tolerance=0.0)
+    assert reason == 'all_trees' and all((used[stat] == end - start).all() for stat, (start, end) in compiled.tree_ranges.items())
+    for stat in STATS:
+        assert np.allclose(full[stat][0], everything[stat][0]) and np.allclose(full[stat][1], everything[stat][1]), stat
+    print("✓ Early exit with every tree matches predict_matrix")
+
+    results = {}
+    for n_rows in [int(size) for size in args.batch_sizes.split(',')]:
+        results[str(n_rows)] = bench_batch(compiled, n_rows, args.repeats, args.chunk)
+        print_chart(n_rows, results[str(n_rows)])
+        used = 'early exit' if n_rows >= EXIT_MIN_ROWS else f'every tree (under {EXIT_MIN_ROWS} rows)'
+        print(f"  full walk estimate {compiled.full_walk_ms(n_rows):.3f} ms, the service uses {used}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'chunk': args.chunk, 'results': results}, f, indent=2)
+        print(f"\n✓ Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
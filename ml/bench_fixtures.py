@@ -0,0 +1,125 @@
+# bench_fixtures.py - synthetic models and feature rows for running benchmarks without the database
+import json #reads metadata
+import pickle #loads saved models
+import os
+import numpy as np #math operations
+from sklearn.ensemble import RandomForestRegressor #the random forest ml algorithm
+
+#the six stats we predict, in the order the models are trained
+STATS = ['points', 'rebounds', 'assists', 'steals', 'blocks', 'turnovers']
+
+#same tree counts and depths as the train_*_model functions in train_model.py
+#so the fixture forests are about the same size as the real ones
+FIXTURE_MODEL_PARAMS = {
+    'points': {'n_estimators': 200, 'max_depth': 15, 'min_samples_split': 10, 'min_samples_leaf': 4, 'max_features': 'sqrt'},
+    'rebounds': {'n_estimators': 150, 'max_depth': 12, 'min_samples_split': 10},
+    'assists': {'n_estimators': 150, 'max_depth': 12, 'min_samples_split': 10},
+    'steals': {'n_estimators': 150, 'max_depth': 10, 'min_samples_split': 10},
+    'blocks': {'n_estimators': 150, 'max_depth': 10, 'min_samples_split': 10},
+    'turnovers': {'n_estimators': 150, 'max_depth': 10, 'min_samples_split': 10},
+}
+
+#rough (mean, spread) for each feature so the synthetic rows look like real box score averages
+FEATURE_RANGES = {
+    'SeasonAvgPoints': (12, 7), 'Last5AvgPoints': (12, 8), 'Last10AvgPoints': (12, 7.5),
+    'GamesPlayed': (40, 20), 'RecentForm': (0, 3), 'IsHome': None,
+    'OppDefenseRating': (115, 4), 'VsTeamAvgPoints': (12, 8), 'MatchupAdvantage': (0, 3),
+    'DefensiveDifficulty': (0, 0.4), 'IsVeteran': None, 'HasMatchupHistory': None,
+    'SeasonAvgRebounds': (4.5, 2.5), 'VsTeamAvgRebounds': (4.5, 3), 'OppReboundsAllowed': (44, 2),
+    'SeasonAvgAssists': (3, 2), 'VsTeamAvgAssists': (3, 2.5),
+    'SeasonAvgSteals': (0.8, 0.4), 'SeasonAvgBlocks': (0.5, 0.4), 'SeasonAvgTurnovers': (1.4, 0.8),
+}
+
+#differences between two averages, these can be negative
+SIGNED_FEATURES = {'RecentForm', 'MatchupAdvantage', 'DefensiveDifficulty'}
+
+#loads the feature lists from model_metadata.json
+def load_feature_lists(metadata_path='model_metadata.json'):
+    with open(metadata_path, 'r') as f:
+        metadata = json.load(f)
+    return {stat: metadata[f'{stat}_features'] for stat in STATS}
+
+#makes n random feature dictionaries with every feature any model needs
+def make_feature_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for _ in range(n):
+        row = {}
+        for name, spread in FEATURE_RANGES.items():
+            if spread is None:
+                row[name] = int(rng.integers(0, 2)) #yes/no features
+            elif name in SIGNED_FEATURES:
+                row[name] = float(rng.normal(*spread))
+            else:
+                row[name] = float(max(0.0, rng.normal(*spread))) #averages can't go below 0
+        row['GamesPlayed'] = int(row['GamesPlayed'])
+        rows.append(row)
+    return rows
+
+#trains one forest per stat on synthetic data, with the same shape as the production forests
+def make_fixture_models(feature_lists, n_train=5000, seed=0):
+    rows = make_feature_rows(n_train, seed)
+    rng = np.random.default_rng(seed + 1)
+    models = {}
+    for stat in STATS:
+        features = feature_lists[stat]
+        X = np.array([[row[f] for f in features] for row in rows])
+        #target loosely follows the first feature (the season average) with noise, like the real data
+        y = np.maximum(0, X[:, 0] + rng.normal(0, 1 + X[:, 0] * 0.3))
+        model = RandomForestRegressor(random_state=42, n_jobs=-1, **FIXTURE_MODEL_PARAMS[stat])
+        model.fit(X, y)
+        models[stat] = model
+    return models
+
+#loads the real pickled models if a directory is given, otherwise builds fixture models
+def load_or_make_models(models_dir=None, metadata_path='model_metadata.json'):
+    feature_lists = load_feature_lists(metadata_path)
+    if models_dir:
+        models = {}
+        for stat in STATS:
+            with open(os.path.join(models_dir, f'{stat}_model.pkl'), 'rb') as f:
+                models[stat] = pickle.load(f)
+        return models, feature_lists
+    return make_fixture_models(feature_lists), feature_lists
+
+#a synthetic training dataframe shaped like prepare_features() output: every feature plus the Actual* targets
+#steals/blocks/turnovers are often 0 like the real box scores, so the drop_zero filtering gets exercised
+def make_training_frame(n, seed=0):
+    import pandas as pd #handles data tables (data frames)
+    df = pd.DataFrame(make_feature_rows(n, seed))
+    rng = np.random.default_rng(seed + 1)
+    for target, average in [('ActualPoints', 'SeasonAvgPoints'), ('ActualRebounds', 'SeasonAvgRebounds'),
+                            ('ActualAssists', 'SeasonAvgAssists'), ('ActualSteals', 'SeasonAvgSteals'),
+                            ('ActualBlocks', 'SeasonAvgBlocks'), ('ActualTurnovers', 'SeasonAvgTurnovers')]:
+        df[target] = np.maximum(0, np.round(df[average] + rng.normal(0, 1 + df[average] * 0.3))).astype(int)
+    return df
+
+#n (agg_row, vs_row, opp_row) tuples shaped like the feature store / sql rows build_features() takes
+#about a third of the players have no matchup history and a few opponents have no defensive stats
+def make_raw_rows(n, seed=0):
+    rng = np.random.default_rng(seed + 2)
+    raw = []
+    for i, row in enumerate(make_feature_rows(n, seed)):
+        agg_row = (row['SeasonAvgPoints'], row['SeasonAvgRebounds'], row['SeasonAvgAssists'], row['SeasonAvgSteals'],
+                   row['SeasonAvgBlocks'], row['SeasonAvgTurnovers'], row['Last5AvgPoints'], row['Last10AvgPoints'],
+                   row['GamesPlayed'], 1000 + i)
+        vs_row = None
+        if rng.random() > 0.33:
+            vs_row = (row['VsTeamAvgPoints'], row['VsTeamAvgRebounds'], row['VsTeamAvgAssists'], int(rng.integers(1, 12)))
+        opp_row = (row['OppDefenseRating'], row['OppReboundsAllowed']) if rng.random() > 0.05 else None
+        raw.append((agg_row, vs_row, opp_row))
+    return raw
+
+#writes fixture (or given) models to a folder the way train_model.save_models does, as pickles, metadata
+#and the memory mapped bundle, so model_registry.load_bundle(directory) can load them
+def write_model_folder(directory, models, feature_lists, version='fixture'):
+    from forest_compiler import compile_models
+    from model_bundle import save_bundle
+    for stat in STATS:
+        with open(os.path.join(directory, f'{stat}_model.pkl'), 'wb') as f:
+            pickle.dump(models[stat], f)
+    metadata = {f'{stat}_features': feature_lists[stat] for stat in STATS}
+    metadata['version'] = version
+    with open(os.path.join(directory, 'model_metadata.json'), 'w') as f:
+        json.dump(metadata, f)
+    save_bundle(compile_models(models, feature_lists), directory, version=version, training_stats={'fixture': True})
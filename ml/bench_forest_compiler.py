@@ -0,0 +1,70 @@
+# bench_forest_compiler.py - parity check and speed test for forest_compiler
+# usage: python3 bench_forest_compiler.py [--models-dir .] [--repeats 200]
+# without --models-dir it builds fixture forests the same size as the real ones, so no database is needed
+import argparse
+import sys
+import time
+import numpy as np #math operations
+from bench_fixtures import STATS, load_or_make_models, make_feature_rows
+from ensemble_engine import build_feature_matrix, predict_all
+from forest_compiler import compile_forest, compile_models, check_parity
+
+#runs fn a few times and returns the median time in milliseconds
+def time_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models-dir', default=None, help='directory with the real *_model.pkl files')
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--batch-rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    print("Loading models...")
+    models, feature_lists = load_or_make_models(args.models_dir)
+
+    # 1. parity: every tree has to land on the same leaf as sklearn
+    rows = make_feature_rows(2000, seed=7)
+    print("\nParity against sklearn (largest per-tree difference):")
+    failed = False
+    for stat in STATS:
+        X = np.array([[row[f] for f in feature_lists[stat]] for row in rows])
+        diff = check_parity(models[stat], compile_forest(models[stat]), X)
+        print(f"  {stat:10s} {diff:.3g}")
+        failed |= diff != 0.0
+
+    compiled = compile_models(models, feature_lists)
+    expected = predict_all(models, feature_lists, rows)
+    actual = compiled.predict_all(rows)
+    for stat in STATS:
+        if not (np.allclose(expected[stat][0], actual[stat][0]) and np.allclose(expected[stat][1], actual[stat][1])):
+            print(f"  {stat} mean/std differ from ensemble_engine")
+            failed = True
+    if failed:
+        print("✗ Parity check failed")
+        sys.exit(1)
+    print("✓ Compiled models match sklearn")
+    print(f"\n{compiled.forest.n_trees} trees, {compiled.forest.n_nodes} nodes, max depth {compiled.forest.max_depth}")
+
+    # 2. single row latency for all six models
+    one_row = make_feature_rows(1, seed=1)
+    sklearn_ms = time_ms(lambda: predict_all(models, feature_lists, one_row), max(1, args.repeats // 10))
+    compiled_ms = time_ms(lambda: compiled.predict_all(one_row), args.repeats)
+    print(f"\nSingle row, six models:")
+    print(f"  sklearn trees:   {sklearn_ms:8.3f} ms")
+    print(f"  compiled arrays: {compiled_ms:8.3f} ms")
+
+    # 3. batch throughput
+    batch = make_feature_rows(args.batch_rows, seed=2)
+    matrix, _ = build_feature_matrix(batch, feature_lists)
+    batch_ms = time_ms(lambda: compiled.predict_matrix(matrix), 3)
+    print(f"\nBatch of {args.batch_rows} rows, six models:")
+    print(f"  compiled arrays: {batch_ms:8.1f} ms  ({args.batch_rows / (batch_ms / 1000):,.0f} rows/sec)")
+
+if __name__ == "__main__":
+    main()
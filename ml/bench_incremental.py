@@ -0,0 +1,47 @@
+# bench_incremental.py - times an incremental retrain against a full one and compares their accuracy
+# usage: python3 bench_incremental.py [--rows 50000] [--new-rows 2000] [--add-trees 20] [--tree-budget 1.5]
+# uses a synthetic training frame so no database is needed
+import argparse
+import os
+import tempfile
+import time
+from bench_fixtures import make_training_frame
+from train_model import MODEL_SPECS, STATS, save_models
+from train_parallel import train_all
+from train_incremental import train_incremental, ADD_TREES, TREE_BUDGET
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000, help='games the current models were trained on')
+    parser.add_argument('--new-rows', type=int, default=2000, help='games played since then')
+    parser.add_argument('--add-trees', type=int, default=ADD_TREES)
+    parser.add_argument('--tree-budget', type=float, default=TREE_BUDGET)
+    args = parser.parse_args()
+
+    df = make_training_frame(args.rows + args.new_rows, seed=5)
+    df['StatId'] = range(1, len(df) + 1)
+    old = df.iloc[:args.rows]
+
+    with tempfile.TemporaryDirectory() as folder:
+        cwd = os.getcwd()
+        os.chdir(folder) #save_models writes to the current folder
+        try:
+            print(f"Full training on the first {len(old)} games...")
+            start = time.perf_counter()
+            results = train_all(old)
+            print(f"Full training took {time.perf_counter() - start:.1f}s")
+            save_models(*[results[stat]['model'] for stat in STATS], *[MODEL_SPECS[stat]['features'] for stat in STATS],
+                        training_rows=len(old), trained_through=int(old['StatId'].max()))
+
+            print(f"\nIncremental training on {args.new_rows} new games...")
+            start = time.perf_counter()
+            results, trained_through = train_incremental(df, base_dir=folder, add_trees=args.add_trees,
+                                                         tree_budget=args.tree_budget, compare_full=True)
+            print(f"\nIncremental run (including the comparison retrain) took {time.perf_counter() - start:.1f}s")
+            grow_seconds = sum(r['metrics']['seconds'] for r in results.values())
+            print(f"Growing the six models took {grow_seconds:.1f}s, new watermark StatId {trained_through}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# bench_inference.py - times each step of a prediction without the database or the real models
+# usage: python3 bench_inference.py [--models-dir .] [--batch-sizes 1,150,500] [--repeats 200]
+#                                   [--output bench_inference.json] [--compare old.json]
+# without --models-dir it builds fixture forests the same size as the real ones
+import argparse
+import io
+import json #writes the results
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np #math operations
+from bench_fixtures import STATS, load_or_make_models, make_raw_rows, write_model_folder
+from ensemble_engine import build_feature_matrix
+
+"""
+predict_services.py is imported for real, pointed at a folder of fixture models (ML_MODEL_DIR) and with
+the feature store left unloaded (ML_PRELOAD_FEATURES=0). the name lookup and the feature fetch are
+replaced with stubs that hand back synthetic rows, everything after that is the service's own code
+
+each step is timed on its own for every batch size:
+    build_features       raw aggregate/matchup/defense rows -> feature dictionaries
+    feature_matrix       feature dictionaries -> the shared numpy matrix
+    six_model_predict    every tree of all six models walked, then averaged per model
+    per_tree_std         the spread of the tree predictions per model (the uncertainty)
+    predict_stats        the whole predict_stats() call (the two above plus the steals/blocks caps)
+    calculate_confidence the six confidence scores per row
+    build_response       the response dictionaries (includes calculate_confidence)
+    json_serialization   jsonify() of the response, like the endpoints return
+    score_items          the whole path with an empty prediction cache
+    score_items_cached   the whole path when every row is in the prediction cache
+    metrics_per_request  every histogram and counter one uncached request records (service_metrics.py),
+                         the instrumentation overhead, it doesn't grow with the rows
+and reported as p50/p99 milliseconds per call and rows per second
+
+the results are saved as json, --compare shows what changed against an older run and exits with 1 if
+any step's p50 got slower than --threshold percent
+"""
+
+BATCH_SIZES = [1, 150, 500] #one player, a typical slate, the batch endpoint's limit
+REPEATS = 200
+WARMUP = 5
+THRESHOLD = 10.0 #percent slower that counts as a regression in --compare
+
+#p50/p99 milliseconds and rows per second for fn, which handles n_rows rows per call
+def measure(fn, n_rows, repeats=REPEATS, warmup=WARMUP):
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    return {
+        'p50Ms': round(float(np.percentile(times, 50)) * 1000, 4),
+        'p99Ms': round(float(np.percentile(times, 99)) * 1000, 4),
+        'meanMs': round(float(times.mean()) * 1000, 4),
+        'rowsPerSec': round(n_rows / float(times.mean()), 1),
+        'calls': repeats
+    }
+
+#imports predict_services against the model folder without touching the database
+def load_service(model_dir):
+    os.environ['ML_MODEL_DIR'] = model_dir
+    os.environ['ML_PRELOAD_FEATURES'] = '0'
+    with redirect_stdout(io.StringIO()): #just the startup messages
+        import predict_services
+    return predict_services
+
+#replaces the name lookup and feature fetch with synthetic rows, player ids index into raw
+def stub_features(ps, raw):
+    ps.resolve_items = lambda items: [(i, (1,)) for i in range(len(items))]
+    ps.get_resolved_features = lambda resolved, flags: [ps.build_features(*raw[pid], is_home) for (pid, _), is_home in zip(resolved, flags)]
+
+#the timers and counters one uncached request goes through, see run_models/score_items/the endpoint wrappers
+def record_request_metrics(ps):
+    for phase in ['resolve_names', 'cache_lookup', 'slate_lookup', 'fetch_features', 'feature_matrix',
+                  'tree_walk', 'build_response', 'log_enqueue', 'serialize']:
+        with ps.predict_phase.time(phase):
+            pass
+    for stat in STATS:
+        with ps.model_phase.time(stat, 'reduce_mean'):
+            pass
+        with ps.model_phase.time(stat, 'reduce_std'):
+            pass
+    ps.predictions_total.inc('predicted', amount=1)
+    ps.request_duration.observe(0.001, 'bench')
+    ps.requests_total.inc('bench', 'POST', '200')
+
+def bench_batch(ps, n_rows, repeats):
+    bundle = ps.registry.current
+    compiled = bundle.compiled
+    raw = make_raw_rows(n_rows, seed=n_rows)
+    items = [(f'Player {i}', 'Opponent', i % 2) for i in range(n_rows)]
+    stub_features(ps, raw)
+
+    features = [ps.build_features(*row, 1) for row in raw]
+    matrix, _ = build_feature_matrix(features, compiled.feature_lists)
+    per_tree = compiled.forest.tree_predictions(matrix)
+    results = ps.predict_stats(features, bundle)
+    values = [ps.row_values(results, i) for i in range(n_rows)]
+    responses = [ps.build_prediction_response(p, o, f, v) for (p, o, _), f, v in zip(items, features, values)]
+    payload = responses[0] if n_rows == 1 else {'count': n_rows, 'succeeded': n_rows, 'failed': 0, 'results': responses}
+
+    def predict_means():
+        walked = compiled.forest.tree_predictions(matrix)
+        return {stat: walked[start:end].mean(axis=0) for stat, (start, end) in compiled.tree_ranges.items()}
+
+    def confidences():
+        for f, v in zip(features, values):
+            for stat in STATS:
+                ps.calculate_confidence(v[stat][0], v[stat][1], f, stat)
+
+    def score(clear):
+        if clear:
+            ps.prediction_cache.clear()
+        ps.score_items(items)
+
+    steps = {
+        'build_features': lambda: [ps.build_features(*row, 1) for row in raw],
+        'feature_matrix': lambda: build_feature_matrix(features, compiled.feature_lists),
+        'six_model_predict': predict_means,
+        'per_tree_std': lambda: [per_tree[start:end].std(axis=0) for start, end in compiled.tree_ranges.values()],
+        'predict_stats': lambda: ps.predict_stats(features, bundle),
+        'calculate_confidence': confidences,
+        'build_response': lambda: [ps.build_prediction_response(p, o, f, v) for (p, o, _), f, v in zip(items, features, values)],
+        'json_serialization': lambda: ps.jsonify(payload).get_data(),
+        'score_items': lambda: score(True),
+        'score_items_cached': lambda: score(False),
+        'metrics_per_request': lambda: record_request_metrics(ps),
+    }
+    timings = {}
+    with ps.app.app_context():
+        for name, fn in steps.items():
+            timings[name] = measure(fn, n_rows, repeats)
+    return timings
+
+def print_results(results):
+    for n_rows, timings in results.items():
+        print(f"\n{n_rows} row(s) per call")
+        print(f"  {'step':22s} {'p50 ms':>10s} {'p99 ms':>10s} {'rows/s':>12s}")
+        for name, t in timings.items():
+            print(f"  {name:22s} {t['p50Ms']:10.3f} {t['p99Ms']:10.3f} {t['rowsPerSec']:12,.0f}")
+
+#p50 change of every step against an older results file, returns True if something got slower than threshold
+def compare(results, old_path, threshold=THRESHOLD):
+    with open(old_path, 'r') as f:
+        old = json.load(f)['results']
+    print(f"\nCompared with {old_path} (p50, + = slower)")
+    regressed = False
+    for n_rows, timings in results.items():
+        for name, t in timings.items():
+            before = old.get(n_rows, {}).get(name)
+            if not before or not before['p50Ms']:
+                continue
+            change = (t['p50Ms'] / before['p50Ms'] - 1) * 100
+            flag = ' ✗' if change > threshold else ''
+            regressed |= change > threshold
+            print(f"  {n_rows:>4s} rows {name:22s} {before['p50Ms']:10.3f} -> {t['p50Ms']:10.3f} ms {change:+7.1f}%{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models-dir', default=None, help='directory with the real *_model.pkl files')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--output', default='bench_inference.json', help='where to save the results')
+    parser.add_argument('--compare', default=None, help='older results file to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='percent slower that fails --compare')
+    args = parser.parse_args()
+
+    print("Loading models...")
+    models, feature_lists = load_or_make_models(args.models_dir)
+    with tempfile.TemporaryDirectory() as model_dir:
+        write_model_folder(model_dir, models, feature_lists)
+        ps = load_service(model_dir)
+        bundle = ps.registry.current
+
+        #the service has to give the same numbers as sklearn before the timing means anything
+        check = make_raw_rows(50, seed=99)
+        features = [ps.build_features(*row, 1) for row in check]
+        results = ps.predict_stats(features, bundle)
+        for stat in ['points', 'rebounds', 'assists', 'turnovers']: #steals and blocks get capped
+            X = np.array([[f[name] for name in feature_lists[stat]] for f in features])
+            if not np.allclose(results[stat][0], models[stat].predict(X)):
+                print(f"✗ {stat} predictions differ from sklearn")
+                sys.exit(1)
+
+        results = {}
+        for n_rows in [int(size) for size in args.batch_sizes.split(',')]:
+            print(f"Timing {n_rows} row(s)...")
+            results[str(n_rows)] = bench_batch(ps, n_rows, args.repeats)
+
+    print_results(results)
+    import sklearn
+    report = {
+        'createdAt': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(), 'numpy': np.__version__, 'sklearn': sklearn.__version__,
+            'machine': platform.machine(), 'cpus': os.cpu_count()
+        },
+        'models': {'source': args.models_dir or 'fixture', 'trees': bundle.info()['trees']},
+        'repeats': args.repeats,
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# bench_point_in_time.py - checks the point in time features against a slow per row version, then times a full size run
+# usage: python3 bench_point_in_time.py [--seasons 4] [--repeats 3]
+# uses synthetic box scores shaped like the training cache, so no database is needed
+import argparse
+import time
+import numpy as np #math operations
+import pandas as pd #handles data tables (data frames)
+from point_in_time_features import (build_point_in_time_frame, FEATURE_COLUMNS, SEASON_AVERAGES, MATCHUP_AVERAGES,
+                                    DEFAULT_DEFENSE_RATING, DEFAULT_REBOUNDS_ALLOWED)
+
+"""
+4 seasons of 30 teams, 82 games each and about 19 box score rows a side comes out around 185K rows, the size of
+the real cache. the check rebuilds every feature for a smaller league one row at a time with plain pandas
+filters (everything before this game, same player/season, ...) and compares
+"""
+
+TEAMS = 30
+GAMES_PER_TEAM = 82
+ROSTER = 24
+REPEATS = 3
+
+#box score rows with the training_data.STATS_COLUMNS columns
+def make_box_scores(n_seasons=4, teams=TEAMS, games_per_team=GAMES_PER_TEAM, seed=0):
+    rng = np.random.default_rng(seed)
+    names = np.array([f'Team {i}' for i in range(teams)], dtype=object)
+    frames = []
+    game_id = 0
+    for s in range(n_seasons):
+        season = f'{2022 + s}-{2023 + s}'
+        n_games = teams * games_per_team // 2
+        home = rng.integers(0, teams, n_games)
+        away = (home + rng.integers(1, teams, n_games)) % teams
+        #a few games a night, some at the same time
+        starts = pd.Timestamp(f'{2022 + s}-10-20 19:00') + pd.to_timedelta(np.sort(rng.integers(0, 170, n_games)), unit='D') \
+            + pd.to_timedelta(rng.integers(0, 3, n_games) * 30, unit='min')
+        for side, teams_in_game, opponents in [(1, home, away), (0, away, home)]:
+            played = rng.integers(15, 24, n_games) #box score rows include the DNPs
+            rows = np.repeat(np.arange(n_games), played)
+            slot = np.concatenate([rng.permutation(ROSTER)[:n] for n in played])
+            team = teams_in_game[rows]
+            skill = 4 + (slot * 7 + team * 3 + s) % 22
+            frame = pd.DataFrame({
+                'Season': season,
+                'PlayerApiId': (s * 1000 + team * ROSTER + slot) % (teams * ROSTER * 2) + 1, #some players stay a season
+                'TeamName': names[team],
+                'ActualPoints': rng.poisson(skill),
+                'ActualRebounds': rng.poisson(skill / 4),
+                'ActualAssists': rng.poisson(skill / 5),
+                'ActualSteals': rng.poisson(0.8, len(rows)).astype(float),
+                'ActualBlocks': rng.poisson(0.5, len(rows)).astype(float),
+                'ActualTurnovers': rng.poisson(1.3, len(rows)).astype(float),
+                'IsHome': side,
+                'OpponentTeam': names[opponents[rows]],
+                'GameId': game_id + rows,
+                'TeamId': team + 1,
+                'GameTime': starts[rows]
+            })
+            #steals/blocks/turnovers weren't always recorded
+            missing = rng.random(len(frame)) < 0.03
+            frame.loc[missing, ['ActualSteals', 'ActualBlocks', 'ActualTurnovers']] = np.nan
+            frames.append(frame)
+        game_id += n_games
+    df = pd.concat(frames, ignore_index=True)
+    df = df.sample(frac=1, random_state=seed).reset_index(drop=True) #the cache is in Stats.Id order, not game order
+    df.insert(0, 'StatId', np.arange(1, len(df) + 1))
+    return df
+
+#the same features one row at a time, the obvious way
+def slow_features(df, min_prior_games):
+    df = df.copy()
+    df['GameTime'] = pd.to_datetime(df['GameTime'])
+    earlier = lambda rows, row: rows[(rows['GameTime'] < row.GameTime) | ((rows['GameTime'] == row.GameTime) & (rows['StatId'] < row.StatId))]
+    team_games = df.groupby(['GameId', 'TeamId']).agg(Season=('Season', 'first'), GameTime=('GameTime', 'min'),
+                                                        Points=('ActualPoints', 'sum'), Rebounds=('ActualRebounds', 'sum')).reset_index()
+    out = []
+    for row in df.itertuples():
+        season = df[(df['PlayerApiId'] == row.PlayerApiId) & (df['Season'] == row.Season)]
+        before = earlier(season, row)
+        values = {name: before[source].mean() for name, source in SEASON_AVERAGES}
+        recent = before.sort_values(['GameTime', 'StatId'])['ActualPoints']
+        values['Last5AvgPoints'] = recent.tail(5).mean()
+        values['Last10AvgPoints'] = recent.tail(10).mean()
+        values['GamesPlayed'] = len(before)
+        vs = before[before['OpponentTeam'] == row.OpponentTeam]
+        for name, source in MATCHUP_AVERAGES:
+            values[name] = vs[source].mean() if len(vs) else values[name.replace('VsTeam', 'Season')]
+        values['VsTeamGames'] = len(vs)
+        game = team_games[team_games['GameId'] == row.GameId]
+        opponent = game[game['TeamId'] != row.TeamId]['TeamId']
+        allowed = []
+        if len(game) == 2:
+            theirs = team_games[(team_games['TeamId'] == opponent.iloc[0]) & (team_games['Season'] == row.Season)
+                                & ((team_games['GameTime'] < row.GameTime)
+                                   | ((team_games['GameTime'] == row.GameTime) & (team_games['GameId'] < row.GameId)))]
+            for _, g in theirs.iterrows():
+                other = team_games[(team_games['GameId'] == g.GameId) & (team_games['TeamId'] != g.TeamId)]
+                if len(other) == 1:
+                    allowed.append((other['Points'].iloc[0], other['Rebounds'].iloc[0]))
+        values['OppDefenseRating'] = np.mean([a[0] for a in allowed]) if allowed else DEFAULT_DEFENSE_RATING
+        values['OppReboundsAllowed'] = np.mean([a[1] for a in allowed]) if allowed else DEFAULT_REBOUNDS_ALLOWED
+        values['StatId'] = row.StatId
+        out.append(values)
+    slow = pd.DataFrame(out)
+    return slow[slow['GamesPlayed'] >= min_prior_games].sort_values('StatId').reset_index(drop=True)
+
+def check(min_prior_games=5):
+    df = make_box_scores(n_seasons=2, teams=6, games_per_team=16, seed=7)
+    fast = build_point_in_time_frame(df, min_prior_games)
+    slow = slow_features(df, min_prior_games)
+    assert list(fast['StatId']) == list(slow['StatId']), 'different rows kept'
+    for name in FEATURE_COLUMNS:
+        a, b = fast[name].to_numpy(dtype=float), slow[name].to_numpy(dtype=float)
+        assert np.allclose(a, b, equal_nan=True), f'{name} differs, largest gap {np.nanmax(np.abs(a - b))}'
+    print(f"✓ Point in time features match the per row version ({len(fast)} of {len(df)} rows kept)")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seasons', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    check()
+
+    df = make_box_scores(args.seasons)
+    times = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        features = build_point_in_time_frame(df)
+        times.append(time.perf_counter() - start)
+    print(f"\n{len(df)} box score rows -> {len(features)} training rows")
+    print(f"  best {min(times):.2f}s, median {float(np.median(times)):.2f}s over {args.repeats} run(s)"
+          f" ({len(df) / min(times):,.0f} rows/s)")
+
+    #a model trained on these only ever saw numbers from before the game
+    from train_model import prepare_features
+    prepared = prepare_features(features)
+    print(f"  prepare_features: {len(prepared)} rows, {prepared['HasMatchupHistory'].mean() * 100:.1f}% with matchup history")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench_startup.py - compares loading the six pickles with memory mapping the compiled bundle
+# usage: python3 bench_startup.py [--models-dir .] [--runs 5]
+# without --models-dir it builds fixture forests the same size as the real ones, so no database is needed
+# every load runs in a fresh python process so nothing is already in memory from a previous run
+import argparse
+import json
+import os
+import pickle #saves the fixture models
+import shutil
+import subprocess
+import sys
+import tempfile
+import numpy as np #math operations
+from bench_fixtures import STATS, load_or_make_models, make_feature_rows
+from forest_compiler import compile_models
+from model_bundle import save_bundle, load_bundle
+
+#runs inside the child process: times one load + first prediction and reports memory from /proc
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, {here!r})
+from model_registry import load_bundle
+from bench_fixtures import make_feature_rows
+row = make_feature_rows(1, seed=1)
+start = time.perf_counter()
+bundle = load_bundle({directory!r}, verify={verify!r})
+loaded = time.perf_counter()
+bundle.compiled.predict_all(row)
+first = time.perf_counter()
+memory = {{}}
+try:
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            if key in ('Rss', 'Pss', 'Private_Dirty', 'Shared_Clean'):
+                memory[key] = int(value.split()[0]) // 1024
+except OSError:
+    pass
+print(json.dumps({{'load_ms': (loaded - start) * 1000, 'first_ms': (first - loaded) * 1000, 'source': bundle.info()['source'], 'memory_mb': memory}}))
+'''
+
+def run_child(directory, verify=False):
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = CHILD.format(here=here, directory=directory, verify=verify)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(name, runs):
+    load = np.median([r['load_ms'] for r in runs])
+    first = np.median([r['first_ms'] for r in runs])
+    memory = runs[-1]['memory_mb']
+    mem = ', '.join(f'{k} {v} MB' for k, v in memory.items()) if memory else 'n/a'
+    print(f"  {name:22s} load {load:9.1f} ms   first prediction {first:7.2f} ms   ({mem})")
+    return load
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models-dir', default=None, help='directory with the real *_model.pkl files')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print("Loading models...")
+    models, feature_lists = load_or_make_models(args.models_dir)
+    compiled = compile_models(models, feature_lists)
+
+    work = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        # the same six forests saved both ways
+        pickle_dir = os.path.join(work, 'pickle')
+        bundle_dir = os.path.join(work, 'bundle')
+        os.makedirs(pickle_dir)
+        os.makedirs(bundle_dir)
+        metadata = {f'{stat}_features': feature_lists[stat] for stat in STATS}
+        metadata['version'] = 'bench'
+        for stat in STATS:
+            with open(os.path.join(pickle_dir, f'{stat}_model.pkl'), 'wb') as f:
+                pickle.dump(models[stat], f)
+        with open(os.path.join(pickle_dir, 'model_metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+        manifest = save_bundle(compiled, bundle_dir, version='bench')
+
+        pickle_mb = sum(os.path.getsize(os.path.join(pickle_dir, name)) for name in os.listdir(pickle_dir)) / 1e6
+        print(f"\nPickles: {pickle_mb:.1f} MB, bundle: {manifest['bytes'] / 1e6:.1f} MB")
+
+        # parity: the mapped bundle has to predict exactly what the freshly compiled models do
+        rows = make_feature_rows(2000, seed=7)
+        mapped, _ = load_bundle(bundle_dir, verify=True)
+        expected = compiled.predict_all(rows)
+        actual = mapped.predict_all(rows)
+        for stat in STATS:
+            if not (np.array_equal(expected[stat][0], actual[stat][0]) and np.array_equal(expected[stat][1], actual[stat][1])):
+                print(f"✗ {stat} predictions from the mapped bundle differ")
+                sys.exit(1)
+        print("✓ Mapped bundle matches the compiled pickles")
+
+        print(f"\nStartup, median of {args.runs} fresh processes:")
+        pickle_ms = summarize('pickles + compile', [run_child(pickle_dir) for _ in range(args.runs)])
+        mmap_ms = summarize('mmap bundle', [run_child(bundle_dir) for _ in range(args.runs)])
+        summarize('mmap bundle + sha256', [run_child(bundle_dir, verify=True) for _ in range(args.runs)])
+        print(f"\nmmap bundle loads {pickle_ms / max(mmap_ms, 1e-6):.0f}x faster")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
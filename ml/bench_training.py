@@ -0,0 +1,54 @@
+# bench_training.py - checks train_parallel gives the same models as training one at a time, and times both
+# usage: python3 bench_training.py [--rows 50000] [--cores N] [--model-workers M]
+# uses a synthetic training frame so no database is needed
+import argparse
+import time
+import numpy as np #math operations
+import pandas as pd #handles data tables (data frames)
+from bench_fixtures import make_training_frame, make_feature_rows
+from train_model import MODEL_SPECS, STATS, train_stat_model
+from train_parallel import train_all, add_parallel_args
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    add_parallel_args(parser)
+    args = parser.parse_args()
+
+    df = make_training_frame(args.rows, seed=3)
+    print(f"Synthetic training frame: {len(df)} rows")
+
+    # 1. the old way, one model after another
+    print("\nOne at a time (train_*_model):")
+    sequential = {}
+    sequential_seconds = {}
+    start = time.perf_counter()
+    for stat in STATS:
+        t = time.perf_counter()
+        sequential[stat], _ = train_stat_model(df, stat)
+        sequential_seconds[stat] = time.perf_counter() - t
+    sequential_total = time.perf_counter() - start
+
+    # 2. the orchestrator
+    print("\nParallel (train_parallel.train_all):")
+    start = time.perf_counter()
+    parallel = train_all(df, cores=args.cores, model_workers=args.model_workers)
+    parallel_total = time.perf_counter() - start
+
+    # same random_state and the same float32 inputs, so every tree should come out identical
+    rows = make_feature_rows(2000, seed=9)
+    identical = True
+    for stat in STATS:
+        X = pd.DataFrame(rows)[MODEL_SPECS[stat]['features']]
+        if not np.array_equal(sequential[stat].predict(X), parallel[stat]['model'].predict(X)):
+            print(f"✗ {stat} predictions differ")
+            identical = False
+    print("✓ Parallel models match the one-at-a-time models" if identical else "✗ Models differ")
+
+    print(f"\n{'model':10s} {'one at a time':>14s} {'parallel':>10s}")
+    for stat in STATS:
+        print(f"{stat:10s} {sequential_seconds[stat]:13.1f}s {parallel[stat]['metrics']['seconds']:9.1f}s")
+    print(f"{'total':10s} {sequential_total:13.1f}s {parallel_total:9.1f}s  ({sequential_total / parallel_total:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# bench_uncertainty.py - compares the old per-tree predict loop with ensemble_engine
+# usage: python3 bench_uncertainty.py [--models-dir .] [--repeats 20]
+# without --models-dir it builds fixture forests the same size as the real ones, so no database is needed
+import argparse
+import time
+import numpy as np #math operations
+from bench_fixtures import STATS, load_or_make_models, make_feature_rows
+from ensemble_engine import predict_all
+
+#the way predict() used to do it: forest predict plus one sklearn predict call per tree
+def legacy_predict_all(models, feature_lists, feature_rows):
+    results = {}
+    for stat in STATS:
+        X = np.array([[features[f] for f in feature_lists[stat]] for features in feature_rows])
+        preds = models[stat].predict(X)
+        stds = np.std([tree.predict(X) for tree in models[stat].estimators_], axis=0)
+        results[stat] = (preds, stds)
+    return results
+
+#runs fn a few times and returns the median time in milliseconds
+def time_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models-dir', default=None, help='directory with the real *_model.pkl files')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    print("Loading models...")
+    models, feature_lists = load_or_make_models(args.models_dir)
+
+    for n_rows in [1, 150]:
+        rows = make_feature_rows(n_rows, seed=n_rows)
+
+        #both ways have to give the same numbers before the timing means anything
+        old = legacy_predict_all(models, feature_lists, rows)
+        new = predict_all(models, feature_lists, rows)
+        for stat in STATS:
+            assert np.allclose(old[stat][0], new[stat][0]), f'{stat} predictions differ'
+            assert np.allclose(old[stat][1], new[stat][1]), f'{stat} std deviations differ'
+
+        old_ms = time_ms(lambda: legacy_predict_all(models, feature_lists, rows), args.repeats)
+        new_ms = time_ms(lambda: predict_all(models, feature_lists, rows), args.repeats)
+        print(f"\n{n_rows} row(s), six models:")
+        print(f"  per-tree loop:   {old_ms:8.2f} ms")
+        print(f"  ensemble_engine: {new_ms:8.2f} ms  ({old_ms / new_ms:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# data_access.py - picks where the ML code reads and writes its data: azure sql or a local sqlite snapshot
+# usage: python3 data_access.py export [--output basketball_snapshot.db] [--with-predictions]
+#        python3 data_access.py info [--snapshot basketball_snapshot.db]
+import argparse
+import os
+import re
+import sqlite3 #the local snapshot, part of python
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+"""
+every query in the ML code goes through a pool from here instead of opening its own connection:
+
+    read_pool   features, name lookups, the slate and training data (predict_services.py, feature_store.py,
+                slate_precompute.py, train_model.py)
+    log_pool    the prediction log, reconciliation and the accuracy rollups (prediction_logger.py,
+                accuracy_rollups.py)
+
+each one is backed by either
+    azure       the shared db_pool.ConnectionPool (the default)
+    snapshot    a single sqlite file with the tables from schema.sql, exported from azure with
+                "python3 data_access.py export". no network, so serving, training and the benchmarks run
+                locally and reads don't pay the round trip to azure
+
+ML_DATA_BACKEND picks the backend for read_pool and ML_LOG_BACKEND for log_pool (both 'azure' or
+'snapshot'), ML_SNAPSHOT_PATH says where the file is. with ML_DATA_BACKEND=snapshot the predictions still
+get logged to azure unless ML_LOG_BACKEND=snapshot too
+
+both pools hand out connections the same way (with pool.connection() as conn: conn.cursor().execute(sql, *params))
+and the snapshot cursor understands the bits of sql server syntax the read queries use (ISNULL, GETDATE,
+DATEADD and "(VALUES ...) AS name(columns)"). the few statements that can't be written for both
+(MERGE, CROSS APPLY, @@IDENTITY) are kept per dialect next to the code that runs them and picked with pool.dialect
+"""
+
+DATA_BACKEND = os.environ.get('ML_DATA_BACKEND', 'azure')
+LOG_BACKEND = os.environ.get('ML_LOG_BACKEND', 'azure')
+SNAPSHOT_FILE = 'basketball_snapshot.db'
+SNAPSHOT_PATH = os.environ.get('ML_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), SNAPSHOT_FILE))
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'schema.sql')
+EXPORT_CHUNK = 50000 #rows copied at a time
+
+#the tables serving and training read, in an order that keeps the foreign keys happy
+SNAPSHOT_TABLES = ['Teams', 'Players', 'Games', 'Stats', 'TeamGameStats', 'PlayerAggregates', 'PlayerVsTeam',
+                   'OpponentDefensiveStats', 'Schedule']
+LOG_TABLES = ['MLPredictions', 'MLAccuracyRollups']
+
+# schema
+
+#schema.sql is written for sql server, these turn it into sqlite (same tables, columns and indexes)
+SCHEMA_REWRITES = [
+    (r'\[dbo\]\.', ''),
+    (r'\[(\w+)\]', r'\1'),
+    (r'\bINT\s+IDENTITY\s*\(1,\s*1\)\s+NOT NULL', 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (r',([ \t]*--[^\n]*)?\s*PRIMARY KEY CLUSTERED \(Id ASC\)', r'\1'), #the identity column is already the key
+    (r'\b(NON)?CLUSTERED\b\s*', ''),
+    (r'DEFAULT \(getdate\(\)\)', "DEFAULT (datetime('now'))"), #sqlite's now is UTC, like GETDATE() on azure
+]
+
+def snapshot_schema(schema_sql):
+    for pattern, replacement in SCHEMA_REWRITES:
+        schema_sql = re.sub(pattern, replacement, schema_sql, flags=re.IGNORECASE)
+    return schema_sql
+
+# sqlite connections that act like pyodbc ones
+
+#datetimes go in as text that sorts the same way GETDATE() prints, and DATETIME/DATE columns come back as
+#datetime/date objects like they do from pyodbc
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+for decl in ('DATETIME', 'DATETIME2'):
+    sqlite3.register_converter(decl, lambda value: datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()[:10]))
+
+DATEADD_UNITS = {'year': None, 'month': None, 'day': 'days', 'hour': 'hours', 'minute': 'minutes', 'second': 'seconds'}
+
+#UTC like GETDATE() on Azure SQL, so the exported Schedule/Stats times and "now" stay on the same clock
+def _getdate():
+    return datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0).isoformat(' ')
+
+def _dateadd(unit, amount, value):
+    if value is None or amount is None:
+        return None
+    moment = datetime.fromisoformat(str(value))
+    unit = unit.lower()
+    if unit in ('year', 'month'):
+        months = moment.month - 1 + int(amount) * (12 if unit == 'year' else 1)
+        moment = moment.replace(year=moment.year + months // 12, month=months % 12 + 1)
+    else:
+        moment += timedelta(**{DATEADD_UNITS[unit]: float(amount)})
+    return moment.isoformat(' ')
+
+#"(VALUES (?, ?), (?, ?)) AS req(Idx, TeamId)" -> a subquery sqlite accepts
+VALUES_ALIAS = re.compile(r'\(VALUES\s+((?:\([^()]*\)\s*,?\s*)+)\)\s+AS\s+(\w+)\s*\(([^)]*)\)', re.IGNORECASE)
+
+def _values_subquery(match):
+    columns = [name.strip() for name in match.group(3).split(',')]
+    selected = ', '.join(f'column{i + 1} AS {name}' for i, name in enumerate(columns))
+    return f'(SELECT {selected} FROM (VALUES {match.group(1).strip()})) AS {match.group(2)}'
+
+#ISNULL(a, b) is IFNULL in sqlite (ISNULL is an operator there), DATEADD's unit becomes a string for _dateadd
+def translate_sql(sql):
+    sql = re.sub(r'\bISNULL\(', 'IFNULL(', sql, flags=re.IGNORECASE)
+    sql = re.sub(r'DATEADD\(\s*(\w+)\s*,', r"DATEADD('\1',", sql, flags=re.IGNORECASE)
+    return VALUES_ALIAS.sub(_values_subquery, sql)
+
+class SnapshotCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.fast_executemany = False #accepted and ignored, sqlite has no round trips to save
+
+    #execute(sql, a, b) like pyodbc, or execute(sql, [a, b]) like pandas does
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._cursor.execute(translate_sql(sql), params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(translate_sql(sql), rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+class SnapshotConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return SnapshotCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+def connect_snapshot(path, read_only=True):
+    if read_only:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    conn.create_function('GETDATE', 0, _getdate)
+    conn.create_function('DATEADD', 3, _dateadd, deterministic=True)
+    conn.execute('PRAGMA busy_timeout = 5000') #a reader waits for a log write instead of failing
+    return conn
+
+#same interface as db_pool.ConnectionPool, one connection per thread (sqlite connections are cheap and
+#a forked worker opens its own)
+class SnapshotPool:
+    dialect = 'sqlite'
+
+    def __init__(self, path, read_only=True):
+        self.path = path
+        self.read_only = read_only
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+        self._stats = {'checkouts': 0, 'created': 0, 'errors': 0}
+
+    def _get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(f'No snapshot at {self.path}, create one with: python3 data_access.py export')
+            conn = SnapshotConnection(connect_snapshot(self.path, self.read_only))
+            self._local.conn, self._local.pid = conn, os.getpid()
+            with self._lock:
+                self._all.append(conn)
+                self._stats['created'] += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._get()
+        with self._lock:
+            self._stats['checkouts'] += 1
+        try:
+            yield conn
+        except BaseException:
+            with self._lock:
+                self._stats['errors'] += 1
+            conn.rollback()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, backend='snapshot', path=self.path, live=len(self._all), idle=0, in_use=len(self._all))
+
+    def close_all(self):
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+# the pools
+
+#azure is only imported when something uses it, so a snapshot-only run doesn't need pyodbc or the odbc driver
+def azure_pool():
+    from db_pool import pool
+    return pool
+
+def make_pool(backend, read_only):
+    if backend == 'snapshot':
+        return SnapshotPool(SNAPSHOT_PATH, read_only=read_only)
+    if backend != 'azure':
+        raise ValueError(f"Unknown data backend {backend!r}, expected 'azure' or 'snapshot'")
+    return azure_pool()
+
+read_pool = make_pool(DATA_BACKEND, read_only=True)
+log_pool = make_pool(LOG_BACKEND, read_only=False)
+
+# export
+
+#creates an empty snapshot with every table and index from schema.sql
+def create_snapshot(path, schema_path=SCHEMA_PATH):
+    with open(schema_path, 'r') as f:
+        schema = snapshot_schema(f.read())
+    conn = sqlite3.connect(path)
+    conn.executescript(schema)
+    conn.execute('PRAGMA journal_mode = WAL') #readers don't block the log writer
+    conn.commit()
+    return conn
+
+#copies tables from source (a pool) into a new snapshot file, swapped in once it's complete
+#returns {table: rows}
+def export_snapshot(source, path=SNAPSHOT_PATH, tables=SNAPSHOT_TABLES, chunk_size=EXPORT_CHUNK):
+    tmp = path + '.tmp'
+    for leftover in (tmp, tmp + '-wal', tmp + '-shm'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    target = create_snapshot(tmp)
+    counts = {}
+    with source.connection() as conn:
+        cursor = conn.cursor()
+        for table in tables:
+            start = time.perf_counter()
+            snapshot_columns = [row[1] for row in target.execute(f'PRAGMA table_info({table})')]
+            cursor.execute(f'SELECT * FROM {table}')
+            #columns production has that the schema doesn't are left out
+            source_columns = [column[0] for column in cursor.description]
+            keep = [i for i, name in enumerate(source_columns) if name in snapshot_columns]
+            insert = f"INSERT INTO {table} ({', '.join(source_columns[i] for i in keep)}) VALUES ({', '.join('?' * len(keep))})"
+            counts[table] = 0
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                target.executemany(insert, [tuple(row[i] for i in keep) for row in rows])
+                counts[table] += len(rows)
+            target.commit()
+            print(f"  {table}: {counts[table]} rows in {time.perf_counter() - start:.1f}s")
+    target.execute('ANALYZE') #statistics for the query planner
+    target.commit()
+    target.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    target.close()
+    os.replace(tmp, path)
+    return counts
+
+#rows per table in a snapshot
+def snapshot_info(path=SNAPSHOT_PATH):
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in tables}
+    finally:
+        conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local sqlite snapshot of the basketball database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='copy the tables from azure into a snapshot file')
+    export.add_argument('--output', default=SNAPSHOT_PATH, help=f'snapshot file (default: {SNAPSHOT_PATH})')
+    export.add_argument('--with-predictions', action='store_true', help='also copy MLPredictions and MLAccuracyRollups')
+    info = commands.add_parser('info', help='rows per table in a snapshot')
+    info.add_argument('--snapshot', default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        tables = SNAPSHOT_TABLES + (LOG_TABLES if args.with_predictions else [])
+        print(f"Exporting {len(tables)} tables from azure to {args.output}...")
+        start = time.perf_counter()
+        counts = export_snapshot(azure_pool(), args.output, tables)
+        size_mb = os.path.getsize(args.output) / 1024 / 1024
+        print(f"\n✓ Exported {sum(counts.values())} rows ({size_mb:.1f} MB) in {time.perf_counter() - start:.1f}s")
+        print(f"Use it with: ML_DATA_BACKEND=snapshot ML_SNAPSHOT_PATH={args.output}")
+    else:
+        for table, rows in snapshot_info(args.snapshot).items():
+            print(f"  {table:24s} {rows}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+# db_pool.py - shared pool of reusable database connections
+import os
+import threading
+import time
+from contextlib import contextmanager
+import pyodbc #connects to database
+
+# database connection string with credentials and settings
+conn_str = (
+    'DRIVER={ODBC Driver 18 for SQL Server};'
+    'SERVER=YOUR_SERVER.database.windows.net;'
+    'DATABASE=basketball_data;'
+    'UID=YOUR_USERNAME;'
+    'PWD=YOUR_PASSWORD;'
+    'Encrypt=yes;'
+    'TrustServerCertificate=no;'
+)
+
+"""
+opening a connection to azure sql means a full login and tls handshake, which is a big part of every
+request when we do it per query. the pool keeps a few open connections around and hands them out
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        ...
+
+- at most max_size connections are open at once, extra callers wait for one to come back
+- a connection that sat idle for a while is checked with SELECT 1 before it is handed out
+- a connection that raised a database error is closed instead of going back in the pool
+- connections older than max_lifetime are replaced so azure doesn't drop them on us
+"""
+
+POOL_SIZE = 10 #most connections open at once
+CHECKOUT_TIMEOUT = 30 #seconds to wait for a free connection before giving up
+VALIDATE_AFTER = 30 #seconds idle before a connection gets checked on checkout
+MAX_LIFETIME = 1800 #seconds before a connection is closed and replaced
+
+class PoolTimeout(Exception):
+    """No connection came free within the checkout timeout"""
+
+class ConnectionPool:
+    dialect = 'mssql' #which sql the queries have to be written in, see data_access.py
+
+    def __init__(self, conn_str, max_size=POOL_SIZE, checkout_timeout=CHECKOUT_TIMEOUT,
+                 validate_after=VALIDATE_AFTER, max_lifetime=MAX_LIFETIME, connect=None):
+        self.conn_str = conn_str
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.validate_after = validate_after
+        self.max_lifetime = max_lifetime
+        self._connect = connect or (lambda: pyodbc.connect(self.conn_str))
+        self._lock = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._idle = [] #(connection, created time, last used time), most recently used last
+        self._live = 0 #connections open right now (idle + checked out)
+        self._stats = {
+            'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0,
+            'created': 0, 'closed': 0, 'validation_failures': 0, 'errors': 0
+        }
+
+    #a forked worker can't share the parent's sockets, so it starts with an empty pool of its own
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    @contextmanager
+    def connection(self):
+        conn, created = self._checkout()
+        try:
+            yield conn
+        except pyodbc.Error:
+            #database errors can leave the connection broken, so throw it away
+            with self._lock:
+                self._stats['errors'] += 1
+            self._discard(conn)
+            raise
+        except BaseException:
+            #anything else was our own code failing, undo any half done work and keep the connection
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                self._discard(conn)
+                raise
+            self._checkin(conn, created)
+            raise
+        else:
+            self._checkin(conn, created)
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        wait_start = time.monotonic()
+        with self._lock:
+            self._check_pid()
+            while True:
+                if self._idle:
+                    conn, created, last_used = self._idle.pop()
+                    break
+                if self._live < self.max_size:
+                    #reserve a slot now, open the connection outside the lock
+                    self._live += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection free after {self.checkout_timeout}s')
+                if not waited:
+                    waited = True
+                    self._stats['waits'] += 1
+                self._lock.wait(remaining)
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['wait_seconds'] += time.monotonic() - wait_start
+
+        if conn is None:
+            return self._open()
+
+        #old or dead connections are closed and replaced, keeping the slot we already hold
+        now = time.monotonic()
+        if now - created > self.max_lifetime:
+            self._close(conn)
+            return self._open()
+        if now - last_used > self.validate_after and not self._is_alive(conn):
+            with self._lock:
+                self._stats['validation_failures'] += 1
+            self._close(conn)
+            return self._open()
+        return conn, created
+
+    #opens a new connection for a slot that is already reserved
+    def _open(self):
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._lock:
+                self._live -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._stats['created'] += 1
+        return conn, time.monotonic()
+
+    def _is_alive(self, conn):
+        try:
+            conn.cursor().execute('SELECT 1').fetchone()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _checkin(self, conn, created):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._idle.append((conn, created, time.monotonic()))
+            self._lock.notify()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+        with self._lock:
+            self._stats['closed'] += 1
+
+    #closes a connection and gives its slot back
+    def _discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._live -= 1
+            self._lock.notify()
+
+    #counters for the health endpoint
+    def stats(self):
+        with self._lock:
+            self._check_pid()
+            stats = dict(self._stats)
+            stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+            stats['live'] = self._live
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._live - len(self._idle)
+            stats['max_size'] = self.max_size
+            return stats
+
+    #closes every idle connection, used on shutdown
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+#the one azure pool, the rest of the ML code gets it (or the local snapshot instead) through data_access.py
+pool = ConnectionPool(conn_str)
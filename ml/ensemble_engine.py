@@ -0,0 +1,43 @@
+# ensemble_engine.py - mean prediction and tree spread for all six forests in one pass
+import numpy as np #math operations
+
+"""
+the old way of getting the standard deviation was
+    [tree.predict(X)[0] for tree in model.estimators_]
+which runs sklearn's full predict (input checks, dataframe checks, float conversion) once per tree,
+950 times per request across the six models
+
+this module converts the input once and asks every tree for all rows at the same time, so we get a
+(trees x rows) table of predictions. the mean down each column is the forest prediction and the std
+down each column is the tree spread used for confidence, for one row or a whole slate
+"""
+
+#one (trees x rows) table of every tree's prediction for every row of X
+def tree_predictions(model, X):
+    #sklearn trees compare features as float32, so convert once here instead of once per tree
+    X32 = np.ascontiguousarray(X, dtype=np.float32)
+    #tree_ is the low level tree structure, calling it directly skips the per call input validation
+    return np.vstack([tree.tree_.predict(X32)[:, 0] for tree in model.estimators_])
+
+#mean (the forest prediction) and std (how much the trees disagree) for every row of X
+def ensemble_predict(model, X):
+    per_tree = tree_predictions(model, X)
+    return per_tree.mean(axis=0), per_tree.std(axis=0)
+
+#builds one matrix holding every feature any model needs, in a fixed column order
+#each model then just picks its columns out of it instead of rebuilding its own matrix from the dictionaries
+def build_feature_matrix(feature_rows, feature_lists):
+    columns = sorted({f for features in feature_lists.values() for f in features})
+    matrix = np.array([[features[f] for f in columns] for features in feature_rows], dtype=np.float64)
+    return matrix, {name: i for i, name in enumerate(columns)}
+
+#runs all the models on a list of feature dictionaries
+#models and feature_lists are dictionaries keyed by stat name
+#returns {stat: (means, stds)} with one value per feature row
+def predict_all(models, feature_lists, feature_rows):
+    matrix, column_index = build_feature_matrix(feature_rows, feature_lists)
+    results = {}
+    for stat, model in models.items():
+        cols = [column_index[f] for f in feature_lists[stat]]
+        results[stat] = ensemble_predict(model, matrix[:, cols])
+    return results
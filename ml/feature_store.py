@@ -0,0 +1,310 @@
+# feature_store.py - keeps the current season's aggregate tables in memory for the ML service
+import threading
+import time
+from datetime import datetime
+from name_resolver import NameResolver
+
+"""
+PlayerAggregates, PlayerVsTeam and OpponentDefensiveStats only change when the nightly
+configure.js / update-defensive-stats.js jobs run, so instead of querying them on every prediction
+the service loads them once at startup and serves lookups from dictionaries:
+
+    aggregates  PlayerApiId -> season averages row
+    matchups    PlayerApiId -> {(OpponentTeamId, Season): matchup row}
+    defense     TeamId -> defensive stats row
+    players     PlayerApiId -> {PlayerName: latest GameDate}
+    teams       TeamId -> TeamName
+    resolver    name index built from players + teams (see name_resolver.py)
+
+a background thread refreshes them every REFRESH_INTERVAL seconds, only pulling rows whose
+LastUpdated is at or after the newest one we already have (Stats rows by Id). if a table's row count no longer
+matches (rows were deleted) that table is reloaded in full
+
+lookups return rows in the same shape as the sql queries in predict_services.py, so
+build_features() works the same no matter where the rows came from
+"""
+
+CURRENT_SEASON = '2025-2026'
+MATCHUP_SEASONS = ['2022-2023', '2023-2024', '2024-2025', '2025-2026']
+REFRESH_INTERVAL = 300 #seconds between checks for new rows
+
+#a full copy of the loaded tables, swapped in as one object so readers never see half a refresh
+class FeatureSnapshot:
+    def __init__(self, aggregates, matchups, defense, players, teams, watermarks):
+        self.aggregates = aggregates
+        self.matchups = matchups
+        self.defense = defense
+        self.players = players
+        self.teams = teams
+        self.watermarks = watermarks
+        #only players with aggregates this season can be predicted, so only they go in the name index
+        self.resolver = NameResolver({pid: names for pid, names in players.items() if pid in aggregates}, teams)
+
+class FeatureStore:
+    def __init__(self, pool, season=CURRENT_SEASON, matchup_seasons=MATCHUP_SEASONS,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.pool = pool
+        self.season = season
+        self.matchup_seasons = list(matchup_seasons)
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._write_lock = threading.Lock() #only one load/refresh at a time
+        self._stop = threading.Event()
+        self._thread = None
+        self._listeners = [] #functions called after a refresh changes something
+        self.last_refresh = None
+        self.refresh_count = 0
+        self.refresh_errors = 0
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    #the name index for the current snapshot
+    @property
+    def resolver(self):
+        return self._snapshot.resolver
+
+    #lets other parts of the service (like caches) know when the data changed
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    # loading
+
+    #loads every table from scratch
+    def load(self):
+        with self._write_lock:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                watermarks = {}
+                aggregates, watermarks['aggregates'] = self._fetch_aggregates(cursor)
+                matchups, watermarks['matchups'] = self._fetch_matchups(cursor)
+                defense, watermarks['defense'] = self._fetch_defense(cursor)
+                players, watermarks['players'] = self._fetch_players(cursor)
+                teams = self._fetch_teams(cursor)
+            self._snapshot = FeatureSnapshot(aggregates, matchups, defense, players, teams, watermarks)
+            self.last_refresh = datetime.now()
+        print(f"✓ Feature store loaded: {len(aggregates)} players, {sum(len(m) for m in matchups.values())} matchup rows, {len(defense)} teams")
+
+    #pulls only rows that changed since the last load/refresh
+    #returns True if anything changed
+    def refresh(self):
+        if not self.ready:
+            self.load()
+            self._notify()
+            return True
+
+        with self._write_lock:
+            old = self._snapshot
+            watermarks = dict(old.watermarks)
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                aggregates, watermarks['aggregates'], agg_changed = self._refresh_table(
+                    cursor, old.aggregates, old.watermarks['aggregates'], self._fetch_aggregates, self._count_aggregates)
+                matchups, watermarks['matchups'], vs_changed = self._refresh_matchups(cursor, old)
+                defense, watermarks['defense'], def_changed = self._refresh_table(
+                    cursor, old.defense, old.watermarks['defense'], self._fetch_defense, self._count_defense)
+                players, watermarks['players'] = self._fetch_players(cursor, old.watermarks['players'], old.players)
+                teams = self._fetch_teams(cursor)
+
+            changed = (agg_changed or vs_changed or def_changed or teams != old.teams
+                       or watermarks['players'] != old.watermarks['players'])
+            if changed:
+                self._snapshot = FeatureSnapshot(aggregates, matchups, defense, players, teams, watermarks)
+            self.last_refresh = datetime.now()
+            self.refresh_count += 1
+
+        if changed:
+            self._notify()
+        return changed
+
+    def _notify(self):
+        for fn in self._listeners:
+            fn()
+
+    #incremental refresh for a table with one row per id
+    #returns (rows, watermark, changed)
+    def _refresh_table(self, cursor, rows, watermark, fetch, count):
+        new_rows, new_watermark = fetch(cursor, watermark)
+        added = sum(1 for key in new_rows if key not in rows)
+        if count(cursor) != len(rows) + added:
+            #rows were deleted, the only way to notice is a full reload
+            full, full_watermark = fetch(cursor)
+            return full, full_watermark, full != rows
+        #rows stamped exactly at the watermark come back every time, so only count real differences
+        if all(rows.get(key) == row for key, row in new_rows.items()):
+            return rows, new_watermark, False
+        merged = dict(rows)
+        merged.update(new_rows)
+        return merged, new_watermark, True
+
+    def _refresh_matchups(self, cursor, old):
+        new_rows, new_watermark = self._fetch_matchups(cursor, old.watermarks['matchups'])
+        added = sum(1 for pid, by_team in new_rows.items() for key in by_team if key not in old.matchups.get(pid, {}))
+        if self._count_matchups(cursor) != sum(len(m) for m in old.matchups.values()) + added:
+            full, full_watermark = self._fetch_matchups(cursor)
+            return full, full_watermark, full != old.matchups
+        if all(old.matchups.get(pid, {}).get(key) == row for pid, by_team in new_rows.items() for key, row in by_team.items()):
+            return old.matchups, new_watermark, False
+        merged = dict(old.matchups)
+        for pid, by_team in new_rows.items():
+            merged[pid] = {**merged.get(pid, {}), **by_team}
+        return merged, new_watermark, True
+
+    # queries, each returns (rows, newest LastUpdated seen)
+
+    def _fetch_aggregates(self, cursor, since=None):
+        cursor.execute(f"""
+            SELECT
+                ISNULL(AvgPoints, 0), ISNULL(AvgRebounds, 0), ISNULL(AvgAssists, 0),
+                ISNULL(AvgSteals, 0), ISNULL(AvgBlocks, 0), ISNULL(AvgTurnovers, 0),
+                ISNULL(Last5AvgPoints, 0), ISNULL(Last10AvgPoints, 0), ISNULL(GamesPlayed, 0),
+                PlayerApiId, LastUpdated
+            FROM PlayerAggregates
+            WHERE Season = ? {'AND LastUpdated >= ?' if since else ''}
+        """, *([self.season, since] if since else [self.season]))
+        rows = {}
+        watermark = since
+        for row in cursor.fetchall():
+            rows[row[9]] = tuple(row[:10])
+            watermark = max_time(watermark, row[10])
+        return rows, watermark
+
+    def _count_aggregates(self, cursor):
+        return cursor.execute("SELECT COUNT(*) FROM PlayerAggregates WHERE Season = ?", self.season).fetchone()[0]
+
+    def _fetch_matchups(self, cursor, since=None):
+        placeholders = ', '.join(['?'] * len(self.matchup_seasons))
+        cursor.execute(f"""
+            SELECT PlayerApiId, OpponentTeamId, Season, AvgPoints, AvgRebounds, AvgAssists, GamesPlayed, LastUpdated
+            FROM PlayerVsTeam
+            WHERE Season IN ({placeholders}) {'AND LastUpdated >= ?' if since else ''}
+        """, *(self.matchup_seasons + ([since] if since else [])))
+        rows = {}
+        watermark = since
+        for pid, team_id, season, pts, reb, ast, games, updated in cursor.fetchall():
+            rows.setdefault(pid, {})[(team_id, season)] = (pts, reb, ast, games)
+            watermark = max_time(watermark, updated)
+        return rows, watermark
+
+    def _count_matchups(self, cursor):
+        placeholders = ', '.join(['?'] * len(self.matchup_seasons))
+        return cursor.execute(f"SELECT COUNT(*) FROM PlayerVsTeam WHERE Season IN ({placeholders})", *self.matchup_seasons).fetchone()[0]
+
+    def _fetch_defense(self, cursor, since=None):
+        cursor.execute(f"""
+            SELECT TeamId, ISNULL(AvgPointsAllowed, 117), ISNULL(AvgReboundsAllowed, 43), LastUpdated
+            FROM OpponentDefensiveStats
+            WHERE Season = ? {'AND LastUpdated >= ?' if since else ''}
+        """, *([self.season, since] if since else [self.season]))
+        rows = {}
+        watermark = since
+        for team_id, pts_allowed, reb_allowed, updated in cursor.fetchall():
+            rows[team_id] = (pts_allowed, reb_allowed)
+            watermark = max_time(watermark, updated)
+        return rows, watermark
+
+    def _count_defense(self, cursor):
+        return cursor.execute("SELECT COUNT(*) FROM OpponentDefensiveStats WHERE Season = ?", self.season).fetchone()[0]
+
+    #player names seen in this season's box scores, Stats has no LastUpdated so we go by Id
+    def _fetch_players(self, cursor, since_id=None, existing=None):
+        cursor.execute("""
+            SELECT PlayerApiId, PlayerName, MAX(GameDate), MAX(Id)
+            FROM Stats
+            WHERE Season = ? AND Id > ?
+            GROUP BY PlayerApiId, PlayerName
+        """, self.season, since_id or 0)
+        players = {pid: dict(names) for pid, names in (existing or {}).items()}
+        watermark = since_id or 0
+        for pid, name, game_date, max_id in cursor.fetchall():
+            names = players.setdefault(pid, {})
+            names[name] = max(names.get(name) or '', game_date or '')
+            watermark = max(watermark, max_id)
+        return players, watermark
+
+    def _fetch_teams(self, cursor):
+        cursor.execute("SELECT Id, TeamName FROM Teams")
+        return {team_id: name for team_id, name in cursor.fetchall()}
+
+    # lookups
+
+    #returns (agg_row, vs_row, opp_row) for build_features, or None if the player isn't found
+    def lookup(self, player_name, opponent_team):
+        data = self._snapshot #grab one snapshot so a refresh in the middle can't mix old and new rows
+        pid = data.resolver.resolve_player(player_name)
+        if pid is None:
+            return None
+        return self.lookup_ids(pid, data.resolver.resolve_team(opponent_team), data)
+
+    #same as lookup once the player and opponent team ids are known
+    def lookup_ids(self, player_api_id, team_ids, snapshot=None):
+        data = snapshot or self._snapshot
+        agg_row = data.aggregates.get(player_api_id)
+        if agg_row is None:
+            return None
+
+        #matchup history: averages across every matching team and season, like AVG(ISNULL(..., 0)) / SUM(...)
+        player_matchups = data.matchups.get(player_api_id, {})
+        matched = [row for (team_id, season), row in player_matchups.items() if team_id in team_ids]
+        if matched:
+            vs_row = (
+                sum(row[0] or 0 for row in matched) / len(matched),
+                sum(row[1] or 0 for row in matched) / len(matched),
+                sum(row[2] or 0 for row in matched) / len(matched),
+                sum(row[3] or 0 for row in matched)
+            )
+        else:
+            vs_row = (None, None, None, None)
+
+        #defense: first matching team that has a row, like SELECT TOP 1
+        opp_row = next((data.defense[team_id] for team_id in team_ids if team_id in data.defense), None)
+        return agg_row, vs_row, opp_row
+
+    # background refresh
+
+    def start_refresh_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name='feature-store-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                start = time.perf_counter()
+                if self.refresh():
+                    print(f"✓ Feature store refreshed in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                self.refresh_errors += 1
+                print(f"Warning: Feature store refresh failed: {e}")
+
+    #counters for the health endpoint
+    def stats(self):
+        data = self._snapshot
+        if data is None:
+            return {'ready': False, 'refreshErrors': self.refresh_errors}
+        return {
+            'ready': True,
+            'season': self.season,
+            'players': len(data.aggregates),
+            'matchupRows': sum(len(m) for m in data.matchups.values()),
+            'defensiveTeams': len(data.defense),
+            'lastRefresh': self.last_refresh.isoformat() if self.last_refresh else None,
+            'refreshes': self.refresh_count,
+            'refreshErrors': self.refresh_errors
+        }
+
+#the newer of two LastUpdated values, either can be None
+def max_time(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return max(a, b)
@@ -0,0 +1,290 @@
+# forest_compiler.py - turns trained random forests into flat numpy arrays for fast prediction
+import time
+import numpy as np #math operations
+from ensemble_engine import build_feature_matrix
+
+"""
+a sklearn random forest is a list of separate tree objects, and predicting means visiting each tree
+one at a time through sklearn's generic code
+
+here every node of every tree gets copied into five shared arrays:
+    feature   - which column the node asks about
+    threshold - go left if the value is <= this
+    left      - index of the left child
+    right     - index of the right child
+    value     - the prediction if this node is a leaf
+plus roots, the index where each tree starts
+
+nodes are stored breadth first so the two children of a node are always next to each other
+(right = left + 1), which makes one step down the tree just
+    node = left[node] + (x > threshold[node])
+
+leaves point back to themselves with an infinite threshold, so walking every tree down for max_depth
+steps always ends on a leaf and all trees (and all rows) can move down one level at a time with a few
+numpy operations
+"""
+
+#how many rows to walk through the trees at once, keeps the (trees x rows) arrays a reasonable size
+ROW_CHUNK = 256
+
+#early exit (CompiledModelSet.predict_matrix_early_exit): trees per model walked in each round,
+#how much the running mean/std may still move between rounds, and the rounds always done
+EXIT_CHUNK = 50
+EXIT_TOLERANCE = 0.01
+EXIT_MIN_CHUNKS = 2
+#smaller batches always walk every tree (predict_services.run_models): each round is its own pass over the rows,
+#and below this that costs more than the skipped trees save. bench_early_exit.py fixture forests at tolerance
+#0.01: 3.7x slower than the full walk on 1 row, 1.9x on 5, 1.2x on 20, 1.1x on 50, even around 150
+EXIT_MIN_ROWS = 100
+#rows the full walk is timed on for CompiledModelSet.full_walk_ms
+WALK_COST_ROWS = 32
+
+class CompiledForest:
+    #value_scale/value_offset are set when value holds quantized leaf codes instead of the predictions
+    #(see model_compaction.py), and right can be None because walking the trees only needs left
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, value_scale=None, value_offset=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.value_scale = value_scale #one per tree
+        self.value_offset = value_offset
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    #one (trees x rows) table of every tree's prediction for every row of X
+    #trees optionally picks which trees to walk (tree numbers in order), the table then has one row per picked tree
+    def tree_predictions(self, X, trees=None):
+        #sklearn compares the float32 version of the input against float64 thresholds, do the same so results match exactly
+        X32 = np.ascontiguousarray(X, dtype=np.float32)
+        if len(X32) > ROW_CHUNK:
+            return np.hstack([self.tree_predictions(X32[i:i + ROW_CHUNK], trees) for i in range(0, len(X32), ROW_CHUNK)])
+
+        n_rows, n_cols = X32.shape
+        flat_X = X32.ravel()
+        #where each row starts in the flattened input
+        row_start = (np.arange(n_rows, dtype=np.int64) * n_cols)[np.newaxis, :]
+        roots = self.roots if trees is None else self.roots[trees]
+        #every tree starts at its root for every row
+        nodes = np.repeat(roots[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            x = flat_X.take(row_start + self.feature.take(nodes))
+            nodes = self.left.take(nodes) + (x > self.threshold.take(nodes))
+        if self.value_scale is not None:
+            #quantized leaves: code * the tree's step + the tree's smallest leaf
+            scale = self.value_scale if trees is None else self.value_scale[trees]
+            offset = self.value_offset if trees is None else self.value_offset[trees]
+            return self.value.take(nodes) * scale[:, np.newaxis] + offset[:, np.newaxis]
+        return self.value.take(nodes)
+
+    #bytes of all the arrays
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.feature, self.threshold, self.left, self.right, self.value,
+                                              self.roots, self.value_scale, self.value_offset] if array is not None)
+
+    #mean (the forest prediction) and std (how much the trees disagree) for every row of X
+    def predict(self, X):
+        per_tree = self.tree_predictions(X)
+        return per_tree.mean(axis=0), per_tree.std(axis=0)
+
+#node ids of one sklearn tree in breadth first order, with the two children of every node side by side
+def breadth_first_order(tree):
+    left, right = tree.children_left, tree.children_right
+    order = []
+    level = np.array([0])
+    while len(level):
+        order.append(level)
+        internal = level[left[level] != -1]
+        level = np.column_stack([left[internal], right[internal]]).ravel()
+    return np.concatenate(order)
+
+#copies one fitted RandomForestRegressor into a CompiledForest
+#column_map optionally renumbers the features, used when several forests share one feature matrix
+def compile_forest(model, column_map=None):
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        order = breadth_first_order(tree)
+        #new_id[old node id] = position of that node in breadth first order
+        new_id = np.empty(tree.node_count, dtype=np.int32)
+        new_id[order] = np.arange(tree.node_count, dtype=np.int32)
+
+        is_leaf = tree.children_left[order] == -1
+        feature = np.where(is_leaf, 0, tree.feature[order]).astype(np.int32)
+        if column_map is not None:
+            feature = np.asarray(column_map, dtype=np.int32)[feature]
+        left = np.where(is_leaf, np.arange(tree.node_count), new_id[tree.children_left[order]])
+        right = np.where(is_leaf, np.arange(tree.node_count), new_id[tree.children_right[order]])
+
+        features.append(feature)
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold[order]))
+        #child indices move by offset because all the trees are stored end to end
+        lefts.append(left.astype(np.int32) + offset)
+        rights.append(right.astype(np.int32) + offset)
+        values.append(tree.value[order, 0, 0])
+        roots.append(offset)
+
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        np.concatenate(features), np.concatenate(thresholds).astype(np.float64),
+        np.concatenate(lefts), np.concatenate(rights), np.concatenate(values).astype(np.float64),
+        np.array(roots, dtype=np.int32), max_depth
+    )
+
+#all six models packed into one CompiledForest that reads from one shared feature matrix
+#so a single walk down the trees scores every tree of every model
+class CompiledModelSet:
+    def __init__(self, forest, columns, tree_ranges, feature_lists):
+        self.forest = forest
+        self.columns = columns #feature name for each column of the shared matrix
+        self.tree_ranges = tree_ranges #{stat: (first tree, last tree + 1)}
+        self.feature_lists = feature_lists
+        self.walk_cost = None #(fixed ms, ms per row) of walking every tree, see full_walk_ms
+
+    #estimated ms for predict_matrix's one walk of every tree over n_rows rows. the walk takes max_depth steps
+    #whatever the values are, so the first call times it on rows of zeros (1 and WALK_COST_ROWS rows, median
+    #of 3, about 25ms for the six real sized models) and later calls reuse that
+    def full_walk_ms(self, n_rows):
+        if self.walk_cost is None:
+            def median_ms(rows):
+                X = np.zeros((rows, len(self.columns)))
+                times = []
+                for _ in range(3):
+                    start = time.perf_counter()
+                    self.forest.tree_predictions(X)
+                    times.append(time.perf_counter() - start)
+                return float(np.median(times)) * 1000
+            one, many = median_ms(1), median_ms(WALK_COST_ROWS)
+            per_row = max(many - one, 0.0) / (WALK_COST_ROWS - 1)
+            self.walk_cost = (max(one - per_row, 0.0), per_row)
+        fixed, per_row = self.walk_cost
+        return fixed + per_row * n_rows
+
+    #runs all the models on a list of feature dictionaries, returns {stat: (means, stds)}
+    def predict_all(self, feature_rows):
+        matrix, _ = build_feature_matrix(feature_rows, self.feature_lists)
+        return self.predict_matrix(matrix)
+
+    #same as predict_all but for an already built shared feature matrix
+    def predict_matrix(self, matrix):
+        per_tree = self.forest.tree_predictions(matrix)
+        results = {}
+        for stat, (start, end) in self.tree_ranges.items():
+            stat_trees = per_tree[start:end]
+            results[stat] = (stat_trees.mean(axis=0), stat_trees.std(axis=0))
+        return results
+
+    #like predict_matrix, but walks the trees chunk trees per model at a time. a row stops walking a model once
+    #another chunk moved that model's running mean and std for the row by less than tolerance (relative, values
+    #under 1 count as 1), and everything stops once budget_ms has gone by. the first round walks EXIT_MIN_CHUNKS
+    #chunks at once since those always run
+    #returns ({stat: (means, stds)}, {stat: trees used per row}, reason) where reason is 'budget' if time ran
+    #out, 'converged' if any row stopped early and 'all_trees' if none did
+    def predict_matrix_early_exit(self, matrix, chunk=EXIT_CHUNK, tolerance=EXIT_TOLERANCE, budget_ms=None):
+        deadline = None if budget_ms is None else time.perf_counter() + budget_ms / 1000
+        n_rows = len(matrix)
+        sums = {stat: np.zeros(n_rows) for stat in self.tree_ranges}
+        squares = {stat: np.zeros(n_rows) for stat in self.tree_ranges}
+        means = {stat: np.zeros(n_rows) for stat in self.tree_ranges}
+        stds = {stat: np.zeros(n_rows) for stat in self.tree_ranges}
+        used = {stat: np.zeros(n_rows, dtype=np.int64) for stat in self.tree_ranges}
+        walked = {stat: 0 for stat in self.tree_ranges} #trees walked so far by the rows still going
+        going = {stat: np.arange(n_rows) for stat, (start, end) in self.tree_ranges.items() if end > start}
+        reason = 'all_trees'
+        first_round = True
+        while going:
+            #the next chunk of every model, walked together in one pass over the rows any model still needs
+            picks = {}
+            for stat in going:
+                first = self.tree_ranges[stat][0] + walked[stat]
+                size = chunk * EXIT_MIN_CHUNKS if first_round else chunk
+                picks[stat] = np.arange(first, min(first + size, self.tree_ranges[stat][1]))
+            rows = np.unique(np.concatenate(list(going.values())))
+            per_tree = self.forest.tree_predictions(matrix[rows], np.concatenate(list(picks.values())))
+
+            tree = 0
+            for stat in list(going):
+                stat_rows = going[stat]
+                block = per_tree[tree:tree + len(picks[stat])][:, np.searchsorted(rows, stat_rows)]
+                tree += len(picks[stat])
+                if first_round:
+                    #where the rows were after the first chunk, what the rest of the round is compared against
+                    head = block[:chunk]
+                    before = (head.mean(axis=0), head.std(axis=0))
+                else:
+                    before = (means[stat][stat_rows], stds[stat][stat_rows])
+                sums[stat][stat_rows] += block.sum(axis=0)
+                squares[stat][stat_rows] += (block * block).sum(axis=0)
+                walked[stat] += len(block)
+                used[stat][stat_rows] = walked[stat]
+                mean = sums[stat][stat_rows] / walked[stat]
+                std = np.sqrt(np.maximum(squares[stat][stat_rows] / walked[stat] - mean * mean, 0.0))
+                means[stat][stat_rows] = mean
+                stds[stat][stat_rows] = std
+
+                if walked[stat] == self.tree_ranges[stat][1] - self.tree_ranges[stat][0]:
+                    del going[stat]
+                    continue
+                settled = ((np.abs(mean - before[0]) <= tolerance * np.maximum(np.abs(mean), 1.0)) &
+                           (np.abs(std - before[1]) <= tolerance * np.maximum(std, 1.0)))
+                if settled.any():
+                    reason = 'converged'
+                    if settled.all():
+                        del going[stat]
+                    else:
+                        going[stat] = stat_rows[~settled]
+            first_round = False
+            if going and deadline is not None and time.perf_counter() >= deadline:
+                reason = 'budget'
+                break
+        return {stat: (means[stat], stds[stat]) for stat in self.tree_ranges}, used, reason
+
+#compiles every model and joins them end to end into one CompiledModelSet
+def compile_models(models, feature_lists):
+    _, column_index = build_feature_matrix([], feature_lists)
+    columns = sorted(column_index, key=column_index.get)
+    forests = {}
+    for stat, model in models.items():
+        forests[stat] = compile_forest(model, [column_index[f] for f in feature_lists[stat]])
+
+    parts = {name: [] for name in ['feature', 'threshold', 'left', 'right', 'value', 'roots']}
+    tree_ranges = {}
+    node_offset = 0
+    tree_offset = 0
+    for stat, forest in forests.items():
+        parts['feature'].append(forest.feature)
+        parts['threshold'].append(forest.threshold)
+        parts['left'].append(forest.left + node_offset)
+        parts['right'].append(forest.right + node_offset)
+        parts['value'].append(forest.value)
+        parts['roots'].append(forest.roots + node_offset)
+        tree_ranges[stat] = (tree_offset, tree_offset + forest.n_trees)
+        node_offset += forest.n_nodes
+        tree_offset += forest.n_trees
+
+    combined = CompiledForest(
+        *[np.concatenate(parts[name]) for name in ['feature', 'threshold', 'left', 'right', 'value', 'roots']],
+        max(forest.max_depth for forest in forests.values())
+    )
+    return CompiledModelSet(combined, columns, tree_ranges, feature_lists)
+
+#checks a compiled forest gives exactly the same per-tree predictions as sklearn
+#returns the largest difference found (0.0 when they match)
+def check_parity(model, compiled, X):
+    X32 = np.ascontiguousarray(X, dtype=np.float32)
+    expected = np.vstack([tree.tree_.predict(X32)[:, 0] for tree in model.estimators_])
+    return float(np.max(np.abs(expected - compiled.tree_predictions(X32))))
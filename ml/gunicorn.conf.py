@@ -0,0 +1,63 @@
+# gunicorn.conf.py - production settings for the ML service
+# usage (from the ml folder): gunicorn -c gunicorn.conf.py
+# settings can be changed with environment variables, e.g. ML_WORKERS=8 ML_THREADS=2 gunicorn -c gunicorn.conf.py
+import gc
+import os
+import threading
+import time
+
+"""
+app.run() is flask's development server: one process, and with debug=True the reloader loads every
+model a second time. here gunicorn loads predict_services once in the master process (preload_app),
+then forks the workers. the models, the memory mapped bundle and the feature store are already in
+memory when the fork happens, so every worker shares those pages copy-on-write instead of loading
+its own copy
+
+- workers: separate processes, so predictions use more than one core
+- threads: requests handled at once inside each worker (waiting on the database doesn't block the worker)
+- SIGTERM stops accepting requests, lets running ones finish within graceful_timeout, then each worker
+  writes out its queued prediction logs and closes its database connections
+"""
+
+wsgi_app = 'predict_services:app'
+bind = os.environ.get('ML_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('ML_WORKERS', max(2, min(os.cpu_count() or 1, 8))))
+threads = int(os.environ.get('ML_THREADS', 4))
+worker_class = 'gthread'
+preload_app = True #load the models once in the master, the workers share them
+timeout = int(os.environ.get('ML_TIMEOUT', 60)) #a worker stuck this long gets restarted
+graceful_timeout = int(os.environ.get('ML_GRACEFUL_TIMEOUT', 30)) #time running requests get on shutdown
+max_requests = int(os.environ.get('ML_MAX_REQUESTS', 0)) #restart workers after this many requests (0 = never)
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('ML_ACCESS_LOG', '-')
+
+MEMORY_LOG_INTERVAL = int(os.environ.get('ML_MEMORY_LOG_INTERVAL', 300)) #seconds between worker memory reports (0 = off)
+
+def when_ready(server):
+    server.log.info(f"ML service ready: {workers} workers x {threads} threads on {bind}")
+    if MEMORY_LOG_INTERVAL > 0:
+        threading.Thread(target=log_worker_memory, args=(server,), name='worker-memory', daemon=True).start()
+
+#the preloaded objects never get freed, moving them out of the garbage collector's view stops
+#its bookkeeping from writing to (and so copying) the shared pages in every worker
+def pre_fork(server, worker):
+    gc.freeze()
+
+def post_fork(server, worker):
+    import predict_services
+    predict_services.start_background()
+
+def worker_exit(server, worker):
+    import predict_services
+    predict_services.shutdown()
+
+#rss and the shared/private split of every worker, written to the gunicorn log
+def log_worker_memory(server):
+    from process_memory import process_memory
+    while True:
+        time.sleep(MEMORY_LOG_INTERVAL)
+        for pid in list(server.WORKERS):
+            memory = process_memory(pid)
+            if memory:
+                details = ', '.join(f'{key} {value}' for key, value in memory.items())
+                server.log.info(f"worker {pid} memory: {details}")
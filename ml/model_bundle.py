@@ -0,0 +1,118 @@
+# model_bundle.py - saves the compiled models as one file that can be memory mapped
+import hashlib
+import json #manifest
+import os
+from datetime import datetime
+import numpy as np #math operations
+from forest_compiler import CompiledForest, CompiledModelSet
+
+"""
+the pickles store every tree as a separate python object, so each start up (and each server process)
+has to rebuild all of them and then compile them into flat arrays again
+
+the compiled arrays (see forest_compiler.py) are all the server needs to predict, so they're written
+straight to one raw file:
+    models.bin            - feature, threshold, left, right, value and roots back to back (a compacted
+                            forest has no right but adds value_scale and value_offset, see model_compaction.py)
+    models.manifest.json  - where each array starts, its dtype and shape, the feature lists,
+                            training stats and a sha256 of models.bin
+
+loading is np.memmap on models.bin, read only. nothing is parsed or copied, pages are read from disk the
+first time they're used, and every process that maps the same file shares the same pages in memory
+"""
+
+BUNDLE_FILE = 'models.bin'
+MANIFEST_FILE = 'models.manifest.json'
+BUNDLE_FORMAT = 2 #bump when the layout changes
+READABLE_FORMATS = [1, 2] #2 added the compacted arrays, a format 1 bundle still loads the same way
+ARRAY_NAMES = ['feature', 'threshold', 'left', 'right', 'value', 'roots', 'value_scale', 'value_offset']
+OPTIONAL_ARRAYS = ['right', 'value_scale', 'value_offset'] #can be None, then they're left out of the file
+ALIGN = 64 #each array starts on a 64 byte boundary
+
+class BundleError(Exception):
+    """The bundle files are missing, from a different format or don't match their hash"""
+
+def bundle_exists(directory):
+    return os.path.exists(os.path.join(directory, MANIFEST_FILE)) and os.path.exists(os.path.join(directory, BUNDLE_FILE))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+#writes a CompiledModelSet to directory, returns the manifest
+#the .bin is written first and the manifest last (both through a temp file + os.replace),
+#so a reader never finds a manifest pointing at a half written file
+def save_bundle(compiled, directory='.', version=None, training_stats=None):
+    forest = compiled.forest
+    arrays = {}
+    bin_tmp = os.path.join(directory, BUNDLE_FILE + '.tmp')
+    offset = 0
+    with open(bin_tmp, 'wb') as f:
+        for name in ARRAY_NAMES:
+            if getattr(forest, name) is None:
+                continue
+            array = np.ascontiguousarray(getattr(forest, name))
+            padding = -offset % ALIGN
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(array.tobytes())
+            arrays[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            offset += array.nbytes
+    os.replace(bin_tmp, os.path.join(directory, BUNDLE_FILE))
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'version': version or datetime.now().strftime('%Y%m%d%H%M%S'),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'sha256': file_sha256(os.path.join(directory, BUNDLE_FILE)),
+        'bytes': offset,
+        'max_depth': int(forest.max_depth),
+        'arrays': arrays,
+        'columns': list(compiled.columns),
+        'tree_ranges': {stat: list(r) for stat, r in compiled.tree_ranges.items()},
+        'feature_lists': compiled.feature_lists,
+        'training_stats': training_stats or {}
+    }
+    manifest_tmp = os.path.join(directory, MANIFEST_FILE + '.tmp')
+    with open(manifest_tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_tmp, os.path.join(directory, MANIFEST_FILE))
+    return manifest
+
+def read_manifest(directory='.'):
+    with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') not in READABLE_FORMATS:
+        raise BundleError(f"Bundle format {manifest.get('format')} is not supported (expected one of {READABLE_FORMATS})")
+    return manifest
+
+#maps a saved bundle back into a CompiledModelSet without copying the arrays
+#verify=True re-hashes models.bin first, which reads the whole file, used after a retrain
+def load_bundle(directory='.', verify=False):
+    manifest = read_manifest(directory)
+    path = os.path.join(directory, BUNDLE_FILE)
+    if os.path.getsize(path) != manifest['bytes']:
+        raise BundleError(f'{path} is {os.path.getsize(path)} bytes, manifest says {manifest["bytes"]}')
+    if verify and file_sha256(path) != manifest['sha256']:
+        raise BundleError(f'{path} does not match the sha256 in its manifest')
+
+    raw = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name in ARRAY_NAMES:
+        spec = manifest['arrays'].get(name)
+        if spec is None:
+            if name not in OPTIONAL_ARRAYS:
+                raise BundleError(f'{MANIFEST_FILE} has no {name} array')
+            arrays[name] = None
+            continue
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        arrays[name] = raw[spec['offset']:spec['offset'] + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+
+    forest = CompiledForest(max_depth=manifest['max_depth'], **arrays)
+    tree_ranges = {stat: tuple(r) for stat, r in manifest['tree_ranges'].items()}
+    compiled = CompiledModelSet(forest, manifest['columns'], tree_ranges, manifest['feature_lists'])
+    return compiled, manifest
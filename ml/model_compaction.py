@@ -0,0 +1,276 @@
+# model_compaction.py - shrinks the compiled models after training: float32 thresholds, quantized leaves, optional pruning
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np #math operations
+from sklearn.metrics import mean_absolute_error, r2_score #measurement of how good the model is
+from forest_compiler import CompiledForest, CompiledModelSet
+from model_bundle import load_bundle, save_bundle
+
+"""
+the compiled bundle stores every node as int32 feature + float64 threshold + int32 left + int32 right +
+float64 value, 28 bytes a node. compacting cuts that to 11 bytes:
+    feature   - uint8, there are fewer than 256 columns
+    threshold - float32, rounded down to the nearest float32. the input is compared as float32 anyway
+                (same as sklearn), and no float32 fits between the rounded down threshold and the real
+                one, so every row still goes down exactly the same branches
+    left      - int32, unchanged
+    right     - dropped, it's always left + 1 and walking the trees never reads it
+    value     - uint16 codes, value = code * value_scale + value_offset with one scale/offset per tree.
+                a points tree with leaves between 0 and 60 gets steps of 0.001 points
+smaller arrays mean less memory per worker and fewer cache misses while walking the trees
+
+with prune=True trees are also dropped one at a time from each model, but only while dropping one makes
+the held out MAE better by at least PRUNE_MARGIN (at most half of a model's trees go). with no margin some
+tree's removal almost always helps the rows that picked it by a hair, and the search ran down to the
+floor every time. 0.0001 still lets a few dozen trees go from most models on 40K rows, 0.001 stops
+the search at the first step. half the held out rows pick the trees, the other half (the check rows) are used to
+grade the result: a model whose check MAE gets worse by more than CHECK_MAE_TOLERANCE, or whose mean
+spread of the trees moves by more than CHECK_STD_TOLERANCE (that spread is the uncertainty
+calculate_confidence turns into confidence scores), keeps all of its trees. the report lists those
+
+the report has bytes, resident memory of a fresh process that loaded the bundle and walked every tree,
+latency of a 150 row batch and MAE/R² for each stat, before and after
+"""
+
+LEAF_BITS = 16
+PRUNE_MARGIN = 0.0001 #a tree is only dropped if that makes the MAE on the choosing rows better by this fraction
+CHECK_MAE_TOLERANCE = 0.0005 #fraction the check rows' MAE may get worse before a model's pruning is undone
+CHECK_STD_TOLERANCE = 0.02 #fraction the check rows' mean uncertainty may move before a model's pruning is undone
+MIN_KEEP = 0.5 #pruning keeps at least this share of each model's trees
+LATENCY_ROWS = 150 #a typical slate
+LATENCY_REPEATS = 50
+
+def add_compaction_args(parser):
+    parser.add_argument('--compact', action='store_true', help='store the bundle with float32 thresholds and quantized leaves')
+    parser.add_argument('--prune', action='store_true', help='with --compact, also drop trees that don\'t help the held out MAE')
+    return parser
+
+#the largest float32 that is <= each value
+def floor_float32(values):
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    up = rounded.astype(np.float64) > values
+    rounded[up] = np.nextafter(rounded[up], np.float32(-np.inf))
+    return rounded
+
+#each tree's leaves as codes of LEAF_BITS bits, returns (codes, scale per tree, offset per tree)
+def quantize_leaves(value, roots, bits=LEAF_BITS):
+    sizes = np.diff(np.append(roots, len(value)))
+    low = np.minimum.reduceat(value, roots)
+    high = np.maximum.reduceat(value, roots)
+    scale = (high - low) / (2 ** bits - 1)
+    step = np.where(scale > 0, scale, 1.0) #a tree with one leaf value gets code 0 everywhere
+    tree = np.repeat(np.arange(len(roots)), sizes)
+    codes = np.rint((value - low[tree]) / step[tree]).astype(np.uint16 if bits <= 16 else np.uint32)
+    return codes, scale, low
+
+#a compacted copy of a plain CompiledForest
+def compact_forest(forest, bits=LEAF_BITS):
+    codes, scale, offset = quantize_leaves(np.asarray(forest.value, dtype=np.float64), np.asarray(forest.roots), bits)
+    feature_type = np.uint8 if forest.feature.max() < 256 else np.uint16
+    return CompiledForest(
+        np.asarray(forest.feature).astype(feature_type), floor_float32(forest.threshold),
+        np.asarray(forest.left, dtype=np.int32), None, codes, np.asarray(forest.roots, dtype=np.int32),
+        forest.max_depth, value_scale=scale, value_offset=offset
+    )
+
+#a plain CompiledModelSet with only the trees in keep ({stat: tree numbers within that model})
+def select_trees(compiled, keep):
+    forest = compiled.forest
+    ends = np.append(forest.roots[1:], forest.n_nodes)
+    parts = {name: [] for name in ['feature', 'threshold', 'left', 'right', 'value']}
+    roots = []
+    tree_ranges = {}
+    offset = 0
+    for stat, (start, _) in compiled.tree_ranges.items():
+        tree_ranges[stat] = (len(roots), len(roots) + len(keep[stat]))
+        for tree in sorted(keep[stat]):
+            first, last = int(forest.roots[start + tree]), int(ends[start + tree])
+            for name in ['feature', 'threshold', 'value']:
+                parts[name].append(getattr(forest, name)[first:last])
+            #child indices point into the whole array, move them to where this tree ends up
+            parts['left'].append(forest.left[first:last] - first + offset)
+            parts['right'].append(forest.right[first:last] - first + offset)
+            roots.append(offset)
+            offset += last - first
+    selected = CompiledForest(*[np.concatenate(parts[name]) for name in ['feature', 'threshold', 'left', 'right', 'value']],
+                              np.array(roots, dtype=np.int32), forest.max_depth)
+    return CompiledModelSet(selected, compiled.columns, tree_ranges, compiled.feature_lists)
+
+#greedy backward pruning of one model, per_tree is (trees x rows) of its tree predictions on held out rows
+#a tree goes only if the model without it beats the current MAE by margin. returns the tree numbers to keep
+def prune_trees(per_tree, y, margin=PRUNE_MARGIN, min_keep=MIN_KEEP):
+    keep = list(range(len(per_tree)))
+    total = per_tree.sum(axis=0)
+    current = mean_absolute_error(y, total / len(keep))
+    floor = max(1, int(np.ceil(len(keep) * min_keep)))
+    while len(keep) > floor:
+        #held out MAE of the model without each of its remaining trees, all at once
+        without = (total[np.newaxis, :] - per_tree[keep]) / (len(keep) - 1)
+        maes = np.abs(without - y[np.newaxis, :]).mean(axis=1)
+        best = int(np.argmin(maes))
+        if maes[best] > current * (1 - margin):
+            break
+        current = maes[best]
+        total -= per_tree[keep[best]]
+        keep.pop(best)
+    return keep
+
+#stats whose pruned model did worse on the check rows than the full one, with why
+def pruning_regressions(full, pruned, mae_tolerance=CHECK_MAE_TOLERANCE, std_tolerance=CHECK_STD_TOLERANCE):
+    reverted = {}
+    for stat in full:
+        reasons = []
+        if pruned[stat]['mae'] > full[stat]['mae'] * (1 + mae_tolerance):
+            reasons.append(f"check mae {full[stat]['mae']:.4f} -> {pruned[stat]['mae']:.4f}")
+        if abs(pruned[stat]['mean_std'] - full[stat]['mean_std']) > full[stat]['mean_std'] * std_tolerance:
+            reasons.append(f"mean std {full[stat]['mean_std']:.4f} -> {pruned[stat]['mean_std']:.4f}")
+        if reasons:
+            reverted[stat] = ', '.join(reasons)
+    return reverted
+
+#mae, r2 and mean uncertainty of every model on its held out rows, holdout is {stat: (X, y)}
+def score_models(compiled, holdout):
+    scores = {}
+    for stat, (X, y) in holdout.items():
+        means, stds = compiled.predict_matrix(X)[stat]
+        scores[stat] = {'mae': float(mean_absolute_error(y, means)), 'r2': float(r2_score(y, means)), 'mean_std': float(stds.mean())}
+    return scores
+
+#median milliseconds for all six models on one batch of rows
+def measure_latency(compiled, X, repeats=LATENCY_REPEATS):
+    compiled.predict_matrix(X) #first call pages the arrays in
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        compiled.predict_matrix(X)
+        times.append(time.perf_counter() - start)
+    return round(float(np.median(times)) * 1000, 3)
+
+#runs inside a fresh process: memory before and after mapping the bundle and walking every tree
+CHILD = r'''
+import json, sys
+sys.path.insert(0, {here!r})
+import numpy as np
+from model_bundle import load_bundle
+from process_memory import process_memory
+before = process_memory()
+compiled, _ = load_bundle({directory!r})
+compiled.predict_matrix(np.random.default_rng(0).random((2000, len(compiled.columns))) * 30)
+print(json.dumps({{'before': before, 'after': process_memory()}}))
+'''
+
+#resident MB the bundle in directory adds to a process once every tree has been walked, None without /proc
+def measure_rss(directory):
+    code = CHILD.format(here=os.path.dirname(os.path.abspath(__file__)), directory=os.path.abspath(directory))
+    try:
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, timeout=300)
+        memory = json.loads(result.stdout.strip().splitlines()[-1])
+    except (subprocess.SubprocessError, ValueError, IndexError) as e:
+        print(f"Warning: could not measure bundle memory: {e}")
+        return None
+    if 'rssMb' not in memory['after'] or 'rssMb' not in memory['before']:
+        return None
+    return round(memory['after']['rssMb'] - memory['before']['rssMb'], 1)
+
+#compacts (and with prune=True prunes) a plain CompiledModelSet, returns (compacted set, report)
+#holdout is {stat: (X in the shared column order, y)}
+def compact_models(compiled, holdout, prune=False, bits=LEAF_BITS, margin=PRUNE_MARGIN):
+    #even rows choose the trees to prune, odd rows are scored
+    choose = {stat: (X[0::2], y[0::2]) for stat, (X, y) in holdout.items()}
+    check = {stat: (X[1::2], y[1::2]) for stat, (X, y) in holdout.items()}
+
+    kept = compiled
+    reverted = {}
+    if prune:
+        keep = {}
+        for stat, (X, y) in choose.items():
+            start, end = compiled.tree_ranges[stat]
+            per_tree = compiled.forest.tree_predictions(X)[start:end]
+            keep[stat] = prune_trees(per_tree, y, margin)
+        #graded on the rows that didn't pick the trees, a model that got worse there keeps everything
+        reverted = pruning_regressions(score_models(compiled, check), score_models(select_trees(compiled, keep), check))
+        for stat in reverted:
+            start, end = compiled.tree_ranges[stat]
+            keep[stat] = list(range(end - start))
+        kept = select_trees(compiled, keep)
+    compact = CompiledModelSet(compact_forest(kept.forest, bits), compiled.columns, kept.tree_ranges, compiled.feature_lists)
+
+    before = score_models(compiled, check)
+    after = score_models(compact, check)
+    batch = next(iter(holdout.values()))[0][:LATENCY_ROWS]
+    report = {
+        'leaf_bits': bits,
+        'pruned': prune,
+        'pruning_reverted': reverted, #{stat: why} for models that kept all their trees
+        'bytes': {'before': int(compiled.forest.nbytes), 'after': int(compact.forest.nbytes)},
+        'nodes': {'before': int(compiled.forest.n_nodes), 'after': int(compact.forest.n_nodes)},
+        'latency_ms': {'before': measure_latency(compiled, batch), 'after': measure_latency(compact, batch), 'rows': len(batch)},
+        'stats': {stat: {
+            'trees_before': compiled.tree_ranges[stat][1] - compiled.tree_ranges[stat][0],
+            'trees_after': compact.tree_ranges[stat][1] - compact.tree_ranges[stat][0],
+            'mae_before': before[stat]['mae'], 'mae_after': after[stat]['mae'],
+            'mae_delta': after[stat]['mae'] - before[stat]['mae'],
+            'r2_before': before[stat]['r2'], 'r2_after': after[stat]['r2'],
+            'r2_delta': after[stat]['r2'] - before[stat]['r2'],
+            'std_delta': after[stat]['mean_std'] - before[stat]['mean_std'],
+            'rows': len(check[stat][1])
+        } for stat in holdout}
+    }
+    return compact, report
+
+#held out rows of every model from a prepared training frame, the same 20% train_all scored them on
+def holdout_from_frame(df, stats):
+    from train_parallel import build_training_arrays, split_rows
+    X, _, targets = build_training_arrays(df)
+    splits = split_rows(df)
+    holdout = {}
+    for i, stat in enumerate(stats):
+        rows = splits[stat][1]
+        y = targets[rows, i]
+        known = ~np.isnan(y) #rows without the stat filled in can't be scored
+        holdout[stat] = (X[rows][known].astype(np.float64), y[known])
+    return holdout
+
+#replaces the bundle in directory (written by save_models) with a compacted one, same version
+#returns the report, which is also stored in the manifest's training_stats
+def compact_saved_models(df, directory='.', prune=False):
+    from train_model import STATS
+    compiled, manifest = load_bundle(directory)
+    if compiled.forest.value_scale is not None:
+        raise ValueError(f"the bundle in {directory} is already compacted")
+    compact, report = compact_models(compiled, holdout_from_frame(df, STATS), prune=prune)
+
+    #memory is measured on a scratch copy first so the manifest can hold the numbers
+    with tempfile.TemporaryDirectory() as scratch:
+        saved = save_bundle(compact, scratch)
+        report['file_bytes'] = {'before': manifest['bytes'], 'after': saved['bytes']}
+        report['rss_mb'] = {'before': measure_rss(directory), 'after': measure_rss(scratch)}
+
+    training_stats = dict(manifest.get('training_stats') or {})
+    training_stats['compaction'] = report
+    save_bundle(compact, directory, version=manifest['version'], training_stats=training_stats)
+    return report
+
+def print_compaction_report(report):
+    def change(key, unit, digits=1):
+        before, after = report[key]['before'], report[key]['after']
+        if before is None or after is None:
+            return f"{key:12s} n/a"
+        percent = f" ({(after / before - 1) * 100:+.0f}%)" if before else ''
+        return f"{key:12s} {before:,.{digits}f} -> {after:,.{digits}f} {unit}{percent}"
+
+    print(f"\nCompaction ({report['leaf_bits']} bit leaves{', pruned' if report['pruned'] else ''})")
+    print('  ' + change('file_bytes', 'bytes', 0))
+    print('  ' + change('rss_mb', 'MB'))
+    print('  ' + change('latency_ms', f"ms per {report['latency_ms']['rows']} rows", 3))
+    print(f"  {'stat':10s} {'trees':>9s} {'mae before':>11s} {'mae delta':>10s} {'r² delta':>9s} {'std delta':>10s}")
+    for stat, s in report['stats'].items():
+        trees = f"{s['trees_before']}->{s['trees_after']}" if s['trees_after'] != s['trees_before'] else str(s['trees_after'])
+        print(f"  {stat:10s} {trees:>9s} {s['mae_before']:11.4f} {s['mae_delta']:+10.4f} {s['r2_delta']:+9.4f} {s['std_delta']:+10.4f}")
+    for stat, why in report.get('pruning_reverted', {}).items():
+        print(f"  {stat}: pruning undone, all trees kept ({why})")
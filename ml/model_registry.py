@@ -0,0 +1,356 @@
+# model_registry.py - holds the live set of models and retrains them in the background
+import json #reads metadata
+import os
+import pickle #loads saved models
+import shutil
+import subprocess #runs train_model.py
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+try:
+    import fcntl #file locks, only on linux/mac
+except ImportError:
+    fcntl = None
+from forest_compiler import compile_models
+import model_bundle
+
+"""
+the six models, their feature lists and the compiled arrays are kept together in one ModelBundle.
+the server only ever reads registry.current, and swapping in a new bundle is one reference assignment,
+so a request either sees the old six models or the new six, never a mix
+
+retraining runs train_model.py in a background thread, inside its own folder under model_versions/.
+the live .pkl files are only touched once the new bundle has loaded and compiled without errors.
+every version stays in model_versions/ so rollback() can go back to the previous one, on disk too.
+no bundle is kept pointing at the live folder: the models found there at startup, and every version
+another process promotes, are copied to model_versions/<version> first and loaded from the copy. that
+way rollback always has files to write back over the live ones, and the other processes' watch threads
+see the rolled back version on disk instead of swapping the newer one back in
+
+when several server processes run (see gunicorn.conf.py) only one of them runs the retrain. the others
+notice the new files through start_watch_thread() and load them too, a file lock keeps two processes
+from retraining at the same time and job status is saved next to the job so any process can report it
+"""
+
+STATS = ['points', 'rebounds', 'assists', 'steals', 'blocks', 'turnovers']
+#the manifest goes last so it never points at a models.bin that hasn't been copied yet
+#training_profile.json is the stage timings of the run that made the models (training_profile.py)
+MODEL_FILES = [f'{stat}_model.pkl' for stat in STATS] + ['model_metadata.json', 'training_profile.json',
+                                                         model_bundle.BUNDLE_FILE, model_bundle.MANIFEST_FILE]
+
+MODEL_DIR = os.environ.get('ML_MODEL_DIR', '.') #where the server loads the live models from
+VERSIONS_DIR = os.path.join(MODEL_DIR, 'model_versions') #one folder per trained version
+RETRAIN_TIMEOUT = 1800 #seconds before a retrain job is killed
+KEEP_BUNDLES = 3 #versions kept in memory for rollback
+KEEP_JOBS = 20 #finished jobs remembered for the status endpoint
+WATCH_INTERVAL = 15 #seconds between checks for models swapped by another process
+RETRAIN_MODES = ['full', 'incremental'] #see train_incremental.py
+
+class ModelBundle:
+    def __init__(self, version, models, features, compiled, metadata, directory):
+        self.version = version
+        self.models = models #{stat: RandomForestRegressor}, None when loaded from the mapped bundle
+        self.features = features #{stat: feature list}
+        self.compiled = compiled #CompiledModelSet used for predictions
+        self.metadata = metadata
+        self.directory = directory #folder the files were loaded from
+        self.loaded_at = datetime.now()
+
+    def info(self):
+        return {
+            'version': self.version,
+            'loadedAt': self.loaded_at.isoformat(timespec='seconds'),
+            'source': 'mmap' if self.models is None else 'pickle',
+            'trees': {stat: end - start for stat, (start, end) in self.compiled.tree_ranges.items()}
+        }
+
+#loads all six models from one folder
+#uses the memory mapped bundle when there is one, otherwise unpickles and compiles the six models
+def load_bundle(directory=MODEL_DIR, verify=False):
+    if model_bundle.bundle_exists(directory):
+        compiled, manifest = model_bundle.load_bundle(directory, verify=verify)
+        return ModelBundle(manifest['version'], None, compiled.feature_lists, compiled, manifest, directory)
+
+    models = {}
+    for stat in STATS:
+        with open(os.path.join(directory, f'{stat}_model.pkl'), 'rb') as f:
+            models[stat] = pickle.load(f)
+    with open(os.path.join(directory, 'model_metadata.json'), 'r') as f:
+        metadata = json.load(f)
+    features = {stat: metadata[f'{stat}_features'] for stat in STATS}
+    version = metadata.get('version', 'unversioned') #older metadata files don't have a version
+    return ModelBundle(version, models, features, compile_models(models, features), metadata, directory)
+
+#version of the files in a folder without loading them, None if there aren't any
+def read_version(directory=MODEL_DIR):
+    for name in [model_bundle.MANIFEST_FILE, 'model_metadata.json']:
+        try:
+            with open(os.path.join(directory, name), 'r') as f:
+                return json.load(f).get('version', 'unversioned')
+        except (OSError, ValueError):
+            continue
+    return None
+
+#the feature source ('aggregates' or 'point_in_time', see train_model.py) the models in a folder were trained with
+def read_feature_source(directory):
+    try:
+        with open(os.path.join(directory, 'model_metadata.json'), 'r') as f:
+            return json.load(f).get('features', 'aggregates')
+    except (OSError, ValueError):
+        return 'aggregates'
+
+#copies a folder of model files over the live ones, one file at a time with os.replace so a
+#crash halfway never leaves a half written file behind
+#os.replace gives models.bin a new inode, so processes still mapping the old one keep reading it safely
+def promote_files(source, target=MODEL_DIR):
+    #a version saved without the mapped bundle must not be shadowed by an older bundle left behind
+    for name in reversed(MODEL_FILES):
+        if not os.path.exists(os.path.join(source, name)) and os.path.exists(os.path.join(target, name)):
+            os.remove(os.path.join(target, name))
+    for name in MODEL_FILES:
+        if not os.path.exists(os.path.join(source, name)):
+            continue
+        tmp = os.path.join(target, name + '.tmp')
+        shutil.copyfile(os.path.join(source, name), tmp)
+        os.replace(tmp, os.path.join(target, name))
+
+#copies the live files to model_versions/<version> (once per version, any process can do it)
+#returns the folder, or None if the live files changed to another version while they were copied
+def archive_live_files(version, model_dir=MODEL_DIR, versions_dir=VERSIONS_DIR):
+    archive = os.path.join(versions_dir, version)
+    if read_version(archive) == version:
+        return archive
+    #copied to a temp folder and renamed, so another process never loads a half copied archive
+    tmp = os.path.join(versions_dir, f'.{version}-{uuid.uuid4().hex[:6]}.tmp')
+    os.makedirs(tmp)
+    for name in MODEL_FILES:
+        if os.path.exists(os.path.join(model_dir, name)):
+            shutil.copyfile(os.path.join(model_dir, name), os.path.join(tmp, name))
+    if read_version(tmp) != version:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return None
+    try:
+        os.rename(tmp, archive)
+    except OSError: #another process archived it first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return archive if read_version(archive) == version else None
+
+class ModelRegistry:
+    def __init__(self, bundle, model_dir=MODEL_DIR, versions_dir=VERSIONS_DIR):
+        self.model_dir = model_dir
+        self.versions_dir = versions_dir
+        self._pin_to_archive(bundle)
+        self.current = bundle
+        self._previous = [] #older bundles, newest last
+        self._listeners = [] #functions called after every swap
+        self._jobs = {}
+        self._job_order = []
+        self._running_job = None
+        self._lock_file = None #held while this process is retraining
+        self._watch_thread = None
+        self._watch_stop = threading.Event()
+        self._lock = threading.Lock()
+
+    #fn(bundle) is called after a new bundle goes live
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    #makes bundle the live one
+    def swap(self, bundle):
+        with self._lock:
+            old = self.current
+            self.current = bundle #the one assignment requests see
+            if old is not None:
+                self._previous = (self._previous + [old])[-KEEP_BUNDLES:]
+        self._notify(bundle)
+        return old
+
+    #goes back to the version before the current one, returns the restored bundle or None
+    def rollback(self):
+        with self._lock:
+            if not self._previous:
+                return None
+            bundle = self._previous.pop()
+            self.current = bundle
+        #restore the files too so a restart (and every other worker, through its watch thread) comes back on the same version
+        if os.path.abspath(bundle.directory) != os.path.abspath(self.model_dir):
+            promote_files(bundle.directory, self.model_dir)
+        else:
+            print(f"Warning: models {bundle.version} have no archived copy, only this process rolled back")
+        self._notify(bundle)
+        return bundle
+
+    def _notify(self, bundle):
+        for fn in self._listeners:
+            try:
+                fn(bundle)
+            except Exception as e:
+                print(f"Warning: model swap listener failed: {e}")
+
+    #starts a retrain job, returns (job, started), started is False if a job was already running
+    #mode 'incremental' grows the live models on the newest games instead of retraining from scratch
+    def start_retrain(self, mode='full'):
+        if mode not in RETRAIN_MODES:
+            raise ValueError(f"Unknown retrain mode {mode}, expected one of {', '.join(RETRAIN_MODES)}")
+        with self._lock:
+            if self._running_job is not None:
+                return self._jobs[self._running_job], False
+            job_id = datetime.now().strftime('%Y%m%d%H%M%S') + '-' + uuid.uuid4().hex[:6]
+            job = {
+                'jobId': job_id, 'mode': mode, 'status': 'queued', 'createdAt': datetime.now().isoformat(timespec='seconds'),
+                'startedAt': None, 'finishedAt': None, 'seconds': None, 'version': None, 'error': None
+            }
+            #another server process may already be retraining
+            if not self._acquire_retrain_lock():
+                return {'jobId': None, 'status': 'running', 'error': 'A retrain is running in another server process'}, False
+            self._jobs[job_id] = job
+            self._job_order.append(job_id)
+            self._running_job = job_id
+            #forget the oldest finished jobs
+            while len(self._job_order) > KEEP_JOBS:
+                del self._jobs[self._job_order.pop(0)]
+        self._save_job(job)
+        threading.Thread(target=self._run_retrain, args=(job_id, mode), name=f'retrain-{job_id}', daemon=True).start()
+        return dict(job), True
+
+    #job status by id, jobs started by other server processes are read from their job.json
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if os.path.basename(job_id) != job_id: #only plain ids, no paths
+            return None
+        try:
+            with open(os.path.join(self.versions_dir, job_id, 'job.json'), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _update_job(self, job_id, **changes):
+        with self._lock:
+            self._jobs[job_id].update(changes)
+            job = dict(self._jobs[job_id])
+        self._save_job(job)
+
+    def _save_job(self, job):
+        try:
+            job_dir = os.path.join(self.versions_dir, job['jobId'])
+            os.makedirs(job_dir, exist_ok=True)
+            tmp = os.path.join(job_dir, 'job.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(job, f)
+            os.replace(tmp, os.path.join(job_dir, 'job.json'))
+        except OSError as e:
+            print(f"Warning: could not save retrain job status: {e}")
+
+    #non-blocking lock shared by every server process on this machine
+    def _acquire_retrain_lock(self):
+        if fcntl is None:
+            return True
+        os.makedirs(self.versions_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.versions_dir, '.retrain.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _release_retrain_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close() #closing releases the lock
+            self._lock_file = None
+
+    def _run_retrain(self, job_id, mode='full'):
+        start = time.monotonic()
+        self._update_job(job_id, status='running', startedAt=datetime.now().isoformat(timespec='seconds'))
+        try:
+            #train inside the job's own folder so the live files are untouched until the new bundle is good
+            job_dir = os.path.join(self.versions_dir, job_id)
+            os.makedirs(job_dir, exist_ok=True)
+            script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train_model.py')
+            #retrain on the same feature source as the live models, so a point in time model stays point in time
+            command = [sys.executable, script, '--features', read_feature_source(self.current.directory)]
+            if mode == 'incremental':
+                command += ['--incremental', '--base-dir', os.path.abspath(self.model_dir)]
+            result = subprocess.run(command, cwd=job_dir,
+                                    capture_output=True, text=True, timeout=RETRAIN_TIMEOUT)
+            if result.returncode != 0: #0 = success, non-zero = error
+                raise RuntimeError(result.stderr.strip()[-2000:] or f'train_model.py exited with {result.returncode}')
+
+            bundle = load_bundle(job_dir, verify=True)
+            promote_files(job_dir, self.model_dir)
+            self.swap(bundle)
+            self._update_job(job_id, status='succeeded', version=bundle.version)
+        except Exception as e:
+            print(f"Retrain job {job_id} failed: {e}")
+            self._update_job(job_id, status='failed', error=str(e))
+        finally:
+            self._update_job(job_id, finishedAt=datetime.now().isoformat(timespec='seconds'),
+                             seconds=round(time.monotonic() - start, 1))
+            with self._lock:
+                self._running_job = None
+                self._release_retrain_lock()
+
+    #points a bundle loaded from the live folder at its copy in model_versions/, so rollback can restore it
+    def _pin_to_archive(self, bundle):
+        if os.path.abspath(bundle.directory) != os.path.abspath(self.model_dir):
+            return
+        try:
+            os.makedirs(self.versions_dir, exist_ok=True)
+            archive = archive_live_files(bundle.version, self.model_dir, self.versions_dir)
+        except OSError as e:
+            print(f"Warning: could not archive models {bundle.version}: {e}")
+            return
+        if archive:
+            bundle.directory = archive
+
+    #loads the live files if another process swapped them (a retrain or rollback in another worker)
+    #returns True if a new bundle went live
+    def check_for_update(self):
+        version = read_version(self.model_dir)
+        if version is None or version == self.current.version or self._running_job is not None:
+            return False
+        #loaded from its own copy in model_versions/, never from the live folder (see the notes at the top)
+        os.makedirs(self.versions_dir, exist_ok=True)
+        archive = archive_live_files(version, self.model_dir, self.versions_dir)
+        if archive is None:
+            return False #the files changed again while they were copied, the next check picks them up
+        bundle = load_bundle(archive, verify=True)
+        if bundle.version == self.current.version:
+            return False
+        self.swap(bundle)
+        print(f"✓ Picked up models {bundle.version} from disk")
+        return True
+
+    def start_watch_thread(self, interval=WATCH_INTERVAL):
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, args=(interval,), name='model-watch', daemon=True)
+        self._watch_thread.start()
+
+    def stop(self):
+        self._watch_stop.set()
+        if self._watch_thread:
+            self._watch_thread.join(timeout=5)
+
+    def _watch_loop(self, interval):
+        while not self._watch_stop.wait(interval):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                print(f"Warning: could not check for new models: {e}")
+
+    #for the health endpoint
+    def stats(self):
+        with self._lock:
+            return {
+                'current': self.current.info(),
+                'previousVersions': [bundle.version for bundle in reversed(self._previous)],
+                'retrainRunning': self._running_job
+            }
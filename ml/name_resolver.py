@@ -0,0 +1,159 @@
+# name_resolver.py - turns player and team names typed by users into database ids
+import bisect
+import difflib
+import re
+import unicodedata
+
+"""
+the old queries found players with "PlayerName LIKE '%name%'" on the 185K row Stats table and teams with
+"TeamName LIKE '%name%'". a leading wildcard can't use any index, so every request scanned the table
+
+instead we keep a small index in memory:
+    players: normalized full name -> PlayerApiId
+    teams:   normalized name, nickname, city and abbreviation -> Teams.Id
+
+and look names up in tiers, stopping at the first tier with a match:
+    1. exact         "lebron james"  / "lal" / "lakers"
+    2. prefix        "lebron"        / "lak"
+    3. word prefix   "james"         / "angeles"   (any word of the name starts with it)
+    4. substring     "bron"                        (what LIKE '%name%' used to do)
+    5. fuzzy         "lebron jmaes"  / "celitcs"   (close spelling, difflib)
+
+when a tier matches several players the one with the most recent game wins, like the old
+ORDER BY GameDate DESC. a team name can match several teams ("los angeles"), then all of them are
+returned, like the old LIKE did
+"""
+
+#how close a misspelling has to be to count (0-1, higher = stricter)
+FUZZY_CUTOFF = 0.8
+
+#abbreviations and common short names for each team, keyed by nickname
+TEAM_ALIASES = {
+    'hawks': ['atl'], 'celtics': ['bos'], 'nets': ['bkn', 'brk'], 'hornets': ['cha'],
+    'bulls': ['chi'], 'cavaliers': ['cle', 'cavs'], 'mavericks': ['dal', 'mavs'], 'nuggets': ['den'],
+    'pistons': ['det'], 'warriors': ['gsw', 'gs'], 'rockets': ['hou'], 'pacers': ['ind'],
+    'clippers': ['lac'], 'lakers': ['lal'], 'grizzlies': ['mem'], 'heat': ['mia'],
+    'bucks': ['mil'], 'timberwolves': ['min', 'wolves'], 'pelicans': ['nop', 'no'], 'knicks': ['nyk', 'ny'],
+    'thunder': ['okc'], 'magic': ['orl'], '76ers': ['phi', 'sixers'], 'suns': ['phx', 'pho'],
+    'trail blazers': ['por', 'blazers'], 'kings': ['sac'], 'spurs': ['sas', 'sa'], 'raptors': ['tor'],
+    'jazz': ['uta', 'utah'], 'wizards': ['was', 'wsh'],
+}
+
+#lowercase, no accents, no punctuation, single spaces: "Nikola Jokić" -> "nikola jokic", "D'Angelo" -> "dangelo"
+def normalize(name):
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKD', str(name))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+    text = re.sub(r"['.]", '', text)
+    text = re.sub(r'[^a-z0-9]+', ' ', text)
+    return text.strip()
+
+#splits a team name into (city, nickname): "Portland Trail Blazers" -> ("portland", "trail blazers")
+def split_team_name(normalized_name):
+    for nickname in TEAM_ALIASES:
+        if normalized_name.endswith(' ' + nickname) or normalized_name == nickname:
+            return normalized_name[:-len(nickname)].strip(), nickname
+    words = normalized_name.split()
+    return ' '.join(words[:-1]), words[-1] if words else ''
+
+class NameResolver:
+    #players = {PlayerApiId: {PlayerName: latest GameDate}}, teams = {Teams.Id: TeamName}
+    def __init__(self, players, teams):
+        # player index
+        self._player_latest = {} #PlayerApiId -> most recent game date, used to break ties
+        by_name = {}
+        for pid, names in players.items():
+            for name, game_date in names.items():
+                key = normalize(name)
+                if not key:
+                    continue
+                game_date = game_date or ''
+                self._player_latest[pid] = max(self._player_latest.get(pid, ''), game_date)
+                #two players with the same name: keep the one who played most recently
+                if key not in by_name or game_date > by_name[key][1]:
+                    by_name[key] = (pid, game_date)
+        self._player_exact = {key: pid for key, (pid, _) in by_name.items()}
+        self._player_keys = sorted(by_name) #sorted so prefix lookups can use bisect
+
+        # team index
+        self.team_names = dict(teams)
+        aliases = {}
+        for team_id, name in teams.items():
+            full = normalize(name)
+            city, nickname = split_team_name(full)
+            for alias in [full, city, nickname] + TEAM_ALIASES.get(nickname, []):
+                if alias:
+                    aliases.setdefault(alias, set()).add(team_id)
+            #"la clippers" and "los angeles clippers" should both work
+            if city == 'la':
+                aliases.setdefault('los angeles', set()).add(team_id)
+            elif city == 'los angeles':
+                aliases.setdefault('la', set()).add(team_id)
+        self._team_aliases = aliases
+        self._team_keys = sorted(aliases)
+
+    @property
+    def player_count(self):
+        return len(self._player_exact)
+
+    #returns the PlayerApiId for a typed name, or None
+    def resolve_player(self, query):
+        q = normalize(query)
+        if not q:
+            return None
+        if q in self._player_exact:
+            return self._player_exact[q]
+
+        for matches in (
+            self._prefix_matches(self._player_keys, q),
+            [key for key in self._player_keys if any(word.startswith(q) for word in key.split())],
+            [key for key in self._player_keys if q in key],
+            difflib.get_close_matches(q, self._player_keys, n=5, cutoff=FUZZY_CUTOFF),
+        ):
+            if matches:
+                return max((self._player_exact[key] for key in matches), key=lambda pid: self._player_latest.get(pid, ''))
+        return None
+
+    #returns a sorted list of Teams.Id for a typed team name (empty if nothing matches)
+    def resolve_team(self, query):
+        q = normalize(query)
+        if not q:
+            return []
+        if q in self._team_aliases:
+            return sorted(self._team_aliases[q])
+
+        prefix = self._prefix_matches(self._team_keys, q)
+        if prefix:
+            return sorted(set().union(*(self._team_aliases[key] for key in prefix)))
+        for matches in (
+            [key for key in self._team_keys if any(word.startswith(q) for word in key.split())],
+            [key for key in self._team_keys if q in key],
+        ):
+            if matches:
+                return sorted(set().union(*(self._team_aliases[key] for key in matches)))
+        close = difflib.get_close_matches(q, self._team_keys, n=1, cutoff=FUZZY_CUTOFF)
+        return sorted(self._team_aliases[close[0]]) if close else []
+
+    #every key in a sorted list that starts with q
+    def _prefix_matches(self, keys, q):
+        start = bisect.bisect_left(keys, q)
+        end = bisect.bisect_left(keys, q + '\uffff')
+        return keys[start:end]
+
+#builds a resolver straight from the database, used when the feature store isn't loaded
+#only players with aggregates for the season are included since those are the only ones we can predict
+def load_name_resolver(cursor, season):
+    cursor.execute("""
+        SELECT s.PlayerApiId, s.PlayerName, MAX(s.GameDate)
+        FROM Stats s
+        JOIN PlayerAggregates pa ON pa.PlayerApiId = s.PlayerApiId AND pa.Season = s.Season
+        WHERE s.Season = ?
+        GROUP BY s.PlayerApiId, s.PlayerName
+    """, season)
+    players = {}
+    for pid, name, game_date in cursor.fetchall():
+        players.setdefault(pid, {})[name] = game_date
+    cursor.execute("SELECT Id, TeamName FROM Teams")
+    teams = {team_id: name for team_id, name in cursor.fetchall()}
+    return NameResolver(players, teams)
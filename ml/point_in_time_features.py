@@ -0,0 +1,151 @@
+# point_in_time_features.py - training features worked out from the box scores as they stood before each game
+# usage: train_model.py --point-in-time (or tune_models.py --point-in-time), see bench_point_in_time.py for timings
+import numpy as np #math operations
+import pandas as pd #handles data tables (data frames)
+
+"""
+the normal training frame joins every box score to PlayerAggregates, PlayerVsTeam and OpponentDefensiveStats
+by season. those tables hold the averages as of the last nightly rebuild, so a game from november trains on
+the player's end of season average, and last 5/last 10 are the 5 and 10 games before today, not before that
+game. the model learns from numbers it could never have had at prediction time
+
+this builds the same columns straight from the cached Stats rows, for each game only counting the games
+before it (same season, same as configure.js):
+    SeasonAvg*, GamesPlayed      - the player's average and games played so far this season
+    Last5AvgPoints/Last10...     - the player's last 5 and 10 games before this one
+    VsTeam*, VsTeamGames         - the player's games against this opponent so far this season
+    OppDefenseRating             - points the opponent has allowed per game so far (the other team's points
+                                   in each of its games, summed from Stats)
+    OppReboundsAllowed           - same for rebounds
+
+everything is prefix sums over sorted arrays, no per row sql or python loops. each grouping (player,
+player + opponent, team) is one lexsort, then for row i with p earlier games in its group the sum of the
+last k of them is prefix[i] - prefix[i - min(p, k)]. 185K rows take well under a second
+
+games are ordered by Games.StartTime (the cache's GameTime), ties by Stats.Id, so two rows from the same
+game never see each other. a player needs MIN_PRIOR_GAMES games this season before a row is kept, the
+same idea as the GamesPlayed >= 5 filter on the aggregates join
+"""
+
+MIN_PRIOR_GAMES = 5
+DEFAULT_DEFENSE_RATING = 110 #same fallbacks build_training_frame uses
+DEFAULT_REBOUNDS_ALLOWED = 43
+
+#(average column, box score column) for the season to date averages
+SEASON_AVERAGES = [('SeasonAvgPoints', 'ActualPoints'), ('SeasonAvgRebounds', 'ActualRebounds'),
+                   ('SeasonAvgAssists', 'ActualAssists'), ('SeasonAvgSteals', 'ActualSteals'),
+                   ('SeasonAvgBlocks', 'ActualBlocks'), ('SeasonAvgTurnovers', 'ActualTurnovers')]
+MATCHUP_AVERAGES = [('VsTeamAvgPoints', 'ActualPoints'), ('VsTeamAvgRebounds', 'ActualRebounds'),
+                    ('VsTeamAvgAssists', 'ActualAssists')]
+FEATURE_COLUMNS = ([name for name, _ in SEASON_AVERAGES] + ['Last5AvgPoints', 'Last10AvgPoints', 'GamesPlayed']
+                   + [name for name, _ in MATCHUP_AVERAGES] + ['VsTeamGames', 'OppDefenseRating', 'OppReboundsAllowed'])
+
+#row order (groups together, earliest game first inside each) and how many earlier rows each row has in its group
+#groups and ordering are lists of equal length arrays, ordering only breaks ties inside a group
+def group_positions(groups, ordering):
+    order = np.lexsort((groups + ordering)[::-1]) #lexsort sorts by the last key first
+    index = np.arange(len(order))
+    new_group = np.zeros(len(order), dtype=bool)
+    new_group[:1] = True
+    for key in groups:
+        sorted_key = key[order]
+        new_group[1:] |= sorted_key[1:] != sorted_key[:-1]
+    starts = np.maximum.accumulate(np.where(new_group, index, 0))
+    return order, index - starts
+
+#mean of the last window values before each row in its group (all of them with window None), NaN values skipped
+#values and positions are in sorted order, NaN where there's nothing to average
+def prior_means(values, positions, window=None):
+    present = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    index = np.arange(len(values))
+    lookback = positions if window is None else np.minimum(positions, window)
+    first = index - lookback
+    total = sums[index] - sums[first]
+    n = counts[index] - counts[first]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, total / n, np.nan)
+
+#puts sorted order values back in the frame's row order
+def unsort(order, values):
+    out = np.empty_like(values)
+    out[order] = values
+    return out
+
+def column(df, name):
+    return df[name].to_numpy(dtype='float64', na_value=np.nan)
+
+#codes for a text or id column so it can go into lexsort
+def codes(df, name):
+    return pd.factorize(df[name])[0]
+
+#game start times as int64 nanoseconds, for sorting
+def game_times(df):
+    return pd.to_datetime(df['GameTime']).to_numpy('datetime64[ns]').astype('int64')
+
+#points/rebounds each team allowed per game before every game, one row per (GameId, TeamId)
+def defense_to_date(df, times):
+    sides = pd.DataFrame({'GameId': df['GameId'].to_numpy(), 'TeamId': df['TeamId'].to_numpy(),
+                          'Season': df['Season'].to_numpy(), 'GameTime': times,
+                          'Points': column(df, 'ActualPoints'), 'Rebounds': np.nan_to_num(column(df, 'ActualRebounds'))})
+    sides = sides.groupby(['GameId', 'TeamId'], sort=False).agg(
+        Season=('Season', 'first'), GameTime=('GameTime', 'min'), Points=('Points', 'sum'), Rebounds=('Rebounds', 'sum')
+    ).reset_index()
+
+    #what a team allowed = the other side's total. only games with both sides in the rows count
+    game = sides.groupby('GameId')
+    both = (game['TeamId'].transform('size') == 2).to_numpy()
+    sides['Allowed'] = np.where(both, game['Points'].transform('sum') - sides['Points'], np.nan)
+    sides['ReboundsAllowed'] = np.where(both, game['Rebounds'].transform('sum') - sides['Rebounds'], np.nan)
+    sides['OpponentTeamId'] = np.where(both, game['TeamId'].transform('sum') - sides['TeamId'], -1)
+
+    order, positions = group_positions([sides['TeamId'].to_numpy(), codes(sides, 'Season')],
+                                       [sides['GameTime'].to_numpy(), sides['GameId'].to_numpy()])
+    sides['OppDefenseRating'] = unsort(order, prior_means(sides['Allowed'].to_numpy()[order], positions))
+    sides['OppReboundsAllowed'] = unsort(order, prior_means(sides['ReboundsAllowed'].to_numpy()[order], positions))
+    return sides
+
+#the training frame (same columns fetch_training_data() gives, so prepare_features() takes it as is)
+#from cached box score rows with GameId, TeamId and GameTime (training_data.STATS_COLUMNS)
+def build_point_in_time_frame(stats_df, min_prior_games=MIN_PRIOR_GAMES):
+    df = stats_df.reset_index(drop=True).copy()
+    if not len(df):
+        return df.reindex(columns=list(df.columns) + FEATURE_COLUMNS)
+    times = game_times(df)
+    stat_ids = df['StatId'].to_numpy()
+    player = df['PlayerApiId'].to_numpy()
+    season = codes(df, 'Season')
+
+    # 1. the player's season so far
+    order, positions = group_positions([player, season], [times, stat_ids])
+    for name, source in SEASON_AVERAGES:
+        df[name] = unsort(order, prior_means(column(df, source)[order], positions))
+    points = column(df, 'ActualPoints')[order]
+    df['Last5AvgPoints'] = unsort(order, prior_means(points, positions, 5))
+    df['Last10AvgPoints'] = unsort(order, prior_means(points, positions, 10))
+    df['GamesPlayed'] = unsort(order, positions)
+
+    # 2. the player against this opponent so far this season
+    order, positions = group_positions([player, codes(df, 'OpponentTeam'), season], [times, stat_ids])
+    for name, source in MATCHUP_AVERAGES:
+        df[name] = unsort(order, prior_means(column(df, source)[order], positions))
+    df['VsTeamGames'] = unsort(order, positions)
+
+    # 3. the opponent's defense so far, through the player's side of the game
+    sides = defense_to_date(df, times)
+    opponent = sides[['GameId', 'TeamId', 'OpponentTeamId']].merge(
+        sides[['GameId', 'TeamId', 'OppDefenseRating', 'OppReboundsAllowed']].rename(columns={'TeamId': 'OpponentTeamId'}),
+        on=['GameId', 'OpponentTeamId'], how='left'
+    )
+    df = df.merge(opponent.drop(columns='OpponentTeamId'), on=['GameId', 'TeamId'], how='left')
+    df['OppDefenseRating'] = df['OppDefenseRating'].fillna(DEFAULT_DEFENSE_RATING)
+    df['OppReboundsAllowed'] = df['OppReboundsAllowed'].fillna(DEFAULT_REBOUNDS_ALLOWED)
+
+    #no matchup history falls back to the season average, same as fetch_training_data()
+    for name, source in zip(['VsTeamAvgPoints', 'VsTeamAvgRebounds', 'VsTeamAvgAssists'],
+                            ['SeasonAvgPoints', 'SeasonAvgRebounds', 'SeasonAvgAssists']):
+        df[name] = df[name].fillna(df[source])
+
+    df = df[df['GamesPlayed'] >= min_prior_games]
+    return df.sort_values('StatId', kind='stable').reset_index(drop=True)
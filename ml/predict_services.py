@@ -1,12 +1,21 @@
 # predict_service.py 
-from flask import Flask, jsonify, request #web framework
+from flask import Flask, Response, g, jsonify, request #web framework
 from flask_cors import CORS #allows node.js to call this python ML
-import pickle #loads saved models
-import json #reads metadata
-import pyodbc #connects to database
 import numpy as np #math operations 
+import os
+import time
 from datetime import datetime, timedelta
-from prediction_logger import log_prediction
+from prediction_logger import enqueue_prediction, log_writer
+from data_access import read_pool as pool #azure, or the local snapshot with ML_DATA_BACKEND=snapshot
+from feature_store import FeatureStore, CURRENT_SEASON, MATCHUP_SEASONS
+from name_resolver import load_name_resolver, normalize
+from prediction_cache import PredictionCache, NOT_FOUND
+from model_registry import ModelRegistry, load_bundle, MODEL_DIR
+from process_memory import process_memory
+from ensemble_engine import build_feature_matrix
+from forest_compiler import EXIT_CHUNK, EXIT_TOLERANCE, EXIT_MIN_ROWS
+from service_metrics import metrics
+from slate_precompute import SlateStore, SLATE_FILE
 
 #create the web server 
 #enable cross origin requests (from different ports)
@@ -14,114 +23,206 @@ from prediction_logger import log_prediction
 app = Flask(__name__) 
 CORS(app)
 
-# database connection
-conn_str = (
-    'DRIVER={ODBC Driver 18 for SQL Server};'
-    'SERVER=YOUR_SERVER.database.windows.net;'
-    'DATABASE=basketball_data;'
-    'UID=YOUR_USERNAME;'
-    'PWD=YOUR_PASSWORD;'
-    'Encrypt=yes;'
-    'TrustServerCertificate=no;'
-)
-
 #load all 6 trained models from the .pkl files
+#the six stats we predict, in the order the models are trained
+STATS = ['points', 'rebounds', 'assists', 'steals', 'blocks', 'turnovers']
 
 print("Loading ML models...")
-with open('points_model.pkl', 'rb') as f:
-    points_model = pickle.load(f) #all of this runs once at server start up, and we are loading the model into memory
-
-with open('rebounds_model.pkl', 'rb') as f:
-    rebounds_model = pickle.load(f)
-
-with open('assists_model.pkl', 'rb') as f:
-    assists_model = pickle.load(f)
-
-with open('steals_model.pkl', 'rb') as f:
-    steals_model = pickle.load(f)
-
-with open('blocks_model.pkl', 'rb') as f:
-    blocks_model = pickle.load(f)
+#the models, their feature lists from metadata.json and the compiled trees are loaded together as one bundle
+#all of this runs once at server start up, retrains swap in a whole new bundle at once
+registry = ModelRegistry(load_bundle())
 
-with open('turnovers_model.pkl', 'rb') as f:
-    turnovers_model = pickle.load(f)
+#these saved models make it easy for users to get quick results cause they are already trained
 
 
-#laod the features list from metadata.json
+print("✓ Models loaded successfully!")
+print(f"Points features: {registry.current.features['points']}")
 
-with open('model_metadata.json', 'r') as f:
-    metadata = json.load(f)
-    points_features = metadata['points_features']
-    rebounds_features = metadata['rebounds_features']
-    assists_features = metadata['assists_features']
-    steals_features = metadata['steals_features']
-    blocks_features = metadata['blocks_features']
-    turnovers_features = metadata['turnovers_features']
+#load this season's aggregates, matchup history and defensive stats into memory
+#so predictions don't need a database round trip, if this fails we fall back to querying per request
+feature_store = FeatureStore(pool)
 
-#these saved models make it easy for users to get quick results cause they are already trained
+#recent predictions keyed by (player id, opponent team ids, home/away, model version)
+#emptied when the models are reloaded or the feature store picks up new data
+prediction_cache = PredictionCache()
+feature_store.add_listener(lambda: prediction_cache.clear('feature store refreshed'))
+registry.add_listener(lambda bundle: prediction_cache.clear(f'models swapped to {bundle.version}'))
 
+#predictions for tomorrow's slate worked out ahead of time by slate_precompute.py, reloaded when the file changes
+SLATE_PATH = os.path.join(MODEL_DIR, SLATE_FILE)
+slate = SlateStore(SLATE_PATH)
+slate.maybe_reload()
 
-print("✓ Models loaded successfully!")
-print(f"Points features: {points_features}")
+#ML_PRELOAD_FEATURES=0 skips this, for running without a database (bench_inference.py)
+if os.environ.get('ML_PRELOAD_FEATURES', '1') != '0':
+    try:
+        feature_store.load()
+    except Exception as e:
+        print(f"Warning: Could not load feature store, features will be queried per request: {e}")
+
+# largest slate accepted by the batch endpoint in one call
+MAX_BATCH_SIZE = 500
+
+#early exit: stop walking a model's trees once its running mean/std settle (see forest_compiler.py)
+#off unless ML_EARLY_EXIT=1 or the request asks with ?earlyExit=1, ?budgetMs= also caps the time spent on the trees
+EARLY_EXIT = os.environ.get('ML_EARLY_EXIT', '0') == '1'
+EXIT_TOLERANCE_DEFAULT = float(os.environ.get('ML_EXIT_TOLERANCE', EXIT_TOLERANCE))
+LATENCY_BUDGET_MS = float(os.environ['ML_LATENCY_BUDGET_MS']) if os.environ.get('ML_LATENCY_BUDGET_MS') else None
+
+#timings and counters served by /api/ml/metrics, see service_metrics.py
+predict_phase = metrics.histogram('ml_predict_phase_seconds', 'Time spent in each step of scoring a request', ['phase'])
+#the tree walk itself is one pass over all six models (predict_phase 'tree_walk'), these only time each model's
+#reduction of its slice of the walk: the mean (its prediction) and the std (its uncertainty)
+model_phase = metrics.histogram('ml_model_phase_seconds', 'Time per model to reduce its tree outputs to the prediction (reduce_mean) and uncertainty (reduce_std), the walk is in ml_predict_phase_seconds tree_walk', ['model', 'step'])
+request_duration = metrics.histogram('ml_http_request_duration_seconds', 'Time to answer a request', ['endpoint'])
+requests_total = metrics.counter('ml_http_requests_total', 'Requests answered, by endpoint, method and status code', ['endpoint', 'method', 'status'])
+predictions_total = metrics.counter('ml_predictions_total', 'Players scored, by outcome', ['outcome'])
+early_exits_total = metrics.counter('ml_early_exit_total', 'Early exit model runs, by why they stopped', ['reason'])
+
+# sql server allows at most 2100 parameters per statement, so the batch lookups are chunked
+BATCH_QUERY_CHUNK = 500
 
 #this function fetches all the data needed to make a prediction
-def get_player_features(player_name, opponent_team):
-    conn = pyodbc.connect(conn_str) #connect to database
-    cursor = conn.cursor() #a cursor is a tool for running sql queries 
-    
-    # get player aggregates
-    cursor.execute("""
-        SELECT TOP 1
-            ISNULL(pa.AvgPoints, 0), 
-            ISNULL(pa.AvgRebounds, 0), 
-            ISNULL(pa.AvgAssists, 0),
-            ISNULL(pa.AvgSteals, 0),     
-            ISNULL(pa.AvgBlocks, 0),      
-            ISNULL(pa.AvgTurnovers, 0),
-            ISNULL(pa.Last5AvgPoints, 0), 
-            ISNULL(pa.Last10AvgPoints, 0), 
-            ISNULL(pa.GamesPlayed, 0),
-            s.PlayerApiId
-        FROM PlayerAggregates pa
-        JOIN Stats s ON pa.PlayerApiId = s.PlayerApiId
-        WHERE s.PlayerName LIKE ? 
-        AND pa.Season = '2025-2026'
-        AND s.Season = '2025-2026'
-        ORDER BY s.GameDate DESC
-    """, f'%{player_name}%')
-
-    #fill in the ? with player name
-    
-    agg_row = cursor.fetchone() #gets the first result row
-    if not agg_row:
-        conn.close() #if not player found, close connection, return None
-        return None
-    
+def get_player_features(player_name, opponent_team, is_home=1):
+    return get_batch_features([(player_name, opponent_team, is_home)])[0]
+
+#the name index used to turn typed names into ids
+#comes from the feature store when it's loaded, otherwise it's loaded once straight from the database
+standalone_resolver = None
+def get_resolver():
+    global standalone_resolver
+    if feature_store.ready:
+        return feature_store.resolver
+    if standalone_resolver is None:
+        with pool.connection() as conn:
+            standalone_resolver = load_name_resolver(conn.cursor(), CURRENT_SEASON)
+    return standalone_resolver
+
+#builds "(?, ?), (?, ?), ..." so a whole list of lookups can be sent as one VALUES table
+def values_placeholders(n_rows, n_cols):
+    row = '(' + ', '.join(['?'] * n_cols) + ')'
+    return ', '.join([row] * n_rows)
+
+#splits a list into pieces small enough to stay under the sql server parameter limit
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+#fetches features for a whole slate at once
+#items = list of (player_name, opponent_team, is_home) tuples
+#returns a list lined up with items, holding the feature dictionary or None if the player was not found
+def get_batch_features(items):
+    return get_resolved_features(resolve_items(items), [is_home for _, _, is_home in items])
+
+#turn the typed names into PlayerApiId / Teams.Id first, so nothing after this needs a LIKE '%name%' scan
+#returns a list of (PlayerApiId or None, tuple of opponent Teams.Id)
+def resolve_items(items):
+    resolver = get_resolver()
+    return [(resolver.resolve_player(player), tuple(resolver.resolve_team(opponent))) for player, opponent, _ in items]
+
+#feature dictionaries for already resolved items, None where the player has no data
+def get_resolved_features(resolved, home_flags):
+    #serve from the in-memory feature store when it's loaded, otherwise query the database by id
+    if feature_store.ready:
+        rows = [feature_store.lookup_ids(pid, team_ids) if pid is not None else None for pid, team_ids in resolved]
+    else:
+        rows = fetch_feature_rows(resolved)
+
+    features = []
+    for row, is_home in zip(rows, home_flags):
+        features.append(build_features(*row, is_home) if row else None)
+    return features
+
+#runs 3 set based queries for the whole slate (aggregates, matchup history, opponent defense)
+#resolved = list of (PlayerApiId or None, tuple of opponent Teams.Id)
+#returns a list of (agg_row, vs_row, opp_row), or None where the player has no aggregates
+def fetch_feature_rows(resolved):
+    player_ids = sorted({pid for pid, _ in resolved if pid is not None})
+    pairs = sorted({(pid, team_ids) for pid, team_ids in resolved if pid is not None and team_ids})
+    team_ids = sorted({team_id for _, ids in resolved for team_id in ids})
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+
+        # 1. player aggregates for every player in the slate
+        agg_rows = {}
+        for chunk in chunked(player_ids, BATCH_QUERY_CHUNK):
+            cursor.execute(f"""
+                SELECT
+                    ISNULL(pa.AvgPoints, 0),
+                    ISNULL(pa.AvgRebounds, 0),
+                    ISNULL(pa.AvgAssists, 0),
+                    ISNULL(pa.AvgSteals, 0),
+                    ISNULL(pa.AvgBlocks, 0),
+                    ISNULL(pa.AvgTurnovers, 0),
+                    ISNULL(pa.Last5AvgPoints, 0),
+                    ISNULL(pa.Last10AvgPoints, 0),
+                    ISNULL(pa.GamesPlayed, 0),
+                    pa.PlayerApiId
+                FROM PlayerAggregates pa
+                WHERE pa.Season = ?
+                AND pa.PlayerApiId IN ({', '.join(['?'] * len(chunk))})
+            """, CURRENT_SEASON, *chunk)
+            for row in cursor.fetchall():
+                agg_rows[row[9]] = tuple(row)
+
+        # 2. matchup history for every (player, opponent) pair, averaged over every team the opponent name matched
+        #one VALUES row per (pair, team id) so the join stays on the PlayerVsTeam unique key
+        vs_rows = {}
+        pair_teams = [(i, pid, team_id) for i, (pid, ids) in enumerate(pairs) for team_id in ids]
+        for chunk in chunked(pair_teams, BATCH_QUERY_CHUNK):
+            params = [value for entry in chunk for value in entry]
+            cursor.execute(f"""
+                SELECT
+                    req.Idx,
+                    AVG(ISNULL(pvt.AvgPoints, 0)),
+                    AVG(ISNULL(pvt.AvgRebounds, 0)),
+                    AVG(ISNULL(pvt.AvgAssists, 0)),
+                    SUM(ISNULL(pvt.GamesPlayed, 0))
+                FROM (VALUES {values_placeholders(len(chunk), 3)}) AS req(Idx, PlayerApiId, TeamId)
+                JOIN PlayerVsTeam pvt ON pvt.PlayerApiId = req.PlayerApiId AND pvt.OpponentTeamId = req.TeamId
+                WHERE pvt.Season IN ({', '.join(['?'] * len(MATCHUP_SEASONS))})
+                GROUP BY req.Idx
+            """, *params, *MATCHUP_SEASONS)
+            for row in cursor.fetchall():
+                vs_rows[pairs[row[0]]] = tuple(row[1:])
+
+        # 3. defensive stats for every opponent team
+        defense = {}
+        for chunk in chunked(team_ids, BATCH_QUERY_CHUNK):
+            cursor.execute(f"""
+                SELECT
+                    TeamId,
+                    ISNULL(AvgPointsAllowed, 117),
+                    ISNULL(AvgReboundsAllowed, 43)
+                FROM OpponentDefensiveStats
+                WHERE Season = ?
+                AND TeamId IN ({', '.join(['?'] * len(chunk))})
+            """, CURRENT_SEASON, *chunk)
+            for team_id, pts_allowed, reb_allowed in cursor.fetchall():
+                defense[team_id] = (pts_allowed, reb_allowed)
+
+    #line the results back up with the requested items
+    rows = []
+    for pid, ids in resolved:
+        agg_row = agg_rows.get(pid)
+        if not agg_row:
+            rows.append(None)
+            continue
+        vs_row = vs_rows.get((pid, ids))
+        opp_row = next((defense[team_id] for team_id in ids if team_id in defense), None)
+        rows.append((agg_row, vs_row, opp_row))
+    return rows
+
+#turns the three query results (aggregates, matchup history, opponent defense) into the model feature dictionary
+#shared by the single prediction endpoint and the batch endpoint so both see exactly the same features
+def build_features(agg_row, vs_row, opp_row, is_home=1):
     #unpack the row into seperate variables
     season_pts, season_reb, season_ast, season_steals, season_blocks, season_turnovers, last5_pts, last10_pts, games, player_api_id = agg_row
-    
-    # get matchup history
-    cursor.execute("""
-    SELECT 
-        AVG(ISNULL(pvt.AvgPoints, 0)), 
-        AVG(ISNULL(pvt.AvgRebounds, 0)), 
-        AVG(ISNULL(pvt.AvgAssists, 0)), 
-        SUM(ISNULL(pvt.GamesPlayed, 0))
-    FROM PlayerVsTeam pvt
-    JOIN Teams t ON pvt.OpponentTeamId = t.Id
-    WHERE pvt.PlayerApiId = ?
-    AND t.TeamName LIKE ?
-    AND pvt.Season IN ('2022-2023', '2023-2024','2024-2025', '2025-2026')
-""", player_api_id, f'%{opponent_team}%')
-    
-    vs_row = cursor.fetchone()
-    print(f"DEBUG: Player={player_name}, Opponent={opponent_team}")
-    print(f"DEBUG: vs_row = {vs_row}")
 
     #if there is matchup history, use these stats
     if vs_row and vs_row[3] is not None and vs_row[3] >= 1:
         vs_pts, vs_reb, vs_ast, vs_games = vs_row
-        print(f"DEBUG: Using matchup history - {vs_pts} pts in {vs_games} games")
 
     #if no matchup history, fall back to season averages
     else:
@@ -129,28 +230,12 @@ def get_player_features(player_name, opponent_team):
         vs_reb = season_reb
         vs_ast = season_ast
         vs_games = 0
-        print(f"DEBUG: No matchup history, using season avg")
-
-    #get opponent defensive stats
-    cursor.execute("""
-    SELECT TOP 1 
-        ISNULL(AvgPointsAllowed, 117),
-        ISNULL(AvgReboundsAllowed, 43)
-    FROM OpponentDefensiveStats ods
-    JOIN Teams t ON ods.TeamId = t.Id
-    WHERE t.TeamName LIKE ?
-    AND ods.Season = '2025-2026'
-""", f'%{opponent_team}%')
-
-    #get the result
-    opp_row = cursor.fetchone()
+
     #if we found an opponent, use their actual points, if not use league average (117)
     opp_def = opp_row[0] if opp_row else 117.0
     #same with rebounds allowed
     opp_reb_allowed = opp_row[1] if opp_row and len(opp_row) > 1 else 43.0
     
-    conn.close()
-    
     # calculate derived features with NULL protection
     #need to make sure we give the model all the data it expects or we will get an error
 
@@ -161,7 +246,6 @@ def get_player_features(player_name, opponent_team):
     defensive_difficulty = float((opp_def -117) / 10)
     is_veteran = 1 if games >= 50 else 0
     has_matchup_history = 1 if vs_games >= 2 else 0
-    is_home = 1
     
     #create one dictionary with all features, then the model will pick which ones it needs
     return {
@@ -239,6 +323,299 @@ def calculate_confidence(prediction, std_dev, features, stat_type):
     total = uncertainty_score + consistency_score + sample_score + matchup_score
     return int(max(35, min(85, total)))
 
+#runs all six models on a list of feature dictionaries at once
+#returns {stat: (predictions, standard deviations)} with one entry per feature row
+#bundle defaults to the live models, pass one in to keep a whole request on the same version
+def predict_stats(feature_rows, bundle=None):
+    return run_models(feature_rows, bundle)[0]
+
+#predict_stats plus how many trees each model used, early_exit = (tolerance, budget ms or None) or None for every tree
+#returns (results, {stat: trees used for each row})
+def run_models(feature_rows, bundle=None, early_exit=None):
+    # make predictions and calculate std deviation from tree predictions
+    """
+    1. build one feature matrix for the whole list of rows
+    2. every tree of every model (compiled into flat arrays) predicts every row in one pass
+    3. the mean down the trees is the prediction
+    4. the std down the trees is the uncertainty
+
+    low standard deviation (all trees agree) = high confidence, they all saw similar patterns in different data
+    high standard deviatino (trees disagree) = low confidence, data is inconsistent
+
+    with early_exit the trees are walked in chunks and a model stops once more trees stop changing its answer,
+    unless the batch is too small for that to be faster or every tree fits in the budget (early_exit_skip)
+    """
+    bundle = bundle or registry.current
+    compiled = bundle.compiled
+    with predict_phase.time('feature_matrix'):
+        matrix, _ = build_feature_matrix(feature_rows, compiled.feature_lists)
+    skip = early_exit and early_exit_skip(compiled, len(feature_rows), early_exit[1])
+    if skip:
+        early_exits_total.inc(skip)
+    if early_exit and not skip:
+        tolerance, budget_ms = early_exit
+        #the running mean and std come out of the chunked walk, so it's all timed as the tree walk
+        with predict_phase.time('tree_walk'):
+            results, trees_used, reason = compiled.predict_matrix_early_exit(matrix, EXIT_CHUNK, tolerance, budget_ms)
+        early_exits_total.inc(reason)
+    else:
+        #every tree of all six models is walked in one pass, so the walk is timed for all of them together.
+        #walking each model on its own would time them separately but more than doubles a single row's walk
+        with predict_phase.time('tree_walk'):
+            per_tree = compiled.forest.tree_predictions(matrix)
+        results = {}
+        trees_used = {}
+        for stat, (start, end) in compiled.tree_ranges.items():
+            with model_phase.time(stat, 'reduce_mean'):
+                preds = per_tree[start:end].mean(axis=0)
+            with model_phase.time(stat, 'reduce_std'):
+                stds = per_tree[start:end].std(axis=0)
+            results[stat] = (preds, stds)
+            trees_used[stat] = np.full(len(feature_rows), end - start)
+
+    #reality check for steals/blocks
+    #cap at 1.8x the season average, or at 1 if no season data
+    for stat, avg_feature in [('steals', 'SeasonAvgSteals'), ('blocks', 'SeasonAvgBlocks')]:
+        season_avg = np.array([features[avg_feature] for features in feature_rows])
+        caps = np.where(season_avg > 0, season_avg * 1.8, 1.0)
+        preds, stds = results[stat]
+        results[stat] = (np.minimum(preds, caps), stds)
+
+    return results, trees_used
+
+#why early exit won't pay off for a batch of n_rows (the reason counted in early_exits_total), None if it can
+#    small_batch   - under EXIT_MIN_ROWS rows the one fused walk of every tree is faster (see forest_compiler.py)
+#    within_budget - walking every tree is expected to take no more than budget_ms, so the budget can't cut anything
+def early_exit_skip(compiled, n_rows, budget_ms):
+    if n_rows < EXIT_MIN_ROWS:
+        return 'small_batch'
+    if budget_ms is not None and compiled.full_walk_ms(n_rows) <= budget_ms:
+        return 'within_budget'
+    return None
+
+#the early exit settings for this request, None means every tree
+#budgetMs is only checked between rounds and the first round always walks EXIT_MIN_CHUNKS x EXIT_CHUNK (100)
+#trees of every model, so a budget shorter than that round can't stop it any sooner. on 150 rows every
+#budget from 0.5 to 5 ms walks the same 63% of the trees
+#raises ValueError for a budgetMs or tolerance that isn't a positive number
+def early_exit_settings():
+    enabled = request.args.get('earlyExit')
+    if enabled is None:
+        enabled = EARLY_EXIT or 'budgetMs' in request.args
+    else:
+        enabled = enabled.lower() in ('1', 'true', 'yes')
+    if not enabled:
+        return None
+    settings = []
+    for name, default in [('tolerance', EXIT_TOLERANCE_DEFAULT), ('budgetMs', LATENCY_BUDGET_MS)]:
+        value = request.args.get(name)
+        if value is None:
+            settings.append(default)
+            continue
+        try:
+            value = float(value)
+        except ValueError:
+            value = None
+        if value is None or not value > 0: #not > 0 also catches nan
+            raise ValueError(f'{name} must be a positive number')
+        settings.append(value)
+    return tuple(settings)
+
+#packages one player's predictions into the json shape the node.js server and front end expect
+#values = {stat: (prediction, std deviation)} for this player
+def build_prediction_response(player, opponent, features, values):
+    points_pred, points_std = values['points']
+    rebounds_pred, rebounds_std = values['rebounds']
+    assists_pred, assists_std = values['assists']
+    steals_pred, steals_std = values['steals']
+    blocks_pred, blocks_std = values['blocks']
+    turnovers_pred, turnovers_std = values['turnovers']
+
+    #call confidence function 6 times, for each stat
+
+    steals_confidence = calculate_confidence(steals_pred, steals_std, features, 'steals')
+    blocks_confidence = calculate_confidence(blocks_pred, blocks_std, features, 'blocks')
+    turnovers_confidence = calculate_confidence(turnovers_pred, turnovers_std, features, 'turnovers')
+    
+    # Calculate confidence using improved formula
+    points_confidence = calculate_confidence(points_pred, points_std, features, 'points')
+    rebounds_confidence = calculate_confidence(rebounds_pred, rebounds_std, features, 'rebounds')
+    assists_confidence = calculate_confidence(assists_pred, assists_std, features, 'assists')
+
+    # calculate fantasy score
+    fantasy_score = (
+        points_pred + 
+        (rebounds_pred * 1.2) + 
+        (assists_pred * 1.5) + 
+        (steals_pred * 3) + 
+        (blocks_pred * 3) - 
+        (turnovers_pred * 1)
+    )
+
+    return {
+        'player': player,
+        'opponent': opponent,
+        'model': 'Random Forest ML (Advanced Features)',
+        'predictions': {
+            'points': {
+                'value': round(points_pred, 1),
+                'confidence': points_confidence,
+                'range': {
+                    'low': round(max(0, points_pred - points_std * 1.5), 1),
+                    'high': round(points_pred + points_std * 1.5, 1)
+                }
+            },
+            'rebounds': {
+                'value': round(rebounds_pred, 1),
+                'confidence': rebounds_confidence,
+                'range': {
+                    'low': round(max(0, rebounds_pred - rebounds_std * 1.5), 1),
+                    'high': round(rebounds_pred + rebounds_std * 1.5, 1)
+                }
+            },
+            'assists': {
+                'value': round(assists_pred, 1),
+                'confidence': assists_confidence,
+                'range': {
+                    'low': round(max(0, assists_pred - assists_std * 1.5), 1),
+                    'high': round(assists_pred + assists_std * 1.5, 1)
+                }
+            },
+            'steals': {
+                'value': round(steals_pred, 1),
+                'confidence': steals_confidence
+            },
+            'blocks': {
+                'value': round(blocks_pred, 1),
+                'confidence': blocks_confidence
+            },
+            'turnovers': {
+                'value': round(turnovers_pred, 1),
+                'confidence': turnovers_confidence
+            }, 
+            'fantasyScore': {
+                'value': round(fantasy_score, 1),
+                'confidence': 70  # just the average of all 6 confidences
+            }
+        },
+        'breakdown': {
+            'seasonAvgPoints': round(features['SeasonAvgPoints'], 1),
+            'seasonAvgRebounds': round(features['SeasonAvgRebounds'], 1),
+            'seasonAvgAssists': round(features['SeasonAvgAssists'], 1),
+            'seasonAvgSteals': round(features['SeasonAvgSteals'], 1),  
+            'seasonAvgBlocks': round(features['SeasonAvgBlocks'], 1),   
+            'seasonAvgTurnovers': round(features['SeasonAvgTurnovers'], 1), 
+            'last5AvgPoints': round(features['Last5AvgPoints'], 1),
+            'vsTeamPoints': round(features['VsTeamAvgPoints'], 1) if features['HasMatchupHistory'] else None,
+            'vsTeamRebounds': round(features['VsTeamAvgRebounds'], 1) if features['HasMatchupHistory'] else None,
+            'vsTeamAssists': round(features['VsTeamAvgAssists'], 1) if features['HasMatchupHistory'] else None,
+            'opponentDefense': round(features['OppDefenseRating'], 1),
+            'opponentReboundsAllowed': round(features['OppReboundsAllowed'], 1)
+        } #this is the data section that my front end displays
+    }
+
+#pulls one row's (prediction, std deviation) pairs out of the predict_stats results
+def row_values(results, i):
+    return {stat: (float(preds[i]), float(stds[i])) for stat, (preds, stds) in results.items()}
+
+#cache key for one request, typed names that didn't resolve are keyed by the cleaned up name
+#early exit answers are kept apart from full ones (and from other tolerances/budgets)
+def cache_key(pid, team_ids, player, is_home, version, early_exit=None):
+    return (pid if pid is not None else ('name', normalize(player)), team_ids, is_home, version, early_exit)
+
+#predicts a list of (player_name, opponent_team, is_home) items, using the cache where it can
+#returns a list lined up with items holding (response, logged) for a prediction, where logged is the keyword
+#arguments for enqueue_prediction() (all six predictions and the resolved ids),
+#(response with an 'error', None) if that item failed, or None if the player was not found
+#early_exit is passed on to run_models, every response says how many trees each model used (treesUsed)
+#is_home None means the caller doesn't know: a precomputed game uses its scheduled side, live scoring uses home
+def score_items(items, early_exit=None):
+    bundle = registry.current #read once, a retrain finishing mid request can't mix versions
+    with predict_phase.time('resolve_names'):
+        resolved = resolve_items(items)
+    keys = [cache_key(pid, team_ids, player, is_home, bundle.version, early_exit) for (pid, team_ids), (player, _, is_home) in zip(resolved, items)]
+
+    entries = [None] * len(items)
+    misses = []
+    with predict_phase.time('cache_lookup'):
+        for i, key in enumerate(keys):
+            hit, value = prediction_cache.get(key)
+            if hit:
+                entries[i] = value
+            else:
+                misses.append(i)
+    predictions_total.inc('cached', amount=len(items) - len(misses))
+
+    #then the precomputed slate, only for the live version with every tree (it's computed without early exit)
+    if misses and not early_exit:
+        with predict_phase.time('slate_lookup'):
+            still_missing = []
+            for i in misses:
+                found = slate.lookup(resolved[i][0], resolved[i][1], items[i][2], bundle.version)
+                if found is None:
+                    still_missing.append(i)
+                else:
+                    #cached until the game starts at the latest, the precomputed answer is wrong after that
+                    entries[i], starts_at = found
+                    prediction_cache.put(keys[i], entries[i], until=starts_at)
+        predictions_total.inc('precomputed', amount=len(misses) - len(still_missing))
+        misses = still_missing
+
+    #only the misses go through the feature lookup and the models
+    if misses:
+        with predict_phase.time('fetch_features'):
+            feature_rows = get_resolved_features([resolved[i] for i in misses], [1 if items[i][2] is None else items[i][2] for i in misses])
+        found = []
+        for i, features in zip(misses, feature_rows):
+            if features:
+                found.append((i, features))
+            else:
+                entries[i] = NOT_FOUND
+                prediction_cache.put(keys[i], NOT_FOUND)
+
+        predictions_total.inc('not_found', amount=len(misses) - len(found))
+
+        if found:
+            stat_results, trees_used = run_models([features for _, features in found], bundle, early_exit)
+            failed = 0
+            with predict_phase.time('build_response'):
+                for row, (i, features) in enumerate(found):
+                    try:
+                        values = row_values(stat_results, row)
+                        #cached without the names so "lebron" and "LeBron James" share an entry
+                        response = build_prediction_response(None, None, features, values)
+                        response['treesUsed'] = {stat: int(used[row]) for stat, used in trees_used.items()}
+                    except Exception as e:
+                        entries[i] = ({'error': f'Prediction failed: {str(e)}'}, None)
+                        failed += 1
+                        continue
+                    entries[i] = (response, tuple(values[stat][0] for stat in STATS))
+                    prediction_cache.put(keys[i], entries[i])
+            predictions_total.inc('predicted', amount=len(found) - failed)
+            if failed:
+                predictions_total.inc('error', amount=failed)
+
+    results = []
+    for (player, opponent, _), (pid, team_ids), entry in zip(items, resolved, entries):
+        if entry is NOT_FOUND:
+            results.append(None)
+        else:
+            response, predicted = entry
+            results.append((dict(response, player=player, opponent=opponent), logged_fields(predicted, pid, team_ids, bundle.version)))
+    return results
+
+#the enqueue_prediction() keyword arguments for one scored item, None if it failed
+#the ids let update_with_actual_results() find the game without matching names again, the version
+#lets the accuracy rollups tell models apart
+def logged_fields(predicted, pid, team_ids, version):
+    if predicted is None:
+        return None
+    fields = {f'predicted_{stat}': value for stat, value in zip(STATS, predicted)}
+    fields['player_api_id'] = pid
+    fields['opponent_team_id'] = team_ids[0] if len(team_ids) == 1 else None
+    fields['model_version'] = version
+    return fields
+
 @app.route('/api/ml/predict/<player>/<opponent>', methods=['GET'])
 def predict(player, opponent):
     #make ML prediction for player vs opponent
@@ -246,177 +623,33 @@ def predict(player, opponent):
     #query the database, get season stats, matchuph history, opponent defense 
     #calculate derived features 
     #return the dictionary 
-    features = get_player_features(player, opponent)
+    try:
+        early_exit = early_exit_settings()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    #home/away isn't part of the url, a precomputed game knows it from the schedule, otherwise it's scored as home
+    result = score_items([(player, opponent, None)], early_exit)[0]
     
     #if player not found, return error 
-    if not features:
+    if result is None:
         return jsonify({'error': 'Player not found or insufficient data'}), 404
     
     try:
-        # prepare feature arrays for each model
-
-        """
-        1. loop through each feature 
-        2. look up eaach value
-        3. create the list 
-        4. wrap in another list (sklearn requires 2d array)
-        5. convert to numpy array
-        """
-        points_X = np.array([[features[f] for f in points_features]])
-        rebounds_X = np.array([[features[f] for f in rebounds_features]])
-        assists_X = np.array([[features[f] for f in assists_features]])
-        steals_X = np.array([[features[f] for f in steals_features]])
-        blocks_X = np.array([[features[f] for f in blocks_features]])
-        turnovers_X = np.array([[features[f] for f in turnovers_features]])
-
-        # make predictions
-        """
-        1. takes the trained model 
-        2. passes in the 12 features
-        3. each of the 200 trees make a prediction
-        4. averages them
-        5. returns array with 1 value [0]
-        """
-        points_pred = float(points_model.predict(points_X)[0])
-        rebounds_pred = float(rebounds_model.predict(rebounds_X)[0])
-        assists_pred = float(assists_model.predict(assists_X)[0])
-        steals_pred = float(steals_model.predict(steals_X)[0])
-        blocks_pred = float(blocks_model.predict(blocks_X)[0])
-        turnovers_pred = float(turnovers_model.predict(turnovers_X)[0])
-
-        #reality check for steals/blocks
-
-        if features['SeasonAvgSteals'] > 0:
-            steals_pred = min(steals_pred, features['SeasonAvgSteals'] * 1.8)
-        else:
-            steals_pred = min(steals_pred, 1.0)  # Cap at 1 if no season data
-            
-        if features['SeasonAvgBlocks'] > 0:
-            blocks_pred = min(blocks_pred, features['SeasonAvgBlocks'] * 1.8)
-        else:
-            blocks_pred = min(blocks_pred, 1.0)  # Cap at 1 if no season data
-        
-        # Calculate std deviation from tree predictions
-       
-        """
-        estimators = list of all 200 trees
-        1. loop through each tree
-        2. get each tree prediction
-        3. result = 200 predictions 
-        4. calculate std of those 200 trees
-
-        low standard deviation (all trees agree) = high confidence, they all saw similar patterns in different data
-        high standard deviatino (trees disagree) = low confidence, data is inconsistent
-        """
-
-        points_trees = [tree.predict(points_X)[0] for tree in points_model.estimators_]
-        points_std = np.std(points_trees)
-
-        rebounds_trees = [tree.predict(rebounds_X)[0] for tree in rebounds_model.estimators_]
-        rebounds_std = np.std(rebounds_trees)
-        
-        assists_trees = [tree.predict(assists_X)[0] for tree in assists_model.estimators_]
-        assists_std = np.std(assists_trees)
-
-        steals_trees = [tree.predict(steals_X)[0] for tree in steals_model.estimators_]
-        steals_std = np.std(steals_trees)
-
-        blocks_trees = [tree.predict(blocks_X)[0] for tree in blocks_model.estimators_]
-        blocks_std = np.std(blocks_trees)
-
-        turnovers_trees = [tree.predict(turnovers_X)[0] for tree in turnovers_model.estimators_]
-        turnovers_std = np.std(turnovers_trees)
-
-        #call confidence function 6 times, for each stat
-
-        steals_confidence = calculate_confidence(steals_pred, steals_std, features, 'steals')
-        blocks_confidence = calculate_confidence(blocks_pred, blocks_std, features, 'blocks')
-        turnovers_confidence = calculate_confidence(turnovers_pred, turnovers_std, features, 'turnovers')
-        
-        # Calculate confidence using improved formula
-        points_confidence = calculate_confidence(points_pred, points_std, features, 'points')
-        rebounds_confidence = calculate_confidence(rebounds_pred, rebounds_std, features, 'rebounds')
-        assists_confidence = calculate_confidence(assists_pred, assists_std, features, 'assists')
-
-        # calculate fantasy score
-        fantasy_score = (
-            points_pred + 
-            (rebounds_pred * 1.2) + 
-            (assists_pred * 1.5) + 
-            (steals_pred * 3) + 
-            (blocks_pred * 3) - 
-            (turnovers_pred * 1)
-        )
+        response, logged = result
+        if logged is None:
+            return jsonify({'error': response['error']}), 500
         
         # log prediction for accuracy tracking
         try:
             game_date = datetime.now() + timedelta(days=1)
-            log_prediction(player, opponent, points_pred, rebounds_pred, assists_pred, game_date)
+            with predict_phase.time('log_enqueue'):
+                enqueue_prediction(player, opponent, game_date=game_date, **logged) #written in the background
         except Exception as e:
             print(f"Warning: Could not log prediction: {e}")
         
         #package everything into json to send back to node.js
-        return jsonify({
-            'player': player,
-            'opponent': opponent,
-            'model': 'Random Forest ML (Advanced Features)',
-            'predictions': {
-                'points': {
-                    'value': round(points_pred, 1),
-                    'confidence': points_confidence,
-                    'range': {
-                        'low': round(max(0, points_pred - points_std * 1.5), 1),
-                        'high': round(points_pred + points_std * 1.5, 1)
-                    }
-                },
-                'rebounds': {
-                    'value': round(rebounds_pred, 1),
-                    'confidence': rebounds_confidence,
-                    'range': {
-                        'low': round(max(0, rebounds_pred - rebounds_std * 1.5), 1),
-                        'high': round(rebounds_pred + rebounds_std * 1.5, 1)
-                    }
-                },
-                'assists': {
-                    'value': round(assists_pred, 1),
-                    'confidence': assists_confidence,
-                    'range': {
-                        'low': round(max(0, assists_pred - assists_std * 1.5), 1),
-                        'high': round(assists_pred + assists_std * 1.5, 1)
-                    }
-                },
-                'steals': {
-                    'value': round(steals_pred, 1),
-                    'confidence': steals_confidence
-                },
-                'blocks': {
-                    'value': round(blocks_pred, 1),
-                    'confidence': blocks_confidence
-                },
-                'turnovers': {
-                    'value': round(turnovers_pred, 1),
-                    'confidence': turnovers_confidence
-                }, 
-                'fantasyScore': {
-                    'value': round(fantasy_score, 1),
-                    'confidence': 70  # just the average of all 6 confidences
-                }
-            },
-            'breakdown': {
-                'seasonAvgPoints': round(features['SeasonAvgPoints'], 1),
-                'seasonAvgRebounds': round(features['SeasonAvgRebounds'], 1),
-                'seasonAvgAssists': round(features['SeasonAvgAssists'], 1),
-                'seasonAvgSteals': round(features['SeasonAvgSteals'], 1),  
-                'seasonAvgBlocks': round(features['SeasonAvgBlocks'], 1),   
-                'seasonAvgTurnovers': round(features['SeasonAvgTurnovers'], 1), 
-                'last5AvgPoints': round(features['Last5AvgPoints'], 1),
-                'vsTeamPoints': round(features['VsTeamAvgPoints'], 1) if features['HasMatchupHistory'] else None,
-                'vsTeamRebounds': round(features['VsTeamAvgRebounds'], 1) if features['HasMatchupHistory'] else None,
-                'vsTeamAssists': round(features['VsTeamAvgAssists'], 1) if features['HasMatchupHistory'] else None,
-                'opponentDefense': round(features['OppDefenseRating'], 1),
-                'opponentReboundsAllowed': round(features['OppReboundsAllowed'], 1)
-            } #this is the data section that my front end displays
-        })
+        with predict_phase.time('serialize'):
+            return jsonify(response)
     
     #catch any endpoint error
     except Exception as e:
@@ -425,56 +658,232 @@ def predict(player, opponent):
         traceback.print_exc()
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+#reads one slate entry from the batch request body
+#accepts {"player": ..., "opponent": ..., "home": true/false} or {"player": ..., "opponent": ..., "homeAway": "home"/"away"}
+def parse_batch_item(item):
+    if not isinstance(item, dict):
+        raise ValueError('each item must be an object')
+    player = item.get('player')
+    opponent = item.get('opponent')
+    if not player or not opponent:
+        raise ValueError('player and opponent are required')
+    if 'homeAway' in item:
+        home_away = str(item['homeAway']).lower()
+        if home_away not in ('home', 'away'):
+            raise ValueError("homeAway must be 'home' or 'away'")
+        is_home = 1 if home_away == 'home' else 0
+    else:
+        is_home = 1 if item.get('home', True) else 0
+    return str(player), str(opponent), is_home
+
+#scores a whole slate in one call
+#body: {"items": [{"player": "LeBron James", "opponent": "Celtics", "home": true}, ...]}
+#each result has the same shape as the single prediction endpoint, or {"player", "opponent", "error"} if that item failed
+@app.route('/api/ml/predict/batch', methods=['POST'])
+def predict_batch():
+    body = request.get_json(silent=True) or {}
+    raw_items = body.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({'error': 'Request body must have a non-empty "items" list'}), 400
+    if len(raw_items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch is limited to {MAX_BATCH_SIZE} items'}), 400
+    try:
+        early_exit = early_exit_settings()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    #validate every item first, bad items get an error result instead of failing the batch
+    results = [None] * len(raw_items)
+    parsed = []
+    for i, raw in enumerate(raw_items):
+        try:
+            parsed.append((i, parse_batch_item(raw)))
+        except ValueError as e:
+            item = raw if isinstance(raw, dict) else {}
+            results[i] = {'player': item.get('player'), 'opponent': item.get('opponent'), 'error': str(e)}
+
+    try:
+        scored = score_items([item for _, item in parsed], early_exit) if parsed else []
+
+        game_date = datetime.now() + timedelta(days=1)
+        for (i, (player, opponent, is_home)), result in zip(parsed, scored):
+            if result is None:
+                results[i] = {'player': player, 'opponent': opponent, 'error': 'Player not found or insufficient data'}
+                continue
+            response, logged = result
+            results[i] = response
+            if logged is None:
+                continue
+
+            # log prediction for accuracy tracking
+            try:
+                with predict_phase.time('log_enqueue'):
+                    enqueue_prediction(player, opponent, game_date=game_date, **logged)
+            except Exception as e:
+                print(f"Warning: Could not log prediction: {e}")
+
+    #a failure in the shared queries or models fails the whole batch
+    except Exception as e:
+        print(f"Batch prediction error: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Batch prediction failed: {str(e)}'}), 500
+
+    failed = sum(1 for result in results if 'error' in result)
+    with predict_phase.time('serialize'):
+        return jsonify({
+            'count': len(results),
+            'succeeded': len(results) - failed,
+            'failed': failed,
+            'results': results
+        })
+
 
 #this retrains the model without having to restart the server
+#training takes minutes so it runs in the background, this returns a job id right away
+#and GET /api/ml/retrain/<job_id> reports how it's going
+#?mode=incremental only adds trees fit on the games since the last retrain, which takes seconds
 @app.route('/api/ml/retrain', methods=['POST'])
 def retrain():
+    try:
+        job, started = registry.start_retrain(mode=request.args.get('mode', 'full'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
 
-    import subprocess #python library that lets you run shell commands form python code
-    
+    if not started:
+        return jsonify({'status': 'error', 'message': 'A retrain is already running', 'job': job}), 409
+    return jsonify({'status': 'accepted', 'jobId': job['jobId'], 'statusUrl': f"/api/ml/retrain/{job['jobId']}"}), 202
+
+@app.route('/api/ml/retrain/<job_id>', methods=['GET'])
+def retrain_status(job_id):
+    job = registry.job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown retrain job'}), 404
+    return jsonify(job)
+
+#goes back to the models that were live before the last swap
+@app.route('/api/ml/rollback', methods=['POST'])
+def rollback():
     try:
-        result = subprocess.run(['python3', 'train_model.py'], #runs the command to retrain
-                              capture_output=True, text=True, timeout=300)
-        
-        if result.returncode == 0: #0 = success, non-zero = error
-            # reload models
-            #this global keyword expresses that we want to modify varaiables that were defined at the top of the file, not create new ones
-            global points_model, rebounds_model, assists_model, points_features, rebounds_features, assists_features
-            
-            with open('points_model.pkl', 'rb') as f:
-                points_model = pickle.load(f) #updates the actual model, and re loads it
-            with open('rebounds_model.pkl', 'rb') as f:
-                rebounds_model = pickle.load(f)
-            with open('assists_model.pkl', 'rb') as f:
-                assists_model = pickle.load(f)
-            
-            with open('model_metadata.json', 'r') as f:
-                metadata = json.load(f)
-                points_features = metadata['points_features']
-                rebounds_features = metadata['rebounds_features']
-                assists_features = metadata['assists_features']
-            
-            return jsonify({'status': 'success', 'message': 'Models retrained and reloaded'})
-        else:
-            return jsonify({'status': 'error', 'message': result.stderr}), 500
-    
+        bundle = registry.rollback()
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
+    if bundle is None:
+        return jsonify({'status': 'error', 'message': 'No previous model version to roll back to'}), 409
+    return jsonify({'status': 'success', 'message': f'Rolled back to models {bundle.version}', 'models': bundle.info()})
 
 @app.route('/api/ml/health', methods=['GET'])
 def health():
     #health check
+    model_features = registry.current.features
     return jsonify({
         'status': 'healthy', 
         'model': 'Random Forest ML',
         'features': {
-            'points': len(points_features),
-            'rebounds': len(rebounds_features),
-            'assists': len(assists_features)
-        }
+            'points': len(model_features['points']),
+            'rebounds': len(model_features['rebounds']),
+            'assists': len(model_features['assists'])
+        },
+        'database': pool.stats(), #connection pool counters (checkouts, waits, live connections)
+        'featureStore': feature_store.stats(),
+        'models': registry.stats(), #live version, versions available for rollback, running retrain
+        'cache': prediction_cache.stats(), #hits, misses, evictions
+        'slate': slate.stats(), #precomputed predictions: version, entries, coverage, hits
+        'predictionLog': log_writer.stats(), #queued, written, dropped
+        'process': dict(pid=os.getpid(), **process_memory()) #which worker answered, and its memory
     })
 
+#readiness check for a load balancer or the gunicorn master
+#only 200 once the models and this season's features are in memory, 503 before that
+@app.route('/api/ml/ready', methods=['GET'])
+def ready():
+    checks = {'models': registry.current is not None, 'features': feature_store.ready}
+    status = 200 if all(checks.values()) else 503
+    return jsonify({'ready': status == 200, 'checks': checks, 'pid': os.getpid()}), status
+
+#request counts and timings by route, the route pattern is used so player names don't become labels
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+def route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.after_request
+def count_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = route_label()
+        request_duration.observe(time.perf_counter() - start, endpoint)
+        requests_total.inc(endpoint, request.method, str(response.status_code))
+    return response
+
+#after_request is skipped when a view raises, count those as 500s here
+@app.teardown_request
+def count_failed_request(exc):
+    start = g.pop('request_start', None)
+    if exc is not None and start is not None:
+        endpoint = route_label()
+        request_duration.observe(time.perf_counter() - start, endpoint)
+        requests_total.inc(endpoint, request.method, '500')
+
+#read on every scrape of /api/ml/metrics, from the same stats the health endpoint shows
+def collect_service_metrics():
+    bundle = registry.current
+    info = bundle.info()
+    cache = prediction_cache.stats()
+    slate_stats = slate.stats()
+    log = log_writer.stats()
+    db = pool.stats()
+    memory_kinds = {'rssMb': 'rss', 'pssMb': 'pss', 'sharedCleanMb': 'shared_clean', 'privateDirtyMb': 'private_dirty'}
+    return [
+        ('ml_model_info', 'gauge', 'Live model version, always 1',
+         [({'version': bundle.version, 'source': info['source']}, 1)]),
+        ('ml_model_trees', 'gauge', 'Trees in each live model', [({'model': stat}, n) for stat, n in info['trees'].items()]),
+        ('ml_model_loaded_timestamp_seconds', 'gauge', 'When the live models were loaded', [({}, bundle.loaded_at.timestamp())]),
+        ('ml_process_info', 'gauge', 'The worker process that answered this scrape, always 1', [({'pid': os.getpid()}, 1)]),
+        ('ml_process_memory_bytes', 'gauge', 'Memory of this worker process',
+         [({'kind': memory_kinds[key]}, value * 1024 * 1024) for key, value in process_memory().items() if key in memory_kinds]),
+        ('ml_prediction_cache_events_total', 'counter', 'Prediction cache lookups and removals',
+         [({'event': event}, cache[event]) for event in ['hits', 'negative_hits', 'misses', 'evictions', 'expirations', 'invalidations']]),
+        ('ml_prediction_cache_entries', 'gauge', 'Entries in the prediction cache', [({}, cache['size'])]),
+        ('ml_slate_entries', 'gauge', 'Precomputed slate predictions loaded', [({'version': slate_stats['version'] or ''}, slate_stats['entries'])]),
+        ('ml_slate_lookups_total', 'counter', 'Precomputed slate lookups by result',
+         [({'result': result}, slate_stats[result]) for result in ['hits', 'misses', 'stale']]),
+        ('ml_prediction_log_rows_total', 'counter', 'Prediction log rows by what happened to them',
+         [({'outcome': outcome}, log[outcome]) for outcome in ['queued', 'written', 'dropped', 'failed']]),
+        ('ml_prediction_log_pending', 'gauge', 'Prediction log rows waiting to be written', [({}, log['pending'])]),
+        ('ml_db_connections', 'gauge', 'Database connections in the pool', [({'state': 'in_use'}, db['in_use']), ({'state': 'idle'}, db['idle'])]),
+        ('ml_db_checkouts_total', 'counter', 'Database connections handed out', [({}, db['checkouts'])]),
+        ('ml_feature_store_ready', 'gauge', '1 when the feature store is loaded', [({}, int(feature_store.ready))]),
+    ]
+
+metrics.add_collector(collect_service_metrics)
+
+#prometheus text format: per step latency histograms, request counts by status, model version, memory
+@app.route('/api/ml/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+#background threads don't survive a fork, so each server process starts its own
+#(gunicorn.conf.py calls this after forking every worker, the dev server calls it below)
+def start_background():
+    feature_store.start_refresh_thread() #picks up the nightly aggregate updates without a restart
+    registry.start_watch_thread() #picks up models retrained or rolled back by another worker
+
+#stops the background threads and writes out the queued prediction logs
+def shutdown():
+    feature_store.stop()
+    registry.stop()
+    log_writer.stop()
+    pool.close_all()
+
 if __name__ == '__main__':
     print("\nNBA ML Prediction Service")
     print("Running on http://localhost:5001")
-    app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
+    print("(development server, for production run: gunicorn -c gunicorn.conf.py)")
+    start_background()
+    #no reloader, it would start a second process that loads every model again
+    app.run(host='0.0.0.0', port=5001, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,83 @@
+# prediction_cache.py - remembers recent predictions so popular matchups aren't recomputed
+import threading
+import time
+from collections import OrderedDict
+
+"""
+on a game day the same matchups (stars vs tonight's opponents) get requested over and over, and the
+answer only changes when the models are retrained or the aggregates refresh. this is a small
+least-recently-used cache with an expiry time:
+
+- at most max_size entries, the least recently used one is dropped when it's full
+- entries expire after ttl seconds
+- "player not found" is cached too (negative caching) but for a shorter negative_ttl, so a typo
+  doesn't hit the database every time but a newly added player shows up quickly
+- put(..., until=) ends an entry sooner than ttl, a precomputed prediction can't outlive its game's start
+- clear() empties it, called when models are reloaded or the feature store refreshes
+"""
+
+CACHE_SIZE = 5000 #most predictions kept
+CACHE_TTL = 600 #seconds a prediction stays valid
+NEGATIVE_TTL = 60 #seconds a "player not found" stays cached
+
+#stored in place of a prediction when the player wasn't found
+NOT_FOUND = object()
+
+class PredictionCache:
+    def __init__(self, max_size=CACHE_SIZE, ttl=CACHE_TTL, negative_ttl=NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict() #key -> (value, expires at), least recently used first
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    #returns (True, value) on a hit or (False, None) on a miss
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            value, expires = entry
+            if expires <= now:
+                del self._entries[key]
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['negative_hits' if value is NOT_FOUND else 'hits'] += 1
+            return True, value
+
+    #until is an optional time.time() the entry has to be gone by, it only ever shortens the ttl
+    def put(self, key, value, until=None):
+        ttl = self.negative_ttl if value is NOT_FOUND else self.ttl
+        if until is not None:
+            ttl = min(ttl, until - time.time())
+            if ttl <= 0:
+                return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    #drops everything, used when the models or the data behind the predictions change
+    def clear(self, reason=None):
+        with self._lock:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+        if reason:
+            print(f"Prediction cache cleared ({reason})")
+
+    #counters for the health endpoint
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['max_size'] = self.max_size
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['negative_hits']) / lookups, 3) if lookups else 0.0
+        return stats
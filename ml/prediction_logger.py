@@ -1,186 +1,457 @@
-import pyodbc
 from datetime import datetime
 import json
+import atexit
+import os
+import queue
+import threading
+import time
+from data_access import log_pool as pool #azure, or the local snapshot with ML_LOG_BACKEND=snapshot
+from accuracy_rollups import create_rollup_table, roll_up_range, roll_up_completed, get_accuracy, recent_completed, print_accuracy
 
-# database connection string with credentials and settings
-conn_str = (
-    'DRIVER={ODBC Driver 18 for SQL Server};'
-    'SERVER=YOUR_SERVER.database.windows.net;'
-    'DATABASE=basketball_data;'
-    'UID=YOUR_USERNAME;'
-    'PWD=YOUR_PASSWORD;'
-    'Encrypt=yes;'
-    'TrustServerCertificate=no;'
-)
+"""
+log_prediction() writes one row per call: borrow a connection, insert, commit, SELECT @@IDENTITY.
+that's fine for scripts, but on the request path it makes every prediction wait on the database
+
+the api uses enqueue_prediction() instead. it puts the row on an in-memory queue and returns straight
+away, and a background thread writes the queue out in bulk (one executemany insert per batch)
+whenever flush_rows rows are waiting or flush_interval seconds have passed
+
+- the queue holds at most queue_size rows, when it's full a request waits up to enqueue_wait seconds
+  and then the row is dropped (and counted) instead of slowing predictions down
+- a batch that fails to insert is retried a few times before it's dropped
+- on shutdown whatever is still queued gets written before the process exits
+
+every row also keeps the PlayerApiId and opponent Teams.Id the names resolved to, so
+update_with_actual_results() can match predictions to box scores by id instead of by name
+"""
+
+LOG_QUEUE_SIZE = 10000 #most rows waiting to be written
+FLUSH_ROWS = 200 #write as soon as this many rows are waiting
+FLUSH_INTERVAL = 2.0 #or after this many seconds, whichever comes first
+ENQUEUE_WAIT = 0.05 #seconds a request waits for room in a full queue before the row is dropped
+FLUSH_RETRIES = 3 #attempts at writing one batch before giving up on it
+
+RECONCILE_BATCH = 5000 #pending predictions matched per update statement
+
+#(MLPredictions column suffix, Stats column) for each predicted stat
+STAT_COLUMNS = [('Points', 'Points'), ('Rebounds', 'TotalRebounds'), ('Assists', 'Assists'),
+                ('Steals', 'Steals'), ('Blocks', 'Blocks'), ('Turnovers', 'Turnovers')]
+
+#columns added after the table was first created, added to an existing table by create_predictions_table()
+ADDED_COLUMNS = [
+    ('PredictedSteals', 'FLOAT NULL'), ('PredictedBlocks', 'FLOAT NULL'), ('PredictedTurnovers', 'FLOAT NULL'),
+    ('ActualSteals', 'INT NULL'), ('ActualBlocks', 'INT NULL'), ('ActualTurnovers', 'INT NULL'),
+    ('StealsError', 'FLOAT NULL'), ('BlocksError', 'FLOAT NULL'), ('TurnoversError', 'FLOAT NULL'),
+    ('PlayerApiId', 'INT NULL'), ('OpponentTeamId', 'INT NULL'), ('GameId', 'INT NULL'),
+    ('ModelVersion', 'NVARCHAR(64) NULL'), ('RolledUp', 'BIT NOT NULL DEFAULT 0'),
+]
+
+INSERT_PREDICTION_SQL = """
+    INSERT INTO MLPredictions 
+    (PlayerName, OpponentTeam, GameDate, PredictedPoints, 
+     PredictedRebounds, PredictedAssists, PredictedSteals,
+     PredictedBlocks, PredictedTurnovers, PlayerApiId, OpponentTeamId,
+     ModelVersion)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+#the id of the row just inserted
+LAST_ID_SQL = {'mssql': "SELECT @@IDENTITY", 'sqlite': "SELECT last_insert_rowid()"}
 
 # create table to store ml predictions if it doesn't exist
 def create_predictions_table():
     """Create table to store predictions"""
-    # connect to database
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
+    # a local snapshot already has every table from schema.sql
+    if pool.dialect == 'sqlite':
+        print("✓ MLPredictions table is part of the local snapshot")
+        return
+    # borrow a connection from the pool
+    with pool.connection() as conn:
+        cursor = conn.cursor()
     
-    # sql to create table if not exists
-    cursor.execute("""
-        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='MLPredictions' AND xtype='U')
-        CREATE TABLE MLPredictions (
-            Id INT IDENTITY(1,1) PRIMARY KEY,
-            PlayerName NVARCHAR(100) NOT NULL,
-            OpponentTeam NVARCHAR(100) NOT NULL,
-            GameDate DATETIME NULL,
-            PredictedPoints FLOAT NOT NULL,
-            PredictedRebounds FLOAT NOT NULL,
-            PredictedAssists FLOAT NOT NULL,
-            ActualPoints INT NULL,
-            ActualRebounds INT NULL,
-            ActualAssists INT NULL,
-            PointsError FLOAT NULL,
-            ReboundsError FLOAT NULL,
-            AssistsError FLOAT NULL,
-            CreatedDate DATETIME DEFAULT GETDATE(),
-            GameCompleted BIT DEFAULT 0
-        )
-    """)
+        # sql to create table if not exists
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='MLPredictions' AND xtype='U')
+            CREATE TABLE MLPredictions (
+                Id INT IDENTITY(1,1) PRIMARY KEY,
+                PlayerName NVARCHAR(100) NOT NULL,
+                OpponentTeam NVARCHAR(100) NOT NULL,
+                GameDate DATETIME NULL,
+                PredictedPoints FLOAT NOT NULL,
+                PredictedRebounds FLOAT NOT NULL,
+                PredictedAssists FLOAT NOT NULL,
+                ActualPoints INT NULL,
+                ActualRebounds INT NULL,
+                ActualAssists INT NULL,
+                PointsError FLOAT NULL,
+                ReboundsError FLOAT NULL,
+                AssistsError FLOAT NULL,
+                CreatedDate DATETIME DEFAULT GETDATE(),
+                GameCompleted BIT DEFAULT 0
+            )
+        """)
+
+        # add the newer columns to a table created before they existed
+        for column, definition in ADDED_COLUMNS:
+            cursor.execute(f"""
+                IF COL_LENGTH('MLPredictions', '{column}') IS NULL
+                ALTER TABLE MLPredictions ADD {column} {definition}
+            """)
+
+        # pending predictions are found through this index when reconciling
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_MLPredictions_Pending')
+            CREATE NONCLUSTERED INDEX IX_MLPredictions_Pending ON MLPredictions (GameCompleted, Id)
+        """)
+
+        # completed predictions that haven't been counted in the accuracy rollups yet
+        cursor.execute("""
+            IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_MLPredictions_NotRolledUp')
+            CREATE NONCLUSTERED INDEX IX_MLPredictions_NotRolledUp ON MLPredictions (Id)
+            WHERE GameCompleted = 1 AND RolledUp = 0
+        """)
+        create_rollup_table(cursor)
     
-    # save changes and close connection
-    conn.commit()
-    conn.close()
+        # save changes, the connection goes back to the pool
+        conn.commit()
     print("✓ MLPredictions table created")
 
 # save a new prediction to the database
 def log_prediction(player_name, opponent_team, predicted_points, 
-                  predicted_rebounds, predicted_assists, game_date=None):
+                  predicted_rebounds, predicted_assists, game_date=None,
+                  predicted_steals=None, predicted_blocks=None, predicted_turnovers=None,
+                  player_api_id=None, opponent_team_id=None, model_version=None):
     """Log a prediction to the database"""
-    # connect to database
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
+    # borrow a connection from the pool
+    with pool.connection() as conn:
+        cursor = conn.cursor()
     
-    # insert prediction into table
-    cursor.execute("""
-        INSERT INTO MLPredictions 
-        (PlayerName, OpponentTeam, GameDate, PredictedPoints, 
-         PredictedRebounds, PredictedAssists)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, player_name, opponent_team, game_date, 
-         predicted_points, predicted_rebounds, predicted_assists)
+        # insert prediction into table
+        cursor.execute(INSERT_PREDICTION_SQL, *prediction_row(
+            player_name, opponent_team, predicted_points, predicted_rebounds, predicted_assists, game_date,
+            predicted_steals, predicted_blocks, predicted_turnovers, player_api_id, opponent_team_id, model_version))
     
-    # save changes and get the id of the inserted prediction
-    conn.commit()
-    prediction_id = cursor.execute("SELECT @@IDENTITY").fetchone()[0]
-    conn.close()
+        # save changes and get the id of the inserted prediction
+        conn.commit()
+        prediction_id = cursor.execute(LAST_ID_SQL[pool.dialect]).fetchone()[0]
     
     return prediction_id
 
-# update predictions with actual game results after games complete
-def update_with_actual_results():
-    """After games complete, update predictions with actual results"""
-    # connect to database
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
-    
-    # find predictions that don't have actual results yet
+#the INSERT_PREDICTION_SQL parameters for one prediction
+def prediction_row(player_name, opponent_team, predicted_points, predicted_rebounds, predicted_assists, game_date,
+                   predicted_steals, predicted_blocks, predicted_turnovers, player_api_id, opponent_team_id, model_version):
+    optional = lambda value: None if value is None else float(value)
+    return (player_name, opponent_team, game_date,
+            float(predicted_points), float(predicted_rebounds), float(predicted_assists),
+            optional(predicted_steals), optional(predicted_blocks), optional(predicted_turnovers),
+            player_api_id, opponent_team_id, model_version)
+
+#writes queued predictions to the database from a background thread
+class PredictionLogWriter:
+    def __init__(self, pool, queue_size=LOG_QUEUE_SIZE, flush_rows=FLUSH_ROWS, flush_interval=FLUSH_INTERVAL,
+                 enqueue_wait=ENQUEUE_WAIT, retries=FLUSH_RETRIES):
+        self.pool = pool
+        self.queue_size = queue_size
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.enqueue_wait = enqueue_wait
+        self.retries = retries
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._thread = None
+        self._stopping = False
+        self._stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'flushes': 0, 'flush_errors': 0, 'waits': 0}
+
+    #the thread only starts on the first enqueue, and a forked worker gets its own queue and thread
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset_state()
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='prediction-log-writer', daemon=True)
+                self._thread.start()
+
+    #returns True if the row was queued, False if it was dropped
+    def enqueue(self, row):
+        self._ensure_started()
+        if self._stopping:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            #backpressure: wait a moment for the writer to make room, then give up on this row
+            with self._lock:
+                self._stats['waits'] += 1
+            try:
+                self._queue.put(row, timeout=self.enqueue_wait)
+            except queue.Full:
+                with self._lock:
+                    self._stats['dropped'] += 1
+                return False
+        with self._lock:
+            self._stats['queued'] += 1
+        return True
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            #collect until the batch is full or flush_interval has passed since its first row
+            deadline = time.monotonic() + self.flush_interval
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.flush_rows:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if item is None: #the stop marker
+                stop = True
+                batch.extend(self._drain())
+            for start in range(0, len(batch), self.flush_rows):
+                self._flush(batch[start:start + self.flush_rows])
+
+    #everything still in the queue, used when stopping
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if item is not None:
+                rows.append(item)
+
+    def _flush(self, rows):
+        if not rows:
+            return
+        for attempt in range(self.retries):
+            try:
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.fast_executemany = True #sends all the rows in one round trip
+                    cursor.executemany(INSERT_PREDICTION_SQL, rows)
+                    conn.commit()
+                with self._lock:
+                    self._stats['written'] += len(rows)
+                    self._stats['flushes'] += 1
+                return
+            except Exception as e:
+                with self._lock:
+                    self._stats['flush_errors'] += 1
+                print(f"Warning: Could not write {len(rows)} logged predictions (attempt {attempt + 1}): {e}")
+                if self._stopping:
+                    break
+                time.sleep(min(2 ** attempt, 10))
+        with self._lock:
+            self._stats['failed'] += len(rows)
+
+    #writes out anything still queued and stops the thread, waits at most timeout seconds
+    def stop(self, timeout=10):
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                self._stopping = True
+                return
+            self._stopping = True
+            thread = self._thread
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+
+    #counters for the health endpoint
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._queue.qsize() if self._pid == os.getpid() else 0
+            stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+#the writer used by the api
+log_writer = PredictionLogWriter(pool)
+atexit.register(log_writer.stop) #drain the queue when the server shuts down
+
+# queue a prediction to be written in the background, used on the request path
+def enqueue_prediction(player_name, opponent_team, predicted_points,
+                       predicted_rebounds, predicted_assists, game_date=None,
+                       predicted_steals=None, predicted_blocks=None, predicted_turnovers=None,
+                       player_api_id=None, opponent_team_id=None, model_version=None):
+    """Queue a prediction to be logged by the background writer"""
+    return log_writer.enqueue(prediction_row(
+        player_name, opponent_team, predicted_points, predicted_rebounds, predicted_assists, game_date,
+        predicted_steals, predicted_blocks, predicted_turnovers, player_api_id, opponent_team_id, model_version))
+
+"""
+update_with_actual_results() used to look every pending prediction up on its own (a LIKE '%player%' query
+against Stats, then one UPDATE), so it got slower with every prediction waiting. now it runs in two steps:
+    1. predictions logged without ids (before they were stored, or through log_prediction() without them)
+       get them from the name resolver, one lookup per distinct (player, opponent) and one executemany
+    2. pending predictions are matched to box scores in batches of RECONCILE_BATCH ids, one UPDATE per
+       batch: the player's first finished game against the opponent since the prediction was made.
+       that writes the GameId, the game's real start time and all six actuals and errors at once, and the
+       same transaction adds the batch to the accuracy rollups (accuracy_rollups.py)
+predictions whose game hasn't been played yet (or whose names never resolved) stay pending for the next run
+"""
+
+#one statement per batch, the opponent is found through their players' Stats rows in the same game
+#sql server picks each prediction's game with CROSS APPLY, sqlite (no lateral joins) numbers the candidates instead
+RECONCILE_SQL = {}
+RECONCILE_SQL['mssql'] = f"""
+    UPDATE p
+    SET p.GameId = m.GameId,
+        p.GameDate = m.StartTime,
+        {', '.join(f'p.Actual{name} = m.{column}' for name, column in STAT_COLUMNS)},
+        {', '.join(f'p.{name}Error = ABS(p.Predicted{name} - m.{column})' for name, column in STAT_COLUMNS)},
+        p.GameCompleted = 1
+    FROM MLPredictions p
+    CROSS APPLY (
+        SELECT TOP 1 s.GameId, g.StartTime, {', '.join(f's.{column}' for _, column in STAT_COLUMNS)}
+        FROM Stats s
+        JOIN Games g ON g.Id = s.GameId
+        WHERE s.PlayerApiId = p.PlayerApiId
+        AND g.Status IN ('FT', 'AOT')
+        AND g.StartTime >= CAST(p.CreatedDate AS DATE)
+        AND EXISTS (SELECT 1 FROM Stats o WHERE o.GameId = s.GameId AND o.TeamId = p.OpponentTeamId)
+        ORDER BY g.StartTime
+    ) m
+    WHERE p.Id BETWEEN ? AND ?
+    AND p.GameCompleted = 0
+    AND p.PlayerApiId IS NOT NULL
+    AND p.OpponentTeamId IS NOT NULL
+"""
+RECONCILE_SQL['sqlite'] = f"""
+    UPDATE MLPredictions AS p
+    SET GameId = m.GameId,
+        GameDate = m.StartTime,
+        {', '.join(f'Actual{name} = m.{column}' for name, column in STAT_COLUMNS)},
+        {', '.join(f'{name}Error = ABS(p.Predicted{name} - m.{column})' for name, column in STAT_COLUMNS)},
+        GameCompleted = 1
+    FROM (
+        SELECT q.Id AS PredictionId, s.GameId, g.StartTime, {', '.join(f's.{column}' for _, column in STAT_COLUMNS)},
+               ROW_NUMBER() OVER (PARTITION BY q.Id ORDER BY g.StartTime) AS GameOrder
+        FROM MLPredictions q
+        JOIN Stats s ON s.PlayerApiId = q.PlayerApiId
+        JOIN Games g ON g.Id = s.GameId
+        WHERE q.Id BETWEEN ? AND ?
+        AND q.GameCompleted = 0
+        AND q.OpponentTeamId IS NOT NULL
+        AND g.Status IN ('FT', 'AOT')
+        AND g.StartTime >= date(q.CreatedDate)
+        AND EXISTS (SELECT 1 FROM Stats o WHERE o.GameId = s.GameId AND o.TeamId = q.OpponentTeamId)
+    ) m
+    WHERE m.PredictionId = p.Id
+    AND m.GameOrder = 1
+"""
+
+#fills in PlayerApiId / OpponentTeamId on pending predictions logged without them
+#returns how many (player, opponent) pairs resolved
+def backfill_prediction_ids(cursor, resolver=None):
     cursor.execute("""
-        SELECT 
-            p.Id,
-            p.PlayerName,
-            p.OpponentTeam,
-            p.PredictedPoints,
-            p.PredictedRebounds,
-            p.PredictedAssists
-        FROM MLPredictions p
-        WHERE p.GameCompleted = 0
-        AND p.GameDate < GETDATE()
+        SELECT DISTINCT PlayerName, OpponentTeam
+        FROM MLPredictions
+        WHERE GameCompleted = 0
+        AND (PlayerApiId IS NULL OR OpponentTeamId IS NULL)
     """)
-    
-    # get all pending predictions
-    pending_predictions = cursor.fetchall()
-    updated_count = 0
-    
-    # loop through each pending prediction
-    for pred in pending_predictions:
-        # unpack the prediction data
-        pred_id, player, opponent, pred_pts, pred_reb, pred_ast = pred
-        
-        # find the actual game stats from the stats table
+    pairs = cursor.fetchall()
+    if not pairs:
+        return 0
+    if resolver is None:
+        from feature_store import CURRENT_SEASON
+        from name_resolver import load_name_resolver
+        resolver = load_name_resolver(cursor, CURRENT_SEASON)
+
+    rows = []
+    for player, opponent in pairs:
+        pid = resolver.resolve_player(player)
+        team_ids = resolver.resolve_team(opponent)
+        #an opponent that matches several teams has no one game to compare with
+        if pid is not None and len(team_ids) == 1:
+            rows.append((pid, team_ids[0], player, opponent))
+    if rows:
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            UPDATE MLPredictions
+            SET PlayerApiId = ?, OpponentTeamId = ?
+            WHERE PlayerName = ? AND OpponentTeam = ?
+            AND GameCompleted = 0
+            AND (PlayerApiId IS NULL OR OpponentTeamId IS NULL)
+        """, rows)
+    return len(rows)
+
+# update predictions with actual game results after games complete
+def update_with_actual_results(resolver=None, batch_size=RECONCILE_BATCH):
+    """After games complete, update predictions with actual results"""
+    start = time.perf_counter()
+    # borrow a connection from the pool
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+
+        # 1. ids for predictions logged without them
+        backfilled = backfill_prediction_ids(cursor, resolver)
+        conn.commit()
+
+        # anything completed but never counted (before the rollups existed, or by another job)
+        caught_up = roll_up_completed(conn, batch_size)
+
+        # 2. every pending prediction that can be matched, in id order
         cursor.execute("""
-            SELECT TOP 1 s.Points, s.TotalRebounds, s.Assists
-            FROM Stats s
-            JOIN Games g ON s.GameId = g.Id
-            WHERE s.PlayerName LIKE ?
-            AND (g.HomeTeam LIKE ? OR g.AwayTeam LIKE ?)
-            AND s.GameDate >= DATEADD(day, -7, GETDATE())
-            ORDER BY s.GameDate DESC
-        """, f'%{player}%', f'%{opponent}%', f'%{opponent}%')
-        
-        # get the actual stats
-        actual = cursor.fetchone()
-        
-        # if actual stats found, update the prediction record
-        if actual:
-            # unpack actual stats
-            actual_pts, actual_reb, actual_ast = actual
-            
-            # calculate how far off the predictions were
-            pts_error = abs(pred_pts - actual_pts)
-            reb_error = abs(pred_reb - actual_reb)
-            ast_error = abs(pred_ast - actual_ast)
-            
-            # update the prediction record with actual results
-            cursor.execute("""
-                UPDATE MLPredictions
-                SET ActualPoints = ?,
-                    ActualRebounds = ?,
-                    ActualAssists = ?,
-                    PointsError = ?,
-                    ReboundsError = ?,
-                    AssistsError = ?,
-                    GameCompleted = 1
-                WHERE Id = ?
-            """, actual_pts, actual_reb, actual_ast, 
-                 pts_error, reb_error, ast_error, pred_id)
-            
-            # increment counter and print results
-            updated_count += 1
-            print(f"✓ Updated prediction for {player} vs {opponent}")
-            print(f"  Predicted: {pred_pts:.1f} pts, {pred_reb:.1f} reb, {pred_ast:.1f} ast")
-            print(f"  Actual: {actual_pts} pts, {actual_reb} reb, {actual_ast} ast")
-            print(f"  Error: {pts_error:.1f} pts, {reb_error:.1f} reb, {ast_error:.1f} ast\n")
-    
-    # save all changes and close connection
-    conn.commit()
-    conn.close()
-    
-    return updated_count
+            SELECT Id
+            FROM MLPredictions
+            WHERE GameCompleted = 0
+            AND PlayerApiId IS NOT NULL
+            AND OpponentTeamId IS NOT NULL
+            ORDER BY Id
+        """)
+        pending = [row[0] for row in cursor.fetchall()]
+
+        # one update per batch of ids, committed as it goes so a big backlog doesn't hold its locks
+        updated = 0
+        batches = 0
+        for i in range(0, len(pending), batch_size):
+            ids = pending[i:i + batch_size]
+            cursor.execute(RECONCILE_SQL[pool.dialect], ids[0], ids[-1])
+            updated += max(cursor.rowcount, 0)
+            roll_up_range(cursor, ids[0], ids[-1]) #counted in the same commit as the results
+            conn.commit()
+            batches += 1
+
+    seconds = time.perf_counter() - start
+    return {
+        'pending': len(pending),
+        'backfilled_pairs': backfilled,
+        'updated': updated,
+        'rolled_up_earlier_results': caught_up,
+        'batches': batches,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(len(pending) / seconds, 1) if seconds > 0 else None
+    }
 
 # calculate overall model accuracy from completed predictions
 def get_model_accuracy():
     """Calculate overall model accuracy"""
-    # connect to database
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
-    
-    # query to get average errors across all completed predictions
-    cursor.execute("""
-        SELECT 
-            COUNT(*) as TotalPredictions,
-            AVG(PointsError) as AvgPointsError,
-            AVG(ReboundsError) as AvgReboundsError,
-            AVG(AssistsError) as AvgAssistsError
-        FROM MLPredictions
-        WHERE GameCompleted = 1
-    """)
-    
-    # get results
-    result = cursor.fetchone()
-    conn.close()
+    # read from the rollups, not every completed prediction
+    accuracy = get_accuracy()
     
     # if there are completed predictions, return accuracy stats
-    if result[0] > 0:
+    if 'points' in accuracy:
         return {
-            'total_predictions': result[0],
-            'avg_points_error': round(result[1], 2),
-            'avg_rebounds_error': round(result[2], 2),
-            'avg_assists_error': round(result[3], 2)
+            'total_predictions': accuracy['points']['predictions'],
+            'avg_points_error': round(accuracy['points']['mae'], 2),
+            'avg_rebounds_error': round(accuracy['rebounds']['mae'], 2),
+            'avg_assists_error': round(accuracy['assists']['mae'], 2),
+            'by_stat': accuracy
         }
     else:
         return None
@@ -188,24 +459,8 @@ def get_model_accuracy():
 # check if model should be retrained based on new data
 def should_retrain():
     """Determine if model should be retrained"""
-    # connect to database
-    conn = pyodbc.connect(conn_str)
-    cursor = conn.cursor()
-    
-    # check how many new completed games in the last 7 days
-    cursor.execute("""
-        SELECT COUNT(*)
-        FROM MLPredictions
-        WHERE GameCompleted = 1
-        AND CreatedDate > DATEADD(day, -7, GETDATE())
-    """)
-    
-    # get count of recent completed predictions
-    recent_completed = cursor.fetchone()[0]
-    conn.close()
-    
-    # retrain if we have 20 or more new results
-    return recent_completed >= 20
+    # retrain if we have 20 or more new results in the last 7 days
+    return recent_completed(days=7) >= 20
 
 # main execution when script is run directly
 if __name__ == "__main__":
@@ -216,8 +471,11 @@ if __name__ == "__main__":
     
     # update any pending predictions with actual results
     print("\nChecking for completed games...")
-    updated = update_with_actual_results()
-    print(f"Updated {updated} predictions with actual results")
+    report = update_with_actual_results()
+    print(f"Updated {report['updated']} of {report['pending']} pending predictions with actual results")
+    print(f"  {report['batches']} batch(es) in {report['seconds']:.2f}s, {report['rows_per_second']} rows/s")
+    if report['backfilled_pairs']:
+        print(f"  resolved ids for {report['backfilled_pairs']} player/opponent pair(s) logged without them")
     
     # show model accuracy stats
     accuracy = get_model_accuracy()
@@ -225,9 +483,7 @@ if __name__ == "__main__":
         print("\nMODEL ACCURACY")
         print(f"Total predictions validated: {accuracy['total_predictions']}")
         print(f"Average error:")
-        print(f"  Points: {accuracy['avg_points_error']}")
-        print(f"  Rebounds: {accuracy['avg_rebounds_error']}")
-        print(f"  Assists: {accuracy['avg_assists_error']}")
+        print_accuracy(accuracy['by_stat'])
     
     # check if model needs retraining
     if should_retrain():
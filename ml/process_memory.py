@@ -0,0 +1,37 @@
+# process_memory.py - reads how much memory a server process is using
+import os
+
+"""
+rss counts every page a process touches, including the model pages it shares with the other workers,
+so adding up rss across workers overstates the real total. on linux /proc/<pid>/smaps_rollup also has
+    pss           - shared pages split evenly between the processes sharing them
+    shared_clean  - pages shared with other processes (the preloaded models, libraries)
+    private_dirty - pages only this process has written to
+private_dirty growing in every worker means copy-on-write pages are being copied
+"""
+
+SMAPS_FIELDS = {'Rss': 'rssMb', 'Pss': 'pssMb', 'Shared_Clean': 'sharedCleanMb', 'Private_Dirty': 'privateDirtyMb'}
+
+#memory of one process in MB, pid defaults to this process, empty dict if it can't be read
+def process_memory(pid=None):
+    pid = pid or os.getpid()
+    memory = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in SMAPS_FIELDS:
+                    memory[SMAPS_FIELDS[key]] = round(int(value.split()[0]) / 1024, 1)
+        return memory
+    except (OSError, ValueError):
+        pass
+    #no smaps_rollup (older kernels, mac), fall back to peak rss of this process
+    if pid == os.getpid():
+        try:
+            import resource
+            import sys
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            memory['rssMb'] = round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+        except (ImportError, OSError):
+            pass
+    return memory
@@ -0,0 +1,157 @@
+# service_metrics.py - latency histograms and counters for the ML service, served in prometheus text format
+import threading
+import time
+from bisect import bisect_left
+
+"""
+/api/ml/metrics returns everything registered here in the prometheus text format, so prometheus (or
+anything that reads that format) can scrape it. no client library, recording a value is a bisect and
+a couple of additions under a lock, a couple of microseconds with the timer. an uncached prediction
+records about 25 of them, ~60us (bench_inference.py metrics_per_request). nothing on the request path
+prints per row anymore, the old DEBUG lines in build_features are gone
+
+    phase = metrics.histogram('ml_predict_phase_seconds', 'Time spent in each step of a prediction', ['phase'])
+    with phase.time('fetch_features'):
+        ...
+
+numbers that already live somewhere else (cache stats, memory, model version) are read when the
+endpoint is scraped through add_collector(), nothing extra happens on the request path for them
+
+every gunicorn worker keeps its own numbers, a scrape shows the worker that answered (the pid label on
+ml_process_info says which one)
+"""
+
+#upper bounds in seconds, 50 microseconds up to 5 seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+#times a with block into a histogram, a class instead of @contextmanager because it's cheaper
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {} #label values -> [count per bucket (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            snapshot = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        lines = []
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f'{self.name}_bucket{format_labels(self.label_names, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.label_names, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{format_labels(self.label_names, labels)} {count}')
+        return lines
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{format_labels(self.label_names, labels)} {_number(value)}' for labels, value in values]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        metric = Counter(name, help_text, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    #fn() returns a list of (name, type, help, [(labels dict, value), ...]), read on every scrape
+    def add_collector(self, fn):
+        self._collectors.append(fn)
+
+    #everything in the prometheus text format
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                lines.append(f'# collector {getattr(fn, "__name__", "?")} failed: {_escape(e)}')
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    lines.append(f'{name}{format_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+#the registry the service uses
+metrics = MetricsRegistry()
@@ -0,0 +1,256 @@
+# slate_precompute.py - scores every rostered player with a game coming up ahead of time, so predict() can serve them from a file
+# usage: python3 slate_precompute.py [--hours 24] [--output slate_predictions.json]
+# run nightly after the aggregate jobs (and after a retrain), the server picks the new file up within CHECK_INTERVAL seconds
+import argparse
+import json #writes the predictions
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+"""
+most requests are for players whose team plays in the next day, and every one of them used to be computed
+on demand. this job works the whole slate out once:
+    1. the Schedule rows for games in the next --hours hours (one row per team, so both sides of a game)
+    2. the roster of every team in those games: each player's most recent Stats row this season says
+       which team they're on (the same way server.js finds a player's team)
+    3. features for every (player, opponent), from the feature store, in one go
+    4. all six models on MAX_BATCH_SIZE rows at a time with the live bundle, then the same response
+       dictionaries predict() builds
+and writes them to slate_predictions.json next to the models, keyed by (PlayerApiId, Schedule.Id) and
+stamped with the model version
+
+score_items() in predict_services.py checks here after the prediction cache and before computing anything.
+an entry is only used while its model version is the live one and its game hasn't started, anything else
+(a retrain since the job ran, players not on a roster, opponents that aren't on the schedule) falls back
+to live computation. the prediction cache keeps a served entry until tip-off at the latest
+
+game times are UTC. the job picks games with the database's GETDATE(), which is UTC on Azure SQL, so
+Schedule.GameDate is read as UTC and written with +00:00, and the server checks it against the UTC time.
+comparing with the ML host's local clock served entries after tip-off (or dropped them early) by the
+host's UTC offset
+"""
+
+SLATE_FILE = 'slate_predictions.json'
+HORIZON_HOURS = 24
+CHECK_INTERVAL = 30 #seconds between checks of the file's modified time
+
+#the file's entries indexed by (PlayerApiId, opponent Teams.Id), reloaded when the file changes
+class SlateStore:
+    def __init__(self, path, check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self.version = None
+        self.generated_at = None
+        self.report = None
+        self._index = {}
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'loads': 0}
+
+    #reloads the file if it changed since the last look, at most once every check_interval seconds
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.load()
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not load precomputed slate {self.path}: {e}")
+            return False
+        index = {}
+        for entry in data.get('predictions', []):
+            entry['startsAt'] = as_utc(entry['gameDate']).timestamp() #files from before +00:00 are UTC too
+            index.setdefault((entry['playerApiId'], entry['opponentTeamId']), []).append(entry)
+        for entries in index.values():
+            entries.sort(key=lambda entry: entry['startsAt'])
+        with self._lock:
+            self._index = index
+            self.version = data.get('version')
+            self.generated_at = data.get('generatedAt')
+            self.report = data.get('report')
+            self._mtime = mtime
+            self._stats['loads'] += 1
+        return True
+
+    #the stored ((response, predictions in STATS order), game start) for a player against one opponent, or None
+    #the game start is time.time() seconds, nothing should serve the entry after it
+    #is_home None takes whichever side the schedule has, otherwise it has to match
+    def lookup(self, pid, team_ids, is_home, version):
+        self.maybe_reload()
+        #an opponent name that matched several teams is averaged over them live, there's no one game to serve
+        if pid is None or len(team_ids) != 1:
+            return None
+        now = time.time()
+        with self._lock:
+            if version != self.version:
+                self._stats['stale' if self._index else 'misses'] += 1
+                return None
+            for entry in self._index.get((pid, team_ids[0]), []):
+                if entry['startsAt'] > now and (is_home is None or entry['isHome'] == is_home):
+                    self._stats['hits'] += 1
+                    return (entry['response'], tuple(entry['logged'])), entry['startsAt']
+            self._stats['misses'] += 1
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'generatedAt': self.generated_at,
+                'entries': sum(len(entries) for entries in self._index.values()),
+                'coverage': (self.report or {}).get('coverage'),
+                **self._stats
+            }
+
+#a database time as an aware UTC datetime. naive values (what pyodbc gives back) are on the database's clock,
+#UTC like GETDATE(), never the ML host's local time
+def as_utc(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+#Schedule rows for games starting in the next hours hours
+#returns a list of (Schedule.Id, TeamId, OpponentTeamId, opponent name, GameDate in UTC, is_home)
+def fetch_upcoming_games(cursor, hours=HORIZON_HOURS):
+    cursor.execute("""
+        SELECT s.Id, s.TeamId, s.OpponentTeamId, t.TeamName, s.GameDate, s.HomeAway
+        FROM Schedule s
+        JOIN Teams t ON t.Id = s.OpponentTeamId
+        WHERE s.GameDate > GETDATE()
+        AND s.GameDate <= DATEADD(HOUR, ?, GETDATE())
+        ORDER BY s.GameDate
+    """, hours)
+    games = []
+    for schedule_id, team_id, opponent_id, opponent, game_date, home_away in cursor.fetchall():
+        games.append((schedule_id, team_id, opponent_id, opponent, as_utc(game_date), 1 if (home_away or '').lower() == 'home' else 0))
+    return games
+
+#{TeamId: [(PlayerApiId, PlayerName), ...]} for the given teams, from each player's latest game this season
+def fetch_rosters(cursor, team_ids, season):
+    from predict_services import chunked, BATCH_QUERY_CHUNK
+    rosters = {}
+    for chunk in chunked(sorted(team_ids), BATCH_QUERY_CHUNK):
+        cursor.execute(f"""
+            SELECT PlayerApiId, PlayerName, TeamId
+            FROM (
+                SELECT PlayerApiId, PlayerName, TeamId,
+                       ROW_NUMBER() OVER (PARTITION BY PlayerApiId ORDER BY GameDate DESC, Id DESC) AS Latest
+                FROM Stats
+                WHERE Season = ?
+            ) latest
+            WHERE Latest = 1
+            AND TeamId IN ({', '.join(['?'] * len(chunk))})
+        """, season, *chunk)
+        for pid, name, team_id in cursor.fetchall():
+            rosters.setdefault(team_id, []).append((pid, name))
+    return rosters
+
+#scores the whole upcoming slate with the service's own code (ps = the predict_services module)
+#returns the file contents: version, report and one entry per (player, game)
+def precompute_slate(ps, hours=HORIZON_HOURS):
+    timings = {}
+    start = time.perf_counter()
+    bundle = ps.registry.current #one version for the whole slate
+
+    with ps.pool.connection() as conn:
+        cursor = conn.cursor()
+        games = fetch_upcoming_games(cursor, hours)
+        timings['schedule'] = time.perf_counter() - start
+        step = time.perf_counter()
+        rosters = fetch_rosters(cursor, {team_id for _, team_id, _, _, _, _ in games}, ps.CURRENT_SEASON)
+        timings['rosters'] = time.perf_counter() - step
+
+    #one row per player per game, on their team's side of the schedule
+    slate = [(pid, name, schedule_id, team_id, opponent_id, opponent, game_date, is_home)
+             for schedule_id, team_id, opponent_id, opponent, game_date, is_home in games
+             for pid, name in rosters.get(team_id, [])]
+
+    step = time.perf_counter()
+    feature_rows = ps.get_resolved_features([(row[0], (row[4],)) for row in slate], [row[7] for row in slate])
+    timings['features'] = time.perf_counter() - step
+
+    step = time.perf_counter()
+    found = [(row, features) for row, features in zip(slate, feature_rows) if features]
+    predictions = []
+    for i in range(0, len(found), ps.MAX_BATCH_SIZE):
+        batch = found[i:i + ps.MAX_BATCH_SIZE]
+        results, trees_used = ps.run_models([features for _, features in batch], bundle)
+        for j, ((pid, name, schedule_id, team_id, opponent_id, opponent, game_date, is_home), features) in enumerate(batch):
+            values = ps.row_values(results, j)
+            response = ps.build_prediction_response(None, None, features, values)
+            response['treesUsed'] = {stat: int(used[j]) for stat, used in trees_used.items()}
+            predictions.append({
+                'playerApiId': pid, 'playerName': name, 'scheduleId': schedule_id, 'teamId': team_id,
+                'opponentTeamId': opponent_id, 'opponent': opponent,
+                'gameDate': game_date.isoformat(timespec='seconds'),
+                'isHome': is_home, 'response': response,
+                'logged': [values[stat][0] for stat in ps.STATS]
+            })
+    timings['models'] = time.perf_counter() - step
+
+    report = {
+        'games': len({(min(team_id, opponent_id), max(team_id, opponent_id), str(game_date)) for _, team_id, opponent_id, _, game_date, _ in games}),
+        'teams': len({team_id for _, team_id, _, _, _, _ in games}),
+        'teamsWithoutRoster': sorted({team_id for _, team_id, _, _, _, _ in games if team_id not in rosters}),
+        'rosteredPlayers': len(slate),
+        'scored': len(predictions),
+        'noFeatures': len(slate) - len(found),
+        'coverage': round(len(predictions) / len(slate), 4) if slate else None,
+        'seconds': {name: round(seconds, 3) for name, seconds in timings.items()},
+        'totalSeconds': round(time.perf_counter() - start, 3)
+    }
+    return {
+        'version': bundle.version,
+        'generatedAt': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'horizonHours': hours,
+        'report': report,
+        'predictions': predictions
+    }
+
+#written through a temp file so a server never reads half a file
+def save_slate(data, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, default=float)
+    os.replace(tmp, path)
+
+def print_slate_report(data):
+    report = data['report']
+    coverage = f"{report['coverage'] * 100:.1f}%" if report['coverage'] is not None else 'n/a'
+    print(f"\nPrecomputed slate for models {data['version']} (next {data['horizonHours']} hours)")
+    print(f"  games {report['games']}, teams {report['teams']}, rostered players {report['rosteredPlayers']}")
+    print(f"  scored {report['scored']}, without features {report['noFeatures']}, coverage {coverage}")
+    if report['teamsWithoutRoster']:
+        print(f"  teams with no players this season: {report['teamsWithoutRoster']}")
+    print('  ' + ', '.join(f"{name} {seconds:.2f}s" for name, seconds in report['seconds'].items()) + f", total {report['totalSeconds']:.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description='Score every rostered player with a game coming up')
+    parser.add_argument('--hours', type=int, default=HORIZON_HOURS, help=f'how far ahead to look (default: {HORIZON_HOURS})')
+    parser.add_argument('--output', default=None, help=f'where to write the predictions (default: {SLATE_FILE} next to the models)')
+    args = parser.parse_args()
+
+    #loads the live bundle and the feature store the same way the server does
+    import predict_services as ps
+    path = args.output or ps.SLATE_PATH
+    data = precompute_slate(ps, args.hours)
+    save_slate(data, path)
+    print_slate_report(data)
+    print(f"\n✓ Saved {len(data['predictions'])} predictions to {path}")
+    ps.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# train_incremental.py - adds trees fit on the games played since the last retrain to the current models
+import json #reads metadata
+import os
+import pickle #loads saved models
+import time
+import pandas as pd #handles data tables (data frames)
+from sklearn.metrics import mean_absolute_error #measurement of how good the model is
+from train_model import MODEL_SPECS, STATS, DEFAULT_FEATURES, training_rows
+
+"""
+a full retrain refits every tree on every season, which takes minutes. most nights only a few hundred
+new box scores came in, so incremental mode keeps the live forests and grows them instead:
+    - games with a StatId above the model's trained_through watermark are the new rows
+    - the newest holdout share of them (by StatId, so by when they were played) is held back for scoring
+    - each forest gets add_trees new trees fit on the rest of the new rows (sklearn warm_start keeps
+      the existing trees and only fits the extra ones)
+    - once a forest has more trees than its budget the oldest trees are dropped, so over many nights the
+      forest drifts towards recent games instead of growing forever
+
+the held back games are scored with the models before and after, and with --compare-full a full retrain
+on the same rows is scored on them too, so you can see what skipping the full retrain costs.
+the held back games are not lost, they're above the new watermark so the next run trains on them
+
+the new trees have to see the same kind of features as the old ones, so the run is refused if the
+training rows came from a different feature source (aggregates / point_in_time) than the base models
+"""
+
+ADD_TREES = 20 #new trees per model each run
+TREE_BUDGET = 1.5 #most trees a model can have, as a multiple of its n_estimators in MODEL_SPECS
+HOLDOUT = 0.2 #share of the new games held back to score the models on
+MIN_NEW_ROWS = 100 #fewer new games than this and there's nothing worth adding
+
+def add_incremental_args(parser):
+    parser.add_argument('--incremental', action='store_true', help='grow the current models on games since the last retrain instead of retraining from scratch')
+    parser.add_argument('--base-dir', default='.', help='folder with the current models for --incremental (default: this folder)')
+    parser.add_argument('--add-trees', type=int, default=ADD_TREES, help=f'trees added to each model (default: {ADD_TREES})')
+    parser.add_argument('--tree-budget', type=float, default=TREE_BUDGET,
+                        help=f'most trees a model keeps, as a multiple of its normal tree count, oldest trees go first (default: {TREE_BUDGET})')
+    parser.add_argument('--compare-full', action='store_true', help='also run a full retrain and report the accuracy difference (slow)')
+    return parser
+
+#the pickled sklearn models and metadata the server is running, the mapped bundle can't be grown
+def load_current_models(directory='.'):
+    models = {}
+    for stat in STATS:
+        with open(os.path.join(directory, f'{stat}_model.pkl'), 'rb') as f:
+            models[stat] = pickle.load(f)
+    with open(os.path.join(directory, 'model_metadata.json'), 'r') as f:
+        metadata = json.load(f)
+    return models, metadata
+
+#(rows the models already saw, new rows to fit on, newest rows to score on), split by StatId
+def split_new_rows(df, trained_through, holdout=HOLDOUT):
+    df = df.sort_values('StatId', kind='stable')
+    seen = df[df['StatId'] <= trained_through]
+    new = df[df['StatId'] > trained_through]
+    cut = len(new) - int(len(new) * holdout)
+    return seen, new.iloc[:cut], new.iloc[cut:]
+
+#most trees a model is allowed to keep
+def max_trees(stat, tree_budget=TREE_BUDGET):
+    return max(1, int(MODEL_SPECS[stat]['params']['n_estimators'] * tree_budget))
+
+#drops the oldest trees (warm_start appends, so they're at the front) until the model fits its budget
+def age_out(model, limit):
+    if len(model.estimators_) > limit:
+        model.estimators_ = model.estimators_[-limit:]
+    model.n_estimators = len(model.estimators_) #warm_start refuses n_estimators below the trees it has
+    return model
+
+#fits add_trees more trees on rows, keeping the trees already there
+def grow_model(model, stat, rows, add_trees=ADD_TREES, limit=None, n_jobs=-1):
+    spec = MODEL_SPECS[stat]
+    rows = training_rows(rows, stat)
+    if len(rows) == 0 or add_trees <= 0:
+        return model, 0
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + add_trees, n_jobs=n_jobs)
+    model.fit(rows[spec['features']], rows[spec['target']])
+    model.set_params(warm_start=False)
+    if limit is not None:
+        age_out(model, limit)
+    return model, len(rows)
+
+#mae of a model on the held back rows it's allowed to predict (same drop_zero filter as training)
+def holdout_mae(model, stat, rows):
+    spec = MODEL_SPECS[stat]
+    rows = training_rows(rows, stat)
+    if len(rows) == 0:
+        return None
+    return float(mean_absolute_error(rows[spec['target']], model.predict(rows[spec['features']])))
+
+def _delta(a, b):
+    return None if a is None or b is None else round(a - b, 4)
+
+#grows all six models, returns ({stat: {'model', 'features', 'metrics'}}, new trained_through)
+def train_incremental(df, base_dir='.', add_trees=ADD_TREES, tree_budget=TREE_BUDGET, holdout=HOLDOUT,
+                      compare_full=False, cores=None, model_workers=None, features=DEFAULT_FEATURES):
+    models, metadata = load_current_models(base_dir)
+    base_features = metadata.get('features', DEFAULT_FEATURES)
+    if features != base_features:
+        raise SystemExit(f"The current models were trained on {base_features} features, adding trees fit on {features} "
+                         f"features would mix the two, run a full retrain to switch")
+    trained_through = metadata.get('trained_through')
+    if trained_through is None:
+        raise SystemExit("The current models don't record which games they were trained on, run a full retrain first")
+
+    seen, fit_rows, held_out = split_new_rows(df, trained_through, holdout)
+    print(f"Models {metadata.get('version', 'unversioned')} were trained through StatId {trained_through}: "
+          f"{len(fit_rows)} new games to fit on, {len(held_out)} newest held back to score on")
+    if len(fit_rows) < MIN_NEW_ROWS:
+        raise SystemExit(f"Only {len(fit_rows)} new games since the last retrain (need {MIN_NEW_ROWS}), nothing to add")
+
+    full = None
+    if compare_full:
+        from train_parallel import train_all
+        #same rows the incremental models have now seen, so the only difference is how they were trained
+        print("\nFull retrain for comparison:")
+        full = train_all(pd.concat([seen, fit_rows], ignore_index=True), cores=cores, model_workers=model_workers)
+
+    results = {}
+    start = time.perf_counter()
+    for stat in STATS:
+        t = time.perf_counter()
+        model = models[stat]
+        trees_before = len(model.estimators_)
+        mae_before = holdout_mae(model, stat, held_out)
+        model, n_rows = grow_model(model, stat, fit_rows, add_trees, max_trees(stat, tree_budget), n_jobs=cores or -1)
+        mae = holdout_mae(model, stat, held_out)
+        metrics = {
+            'mode': 'incremental',
+            'train_rows': n_rows,
+            'holdout_rows': len(training_rows(held_out, stat)),
+            'trees_before': trees_before,
+            'trees': len(model.estimators_),
+            'mae_before': mae_before,
+            'mae': mae,
+            'seconds': round(time.perf_counter() - t, 2)
+        }
+        if full is not None:
+            metrics['mae_full'] = holdout_mae(full[stat]['model'], stat, held_out)
+            metrics['mae_vs_full'] = _delta(mae, metrics['mae_full'])
+        results[stat] = {'model': model, 'features': MODEL_SPECS[stat]['features'], 'metrics': metrics}
+
+    print(f"\nAdded up to {add_trees} trees to each model in {time.perf_counter() - start:.1f}s\n")
+    print_incremental_report(results)
+    return results, int(fit_rows['StatId'].max())
+
+def _fmt(value):
+    return f"{value:.3f}" if value is not None else '-'
+
+#holdout mae before and after for each model (and against the full retrain when there is one)
+def print_incremental_report(results):
+    has_full = any('mae_full' in r['metrics'] for r in results.values())
+    header = f"{'model':10s} {'trees':>9s} {'new rows':>9s} {'mae before':>11s} {'mae after':>10s} {'change':>8s}"
+    if has_full:
+        header += f" {'full mae':>9s} {'vs full':>8s}"
+    print(header)
+    for stat in STATS:
+        m = results[stat]['metrics']
+        change = _delta(m['mae'], m['mae_before'])
+        line = (f"{stat:10s} {m['trees_before']:>4d}->{m['trees']:<4d} {m['train_rows']:9d} "
+                f"{_fmt(m['mae_before']):>11s} {_fmt(m['mae']):>10s} {_fmt(change):>8s}")
+        if has_full:
+            line += f" {_fmt(m.get('mae_full')):>9s} {_fmt(m.get('mae_vs_full')):>8s}"
+        print(line)
+    print("(mae on the newest held back games, lower is better, a negative change means the new trees helped)")
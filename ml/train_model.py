@@ -4,120 +4,82 @@ import numpy as np #math operations
 from sklearn.ensemble import RandomForestRegressor #the random forest ml algorithm
 from sklearn.model_selection import train_test_split #splits data into training and testing sets
 from sklearn.metrics import mean_absolute_error, r2_score #measurement of how good the model is
-import pyodbc #python library for connecting to database
 import pickle #pythons way of saving/loading objects to files
 import json #library for working with JSON data
+import argparse
+import os
+import time
+from datetime import datetime
+from forest_compiler import compile_models
+from model_bundle import save_bundle
+from training_data import season_range, parse_seasons, load_training_rows, fetch_matchups
+from training_profile import TrainingProfiler, stage
+from data_access import read_pool #azure, or the local snapshot with ML_DATA_BACKEND=snapshot
 
-# azure database connection string
-conn_str = (
-    'DRIVER={ODBC Driver 18 for SQL Server};'
-    'SERVER=YOUR_SERVER.database.windows.net;'
-    'DATABASE=basketball_data;'
-    'UID=YOUR_USERNAME;'
-    'PWD=YOUR_PASSWORD;'
-    'Encrypt=yes;'
-    'TrustServerCertificate=no;'
-)
-
-def fetch_training_data():
+#the box score cache lives next to this file, so retrains run from model_versions/ share it
+TRAINING_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'training_cache')
+
+#where the averages the models train on come from, saved as 'features' in model_metadata.json
+#aggregates = the nightly tables (as of today), point_in_time = the games before each game (point_in_time_features.py)
+FEATURE_SOURCES = ['aggregates', 'point_in_time']
+DEFAULT_FEATURES = 'aggregates'
+
+#the feature source models in a folder were trained with, older metadata without one means aggregates
+def saved_feature_source(directory='.'):
+    with open(os.path.join(directory, 'model_metadata.json'), 'r') as f:
+        return json.load(f).get('features', DEFAULT_FEATURES)
+
+def fetch_training_data(seasons=None, rebuild_cache=False, profiler=None, point_in_time=False):
     #fetch historical game data 
     """
     what this does: 
-    connects to azure database, runs sql query to join multiple tables, gets actual stats (what happened) along with features (information to predict with) and returns a pandas dataframe 
+    connects to the database (azure or the local snapshot, see data_access.py), runs sql query to join multiple tables, gets actual stats (what happened) along with features (information to predict with) and returns a pandas dataframe 
 
     features pulled:
     actual stats, season averages, recent form (last 5 and 10 game averages), opponent defense, home/away, matchup history
-    """
-    conn = pyodbc.connect(conn_str)
 
-    #sql query that joins 4 tables (stats, playeraggregates, games, opponentdefensivestats)
-    
-    query = """
-    SELECT 
-        s.Points as ActualPoints,
-        s.TotalRebounds as ActualRebounds,
-        s.Assists as ActualAssists,
-        s.Steals as ActualSteals,
-        s.Blocks as ActualBlocks,
-        s.Turnovers as ActualTurnovers,
-        pa.AvgPoints as SeasonAvgPoints,
-        pa.AvgRebounds as SeasonAvgRebounds,
-        pa.AvgAssists as SeasonAvgAssists,
-        pa.AvgSteals as SeasonAvgSteals,       
-        pa.AvgBlocks as SeasonAvgBlocks,        
-        pa.AvgTurnovers as SeasonAvgTurnovers,   
-        pa.Last5AvgPoints,
-        pa.Last10AvgPoints,
-        pa.GamesPlayed,
-        s.TeamName,
-        s.PlayerApiId,
-        CASE 
-            WHEN s.TeamName = g.HomeTeam THEN 1
-            ELSE 0
-        END as IsHome,
-        CASE 
-            WHEN s.TeamName = g.HomeTeam THEN g.AwayTeam
-            ELSE g.HomeTeam
-        END as OpponentTeam,
-        -- Opponent defensive rating
-        ISNULL(ods.AvgPointsAllowed, 110) as OppDefenseRating,
-        ISNULL(ods.AvgReboundsAllowed, 43) as OppReboundsAllowed
-    FROM Stats s
-    JOIN PlayerAggregates pa ON s.PlayerApiId = pa.PlayerApiId 
-        AND s.Season = pa.Season
-    LEFT JOIN Games g ON s.GameId = g.Id
-    LEFT JOIN OpponentDefensiveStats ods ON ods.Season = s.Season
-        AND ods.TeamId = (
-            SELECT TOP 1 Id FROM Teams WHERE TeamName = 
-            CASE WHEN s.TeamName = g.HomeTeam THEN g.AwayTeam ELSE g.HomeTeam END
-        )
-    WHERE s.Season IN ('2022-2023', '2023-2024', '2024-2025', '2025-2026')
-        AND s.Points IS NOT NULL
-        AND pa.AvgPoints IS NOT NULL
-        AND pa.GamesPlayed >= 5
+    point_in_time = True works all of those out from the box scores before each game (see point_in_time_features.py)
+    instead of joining the aggregate tables, which hold the averages as of today
     """
-    
-    df = pd.read_sql(query, conn)
-    
-    # fetch player vs team matchup history
-    #this tells us how a player histroically performs against a specific team
-    print("Fetching player vs team matchup history...")
-    
-    # get all historical matchup data
-    matchup_query = """
-    SELECT 
-        pvt.PlayerApiId,
-        t.TeamName as OpponentTeam,
-        pvt.AvgPoints as VsTeamAvgPoints,
-        pvt.AvgRebounds as VsTeamAvgRebounds,
-        pvt.AvgAssists as VsTeamAvgAssists,
-        pvt.GamesPlayed as VsTeamGames
-    FROM PlayerVsTeam pvt
-    JOIN Teams t ON pvt.OpponentTeamId = t.Id
-    WHERE pvt.Season IN ('2022-2023', '2023-2024', '2024-2025', '2025-2026')
-    """
-    
-    matchup_df = pd.read_sql(matchup_query, conn)
-    conn.close()
+    seasons = seasons or season_range()
+    with read_pool.connection() as conn:
+
+        #box scores come from the local cache (only games added since the last run are fetched),
+        #season averages and opponent defense are read fresh and joined on, see training_data.py
+        df = load_training_rows(conn, seasons, cache_dir=TRAINING_CACHE_DIR, rebuild=rebuild_cache, profiler=profiler,
+                                point_in_time=point_in_time)
+        if point_in_time:
+            return df #matchup history to date is already in there
+    
+        # fetch player vs team matchup history
+        #this tells us how a player histroically performs against a specific team
+        print("Fetching player vs team matchup history...")
+    
+        # get all historical matchup data
+        with stage(profiler, 'fetch_matchups') as info:
+            matchup_df = fetch_matchups(conn, seasons)
+            info['rows'] = len(matchup_df)
     
     # merge the matchup history into main dataframe
     #matches players on playerAPIId and opponent team
     
-    df = df.merge(
-        matchup_df,
-        on=['PlayerApiId', 'OpponentTeam'],
-        how='left'
-    )
+    with stage(profiler, 'merge_matchups') as info:
+        df = df.merge(
+            matchup_df,
+            on=['PlayerApiId', 'OpponentTeam'],
+            how='left'
+        )
 
-    #how = 'left' keeps all rows from main data
-    
-    # fill missing matchup data with season averages
-    #if there is no matchup data, just use season avg as fall back
+        #how = 'left' keeps all rows from main data
+        
+        # fill missing matchup data with season averages
+        #if there is no matchup data, just use season avg as fall back
 
-    df['VsTeamAvgPoints'] = df['VsTeamAvgPoints'].fillna(df['SeasonAvgPoints'])
-    df['VsTeamAvgRebounds'] = df['VsTeamAvgRebounds'].fillna(df['SeasonAvgRebounds'])
-    df['VsTeamAvgAssists'] = df['VsTeamAvgAssists'].fillna(df['SeasonAvgAssists'])
-    df['VsTeamGames'] = df['VsTeamGames'].fillna(0)
+        df['VsTeamAvgPoints'] = df['VsTeamAvgPoints'].fillna(df['SeasonAvgPoints'])
+        df['VsTeamAvgRebounds'] = df['VsTeamAvgRebounds'].fillna(df['SeasonAvgRebounds'])
+        df['VsTeamAvgAssists'] = df['VsTeamAvgAssists'].fillna(df['SeasonAvgAssists'])
+        df['VsTeamGames'] = df['VsTeamGames'].fillna(0)
+        info['rows'] = len(df)
     
     return df
 
@@ -148,281 +110,195 @@ def prepare_features(df):
     
     return df
 
-def train_points_model(df):
-    #train Random Forest model for points prediction with advanced features
+#what each model predicts, from which features, and its random forest settings
+#drop_zero = only train on games where the stat was recorded and above 0 (steals/blocks/turnovers are mostly 0s)
+MODEL_SPECS = {
+    'points': {
+        'target': 'ActualPoints',
+        #list of features (the clues)
+        'features': [
+            'SeasonAvgPoints', 'Last5AvgPoints', 'Last10AvgPoints',
+            'GamesPlayed', 'RecentForm', 'IsHome',
+            'OppDefenseRating', 'VsTeamAvgPoints', 'MatchupAdvantage',
+            'DefensiveDifficulty', 'IsVeteran', 'HasMatchupHistory'
+        ],
+        'drop_zero': False,
+        'params': {
+            'n_estimators': 200,  # the number of trees
+            'max_depth': 15,      # how deep the trees go
+            'min_samples_split': 10, #need at least 10 examples to split a node
+            'min_samples_leaf': 4, #each leaf must have at least 4 examples
+            'max_features': 'sqrt',
+            'random_state': 42 #randomness
+        }
+    },
+    'rebounds': {
+        'target': 'ActualRebounds',
+        'features': [
+            'SeasonAvgRebounds', 'GamesPlayed', 'IsHome',
+            'OppDefenseRating', 'VsTeamAvgRebounds', 'IsVeteran',
+            'OppReboundsAllowed'
+        ],
+        'drop_zero': False,
+        'params': {'n_estimators': 150, 'max_depth': 12, 'min_samples_split': 10, 'random_state': 42}
+    },
+    'assists': {
+        'target': 'ActualAssists',
+        'features': [
+            'SeasonAvgAssists', 'GamesPlayed', 'IsHome',
+            'OppDefenseRating', 'VsTeamAvgAssists', 'IsVeteran'
+        ],
+        'drop_zero': False,
+        'params': {'n_estimators': 150, 'max_depth': 12, 'min_samples_split': 10, 'random_state': 42}
+    },
+    'steals': {
+        'target': 'ActualSteals',
+        'features': [
+            'SeasonAvgSteals', 'SeasonAvgPoints', 'GamesPlayed', 'IsHome',
+            'OppDefenseRating', 'IsVeteran'
+        ],
+        'drop_zero': True,
+        'params': {'n_estimators': 150, 'max_depth': 10, 'min_samples_split': 10, 'random_state': 42}
+    },
+    'blocks': {
+        'target': 'ActualBlocks',
+        'features': [
+            'SeasonAvgBlocks', 'SeasonAvgRebounds', 'GamesPlayed', 'IsHome',
+            'OppDefenseRating', 'IsVeteran'
+        ],
+        'drop_zero': True,
+        'params': {'n_estimators': 150, 'max_depth': 10, 'min_samples_split': 10, 'random_state': 42}
+    },
+    'turnovers': {
+        'target': 'ActualTurnovers',
+        'features': [
+            'SeasonAvgTurnovers','SeasonAvgPoints', 'SeasonAvgAssists', 'GamesPlayed',
+            'IsHome', 'OppDefenseRating', 'IsVeteran'
+        ],
+        'drop_zero': True,
+        'params': {'n_estimators': 150, 'max_depth': 10, 'min_samples_split': 10, 'random_state': 42}
+    }
+}
+STATS = list(MODEL_SPECS)
 
-    #list of features (the clues)
-    features = [
-        'SeasonAvgPoints', 'Last5AvgPoints', 'Last10AvgPoints',
-        'GamesPlayed', 'RecentForm', 'IsHome',
-        'OppDefenseRating', 'VsTeamAvgPoints', 'MatchupAdvantage',
-        'DefensiveDifficulty', 'IsVeteran', 'HasMatchupHistory'
-    ]
-    
-    # x = features, which are the clues (seasonavgpoints, last5avgpoints, etc)
-    # y = the target, the answer (what we are trying to predict)
+#tune_models.py saves the forest settings it picked here, training uses them instead of the ones above
+TUNED_PARAMS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tuned_params.json')
 
+#{'tuned_at', 'params': {stat: params}, ...} or None if nothing has been tuned
+def load_tuned_params(path=TUNED_PARAMS_FILE):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-    X = df[features]
-    y = df['ActualPoints']
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+def apply_tuned_params(tuned):
+    for stat, params in (tuned or {}).get('params', {}).items():
+        if stat in MODEL_SPECS:
+            MODEL_SPECS[stat]['params'] = dict(params)
+
+#applied on import so the train_parallel worker processes pick them up too
+TUNED_PARAMS = load_tuned_params()
+apply_tuned_params(TUNED_PARAMS)
+
+#which rows of df a model trains on
+def training_rows(df, stat):
+    spec = MODEL_SPECS[stat]
+    if spec['drop_zero']:
+        # Filter out rows where the stat is missing or 0
+        return df[df[spec['target']].notna() & (df[spec['target']] > 0)]
+    return df
+
+#fits one model and scores it on the held back 20%, params defaults to the stat's MODEL_SPECS settings
+def fit_stat_model(stat, X_train, y_train, X_test, y_test, n_jobs=-1, params=None):
+    model = RandomForestRegressor(**(params or MODEL_SPECS[stat]['params']), n_jobs=n_jobs)
 
-    #X_train, y_train = 80% of data for learning
-    #x_test, y_test = 20% of data for testing
-    #holding back 20% of data avoid overfittinig, it predicts the other 20% that it has not seen before. if it does good, then it is learning patterns, if not, then we are memorizing 
-    
-    model = RandomForestRegressor(
-        n_estimators=200,  # the number of trees
-        max_depth=15,      # how deep the trees go
-        min_samples_split=10, #need at least 10 examples to split a node
-        min_samples_leaf=4, #each leaf must have at least 4 examples
-        max_features='sqrt',
-        random_state=42, #randomness
-        n_jobs=-1          
-    )
-    
     #each tree is looking at a random subset of the training data
     #asking yes or no questions about the features
     #building a decision path
     #all trees find a prediction based on different questions from different data, and then average them for the final prediction
-
+    start = time.perf_counter()
     model.fit(X_train, y_train)
-    
+    fit_seconds = time.perf_counter() - start
+
     # mae = mean absolute error (ex. 3.2 = on average, the projection is off by 3.2 points)
+    start = time.perf_counter()
     y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"Points Model - MAE: {mae:.2f}, R²: {r2:.3f}")
-    
-    # Feature importance
+    metrics = {
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+        'r2': float(r2_score(y_test, y_pred)),
+        'train_rows': len(y_train),
+        'test_rows': len(y_test),
+        'fit_seconds': round(fit_seconds, 3),
+        'eval_seconds': round(time.perf_counter() - start, 3)
+    }
+    return model, metrics
+
+def print_model_report(stat, model, metrics):
+    features = MODEL_SPECS[stat]['features']
+    print(f"{stat.capitalize()} Model - MAE: {metrics['mae']:.2f}, R²: {metrics['r2']:.3f}")
+
+    # feature importance
     importance = pd.DataFrame({
         'feature': features,
         'importance': model.feature_importances_
     }).sort_values('importance', ascending=False)
-    
-    print("\nFeature Importance (Points):")
+
+    print(f"\nFeature Importance ({stat.capitalize()}):")
     print(importance)
-    
-    return model, features
 
-def train_rebounds_model(df):
-    #train model for rebounds prediction with advanced features
-    features = [
-        'SeasonAvgRebounds', 'GamesPlayed', 'IsHome',
-        'OppDefenseRating', 'VsTeamAvgRebounds', 'IsVeteran',
-        'OppReboundsAllowed'
-    ]
-    
-    X = df[features]
-    y = df['ActualRebounds']
-    
+#trains one model in this process, returns (model, features)
+def train_stat_model(df, stat):
+    spec = MODEL_SPECS[stat]
+    rows = training_rows(df, stat)
+
+    # x = features, which are the clues (seasonavgpoints, last5avgpoints, etc)
+    # y = the target, the answer (what we are trying to predict)
+    X = rows[spec['features']]
+    y = rows[spec['target']]
+
+    # Split data
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42
     )
-    
-    model = RandomForestRegressor(
-        n_estimators=150,
-        max_depth=12,
-        min_samples_split=10,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
-    
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"\nRebounds Model - MAE: {mae:.2f}, R²: {r2:.3f}")
-    
-    # feature importance
-    importance = pd.DataFrame({
-        'feature': features,
-        'importance': model.feature_importances_
-    }).sort_values('importance', ascending=False)
-    
-    print("\nFeature Importance (Rebounds):")
-    print(importance)
-    
-    return model, features
+
+    #X_train, y_train = 80% of data for learning
+    #x_test, y_test = 20% of data for testing
+    #holding back 20% of data avoid overfittinig, it predicts the other 20% that it has not seen before. if it does good, then it is learning patterns, if not, then we are memorizing 
+
+    model, metrics = fit_stat_model(stat, X_train, y_train, X_test, y_test)
+    print_model_report(stat, model, metrics)
+    return model, spec['features']
+
+def train_points_model(df):
+    #train Random Forest model for points prediction with advanced features
+    return train_stat_model(df, 'points')
+
+def train_rebounds_model(df):
+    #train model for rebounds prediction with advanced features
+    return train_stat_model(df, 'rebounds')
 
 def train_assists_model(df):
     #Train model for assists prediction with advanced features
-    features = [
-        'SeasonAvgAssists', 'GamesPlayed', 'IsHome',
-        'OppDefenseRating', 'VsTeamAvgAssists', 'IsVeteran'
-    ]
-    
-    X = df[features]
-    y = df['ActualAssists']
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    model = RandomForestRegressor(
-        n_estimators=150,
-        max_depth=12,
-        min_samples_split=10,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
-    
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"Assists Model - MAE: {mae:.2f}, R²: {r2:.3f}")
-    
-    # feature importance
-    importance = pd.DataFrame({
-        'feature': features,
-        'importance': model.feature_importances_
-    }).sort_values('importance', ascending=False)
-    
-    print("\nFeature Importance (Assists):")
-    print(importance)
-    
-    return model, features
+    return train_stat_model(df, 'assists')
 
 def train_steals_model(df):
     #Train model for steals prediction
-    # Filter out rows where steals data is missing
-    df_filtered = df[df['ActualSteals'].notna() & (df['ActualSteals'] > 0)]
-    
-    features = [
-        'SeasonAvgSteals', 'SeasonAvgPoints', 'GamesPlayed', 'IsHome',
-        'OppDefenseRating', 'IsVeteran'
-    ]
-    
-    X = df_filtered[features]
-    y = df_filtered['ActualSteals']
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    model = RandomForestRegressor(
-        n_estimators=150,
-        max_depth=10,
-        min_samples_split=10,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
-    
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"Steals Model - MAE: {mae:.2f}, R²: {r2:.3f}")
-    
-    importance = pd.DataFrame({
-        'feature': features,
-        'importance': model.feature_importances_
-    }).sort_values('importance', ascending=False)
-    
-    print("\nFeature Importance (Steals):")
-    print(importance)
-    
-    return model, features
+    return train_stat_model(df, 'steals')
 
 def train_blocks_model(df):
     """Train model for blocks prediction"""
-    df_filtered = df[df['ActualBlocks'].notna() & (df['ActualBlocks'] > 0)]
-    
-    features = [
-        'SeasonAvgBlocks', 'SeasonAvgRebounds', 'GamesPlayed', 'IsHome',
-        'OppDefenseRating', 'IsVeteran'
-    ]
-    
-    X = df_filtered[features]
-    y = df_filtered['ActualBlocks']
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    model = RandomForestRegressor(
-        n_estimators=150,
-        max_depth=10,
-        min_samples_split=10,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
-    
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"Blocks Model - MAE: {mae:.2f}, R²: {r2:.3f}")
-    
-    importance = pd.DataFrame({
-        'feature': features,
-        'importance': model.feature_importances_
-    }).sort_values('importance', ascending=False)
-    
-    print("\nFeature Importance (Blocks):")
-    print(importance)
-    
-    return model, features
+    return train_stat_model(df, 'blocks')
 
 def train_turnovers_model(df):
     """Train model for turnovers prediction"""
-    df_filtered = df[df['ActualTurnovers'].notna() & (df['ActualTurnovers'] > 0)]
-    
-    features = [
-        'SeasonAvgTurnovers','SeasonAvgPoints', 'SeasonAvgAssists', 'GamesPlayed',
-        'IsHome', 'OppDefenseRating', 'IsVeteran'
-    ]
-    
-    X = df_filtered[features]
-    y = df_filtered['ActualTurnovers']
-    
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
-    
-    model = RandomForestRegressor(
-        n_estimators=150,
-        max_depth=10,
-        min_samples_split=10,
-        random_state=42,
-        n_jobs=-1
-    )
-    
-    model.fit(X_train, y_train)
-    
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
-    
-    print(f"Turnovers Model - MAE: {mae:.2f}, R²: {r2:.3f}")
-    
-    importance = pd.DataFrame({
-        'feature': features,
-        'importance': model.feature_importances_
-    }).sort_values('importance', ascending=False)
-    
-    print("\nFeature Importance (Turnovers):")
-    print(importance)
-    
-    return model, features
+    return train_stat_model(df, 'turnovers')
 
 def save_models(points_model, rebounds_model, assists_model, steals_model, blocks_model, turnovers_model,
-                points_features, rebounds_features, assists_features, steals_features, blocks_features, turnovers_features):
+                points_features, rebounds_features, assists_features, steals_features, blocks_features, turnovers_features,
+                training_rows=None, model_stats=None, trained_through=None, mode='full', features=DEFAULT_FEATURES):
     #Save trained models and feature lists
+    version = datetime.now().strftime('%Y%m%d%H%M%S') #changes every retrain, the prediction cache is keyed on it
     
     with open('points_model.pkl', 'wb') as f:
         pickle.dump(points_model, f)
@@ -449,50 +325,117 @@ def save_models(points_model, rebounds_model, assists_model, steals_model, block
         'assists_features': assists_features,
         'steals_features': steals_features,
         'blocks_features': blocks_features,
-        'turnovers_features': turnovers_features
+        'turnovers_features': turnovers_features,
+        'version': version,
+        'trained_through': trained_through, #highest StatId trained on, --incremental picks up the games after it
+        'mode': mode,
+        'features': features, #'aggregates' (the nightly tables) or 'point_in_time' (to date from the box scores)
+        'params': {stat: MODEL_SPECS[stat]['params'] for stat in STATS}, #forest settings each model was trained with
+        'tuned_at': (TUNED_PARAMS or {}).get('tuned_at') #when tune_models.py picked them, None = the defaults
     }
     
     with open('model_metadata.json', 'w') as f:
         json.dump(metadata, f)
     
+    #the same six forests compiled into flat arrays in one file, predict_services.py memory maps this
+    #instead of unpickling (the pickles are still saved for anything that needs the sklearn objects)
+    models = {
+        'points': points_model, 'rebounds': rebounds_model, 'assists': assists_model,
+        'steals': steals_model, 'blocks': blocks_model, 'turnovers': turnovers_model
+    }
+    compiled = compile_models(models, {stat: metadata[f'{stat}_features'] for stat in models})
+    training_stats = {
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+        'training_rows': training_rows,
+        'trained_through': trained_through,
+        'mode': mode,
+        'features': features,
+        'trees': {stat: len(model.estimators_) for stat, model in models.items()},
+        'nodes': int(compiled.forest.n_nodes),
+        'models': model_stats or {} #mae, r2 and training seconds per model
+    }
+    save_bundle(compiled, '.', version=version, training_stats=training_stats)
+    
     print("\n✓ Models saved successfully!")
+    return version
+
+def main(argv=None):
+    from train_parallel import train_all, add_parallel_args
+    from train_incremental import train_incremental, add_incremental_args
+    from model_compaction import add_compaction_args, compact_saved_models, print_compaction_report
+
+    parser = argparse.ArgumentParser(description='Train the six stat models')
+    add_parallel_args(parser)
+    add_incremental_args(parser)
+    add_compaction_args(parser)
+    parser.add_argument('--seasons', default=None, help='season range to train on, e.g. 2022:2025 (default: 2022-2023 through 2025-2026)')
+    parser.add_argument('--rebuild-cache', action='store_true', help='throw away the local box score cache and fetch everything again')
+    parser.add_argument('--features', choices=FEATURE_SOURCES, default=None,
+                        help=f"where the averages come from (default: the base models' source with --incremental, otherwise {DEFAULT_FEATURES})")
+    parser.add_argument('--point-in-time', dest='features', action='store_const', const='point_in_time',
+                        help='same as --features point_in_time, averages from the games before each game instead of the aggregate tables')
+    args = parser.parse_args(argv)
+
+    #an incremental run keeps the source its base models were trained with, train_incremental refuses a different one
+    features = args.features or (saved_feature_source(args.base_dir) if args.incremental else DEFAULT_FEATURES)
+
+    #wall/cpu time, memory and rows for every stage, saved as training_profile.json next to the models
+    profiler = TrainingProfiler()
 
-def main():
-    print("Fetching training data...")
-    df = fetch_training_data()
+    seasons = parse_seasons(args.seasons)
+    print(f"Fetching training data for {', '.join(seasons)}...")
+    with profiler.stage('fetch') as info:
+        df = fetch_training_data(seasons, rebuild_cache=args.rebuild_cache, profiler=profiler,
+                                 point_in_time=features == 'point_in_time')
+        info['rows'] = len(df)
     print(f"Loaded {len(df)} games")
     
     print("\nPreparing features...")
-    df = prepare_features(df)
-    
-    print(f"\nTraining on {len(df)} game records...")
-    
-    print("\nTraining Points model...")
-    points_model, points_features = train_points_model(df)
-    
-    print("\nTraining Rebounds model...")
-    rebounds_model, rebounds_features = train_rebounds_model(df)
-    
-    print("\nTraining Assists model...")
-    assists_model, assists_features = train_assists_model(df)
-    
-    print("\nTraining Steals model...")
-    steals_model, steals_features = train_steals_model(df)
-    
-    print("\nTraining Blocks model...")
-    blocks_model, blocks_features = train_blocks_model(df)
-    
-    print("\nTraining Turnovers model...")
-    turnovers_model, turnovers_features = train_turnovers_model(df)
+    with profiler.stage('prepare_features', rows=len(df)):
+        df = prepare_features(df)
+    
+    mode = 'incremental' if args.incremental else 'full'
+    with profiler.stage('train') as info:
+        if args.incremental:
+            #keep the current trees and add some fit on the newest games, see train_incremental.py
+            results, trained_through = train_incremental(
+                df, base_dir=args.base_dir, add_trees=args.add_trees, tree_budget=args.tree_budget,
+                compare_full=args.compare_full, cores=args.cores, model_workers=args.model_workers, features=features
+            )
+            n_rows = max(r['metrics']['train_rows'] for r in results.values())
+        else:
+            print(f"\nTraining on {len(df)} game records...")
+
+            #all six models train at the same time, see train_parallel.py
+            results = train_all(df, cores=args.cores, model_workers=args.model_workers, profiler=profiler)
+            trained_through = int(df['StatId'].max()) if 'StatId' in df.columns and len(df) else None
+            n_rows = len(df)
+        info['rows'] = n_rows
+    profiler.add_models(results)
     
     print("\nSaving models...")
-    save_models(
-        points_model, rebounds_model, assists_model, steals_model, blocks_model, turnovers_model,
-        points_features, rebounds_features, assists_features, steals_features, blocks_features, turnovers_features
-    )
+    with profiler.stage('save_models'):
+        version = save_models(
+            *[results[stat]['model'] for stat in STATS],
+            *[MODEL_SPECS[stat]['features'] for stat in STATS],
+            training_rows=n_rows,
+            model_stats={stat: results[stat]['metrics'] for stat in STATS},
+            trained_through=trained_through,
+            mode=mode,
+            features=features
+        )
+    
+    if args.compact:
+        #float32 thresholds, 16 bit leaves and maybe fewer trees in the bundle the server maps, see model_compaction.py
+        print("\nCompacting the model bundle...")
+        with profiler.stage('compact_models'):
+            compaction = compact_saved_models(df, '.', prune=args.prune)
+        print_compaction_report(compaction)
     
+    profiler.print_summary()
+    profiler.save('.', version=version, mode=mode, seasons=seasons)
     print("\n✓ Training complete!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
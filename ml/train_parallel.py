@@ -0,0 +1,166 @@
+# train_parallel.py - trains the six stat models at the same time
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np #math operations
+from sklearn.model_selection import train_test_split #splits data into training and testing sets
+from train_model import MODEL_SPECS, STATS, fit_stat_model, print_model_report
+from training_profile import stage, peak_rss_mb
+
+"""
+training used to go points, rebounds, assists, steals, blocks, turnovers one after another, and each
+train_*_model function cut its own columns out of df and ran its own train_test_split
+
+here the data is prepared once:
+    - every feature column any model uses goes into one float32 matrix (sklearn converts X to float32
+      before fitting anyway, so the trees come out exactly the same) plus one float64 array per target
+    - those arrays are put in shared memory, so the worker processes read them instead of each getting
+      a pickled copy of the dataframe
+    - the 80/20 split only depends on the number of rows, so it's computed once per row set
+      (all rows, or rows where the stat is above 0) and reused
+
+then the six fits run in a process pool. the core budget is split two ways: model_workers models train
+at once, and each model's n_jobs gets its share of the remaining cores. the biggest models are
+started first so the slowest one isn't the last one to begin
+"""
+
+#how many cores and how many models at once, can also be set with --cores / --model-workers
+def add_parallel_args(parser):
+    parser.add_argument('--cores', type=int, default=None, help='cores to use in total (default: all)')
+    parser.add_argument('--model-workers', type=int, default=None, help='models trained at the same time (default: min(6, cores))')
+    return parser
+
+#one float32 column per feature used by any model, and the targets as float64
+def build_training_arrays(df):
+    columns = sorted({f for spec in MODEL_SPECS.values() for f in spec['features']})
+    X = np.ascontiguousarray(df[columns].to_numpy(dtype=np.float32))
+    targets = np.ascontiguousarray(np.column_stack([df[MODEL_SPECS[stat]['target']].to_numpy(dtype=np.float64) for stat in STATS]))
+    return X, columns, targets
+
+#row numbers each model trains and tests on, same rows train_test_split(df[...]) would give
+def split_rows(df):
+    splits = {}
+    cache = {} #the split only depends on which rows are used, so share it between models with the same rows
+    for stat in STATS:
+        spec = MODEL_SPECS[stat]
+        if spec['drop_zero']:
+            target = df[spec['target']]
+            rows = np.flatnonzero((target.notna() & (target > 0)).to_numpy())
+        else:
+            rows = np.arange(len(df))
+        key = rows.tobytes() if spec['drop_zero'] else 'all'
+        if key not in cache:
+            train_idx, test_idx = train_test_split(np.arange(len(rows)), test_size=0.2, random_state=42)
+            cache[key] = (rows[train_idx], rows[test_idx])
+        splits[stat] = cache[key]
+    return splits
+
+#how many n_jobs each model gets when model_workers models share cores, bigger models get the leftovers
+def plan_jobs(cores, model_workers, order):
+    base, extra = divmod(cores, model_workers)
+    return {stat: max(1, base + (1 if i < extra else 0)) for i, stat in enumerate(order)}
+
+#rough cost of fitting a model, used to start the slowest ones first
+def fit_cost(stat, n_rows):
+    params = MODEL_SPECS[stat]['params']
+    return params['n_estimators'] * n_rows * params.get('max_depth', 20)
+
+# worker process side
+_shared = {}
+
+def _attach(shm_specs):
+    for name, (shm_name, shape, dtype) in shm_specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+def _fit_in_worker(stat, train_rows, test_rows, feature_cols, target_col, n_jobs):
+    start = time.perf_counter()
+    cpu = time.process_time() #all threads of this process, so it includes the n_jobs tree threads
+    X = _shared['X'][1]
+    targets = _shared['targets'][1]
+    X_train = X[np.ix_(train_rows, feature_cols)]
+    X_test = X[np.ix_(test_rows, feature_cols)]
+    y_train = targets[train_rows, target_col]
+    y_test = targets[test_rows, target_col]
+    model, metrics = fit_stat_model(stat, X_train, y_train, X_test, y_test, n_jobs=n_jobs)
+    #fitted on a plain array, put the column names back so the pickle matches one fitted on df[features]
+    model.feature_names_in_ = np.asarray(MODEL_SPECS[stat]['features'], dtype=object)
+    metrics['seconds'] = round(time.perf_counter() - start, 2)
+    metrics['n_jobs'] = n_jobs
+    metrics['cpu_seconds'] = round(time.process_time() - cpu, 2)
+    #highest memory this worker has used so far (a pool worker can fit more than one model)
+    metrics['worker_peak_rss_mb'] = peak_rss_mb()
+    return stat, model, metrics
+
+def _to_shared(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+#trains all six models, returns {stat: {'model', 'features', 'metrics'}}
+#cores = total cores to use, model_workers = models trained at the same time (1 = one after another)
+#profiler (training_profile.TrainingProfiler) times the steps when given
+def train_all(df, cores=None, model_workers=None, profiler=None):
+    cores = max(1, cores or os.cpu_count() or 1)
+    model_workers = max(1, min(model_workers or min(len(STATS), cores), len(STATS)))
+
+    start = time.perf_counter()
+    with stage(profiler, 'prepare_arrays', rows=len(df)):
+        X, columns, targets = build_training_arrays(df)
+        splits = split_rows(df)
+    column_index = {name: i for i, name in enumerate(columns)}
+    order = sorted(STATS, key=lambda stat: fit_cost(stat, len(splits[stat][0])), reverse=True)
+    n_jobs = plan_jobs(cores, model_workers, order)
+    print(f"Prepared {X.shape[0]} rows x {X.shape[1]} features ({X.nbytes / 1e6:.1f} MB) in {time.perf_counter() - start:.2f}s")
+    print(f"Training {len(STATS)} models, {model_workers} at a time on {cores} cores "
+          f"(n_jobs: {', '.join(f'{stat} {n_jobs[stat]}' for stat in order)})")
+
+    tasks = {
+        stat: (splits[stat][0], splits[stat][1], [column_index[f] for f in MODEL_SPECS[stat]['features']],
+               STATS.index(stat), n_jobs[stat])
+        for stat in order
+    }
+
+    results = {}
+    start = time.perf_counter()
+    with stage(profiler, 'fit_models', rows=len(df)):
+        if model_workers == 1:
+            #no pool needed, fit straight from the arrays in this process
+            _shared['X'] = (None, X)
+            _shared['targets'] = (None, targets)
+            try:
+                for stat in order:
+                    _, model, metrics = _fit_in_worker(stat, *tasks[stat])
+                    results[stat] = {'model': model, 'features': MODEL_SPECS[stat]['features'], 'metrics': metrics}
+                    print(f"  ✓ {stat} trained in {metrics['seconds']:.1f}s")
+            finally:
+                _shared.clear()
+        else:
+            x_shm, x_spec = _to_shared(X)
+            t_shm, t_spec = _to_shared(targets)
+            try:
+                #spawn instead of fork so the workers don't inherit the parent's threads or open connections
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=model_workers, mp_context=context,
+                                         initializer=_attach, initargs=({'X': x_spec, 'targets': t_spec},)) as pool:
+                    futures = [pool.submit(_fit_in_worker, stat, *tasks[stat]) for stat in order]
+                    for future in as_completed(futures):
+                        stat, model, metrics = future.result()
+                        results[stat] = {'model': model, 'features': MODEL_SPECS[stat]['features'], 'metrics': metrics}
+                        print(f"  ✓ {stat} trained in {metrics['seconds']:.1f}s")
+            finally:
+                for shm in (x_shm, t_shm):
+                    shm.close()
+                    shm.unlink()
+
+    total = time.perf_counter() - start
+    print(f"\nAll models trained in {total:.1f}s wall clock "
+          f"({sum(r['metrics']['seconds'] for r in results.values()):.1f}s if run one after another)\n")
+    #feature importance tables
+    with stage(profiler, 'reports'):
+        for stat in STATS:
+            print_model_report(stat, results[stat]['model'], results[stat]['metrics'])
+            print(f"  wall clock: {results[stat]['metrics']['seconds']:.1f}s with n_jobs={results[stat]['metrics']['n_jobs']}\n")
+    return results
@@ -0,0 +1,324 @@
+# training_data.py - keeps a local copy of the training rows so retraining doesn't re-query every season
+import json
+import os
+import shutil
+import time
+import pandas as pd #handles data tables (data frames)
+import pyarrow as pa #columnar tables
+import pyarrow.parquet as pq #parquet files
+from point_in_time_features import build_point_in_time_frame
+from training_profile import stage
+
+"""
+the old fetch_training_data() ran one big query over four seasons on every retrain, including a
+"SELECT TOP 1 Id FROM Teams WHERE TeamName = CASE ..." subquery for every row, and kept nothing
+
+the data is split in two kinds:
+    box score rows  - one row per player per game from Stats (+ home/away and opponent from Games).
+                      these never change once a game is played, so they are cached on disk in parquet
+                      files, one folder per season, and each run only fetches rows with a higher
+                      Stats.Id than the last one cached (the watermark)
+    lookup tables   - PlayerAggregates, OpponentDefensiveStats, PlayerVsTeam and Teams. these are small
+                      and get recomputed every night, so they're read fresh every run and joined in pandas
+
+the joined result has the same columns and the same values the old query returned
+
+    training_cache/
+        season=2024-2025/part-00001.parquet ...
+        state.json          - cache format, watermark (largest Stats.Id) and row count per season
+
+a cache written with an older format (different columns) is thrown away and fetched again on the next run
+
+if a season's row count in the database doesn't match the cache after the update (rows deleted or
+re-loaded), that season is fetched again from scratch. --rebuild throws the whole cache away
+"""
+
+CACHE_DIR = 'training_cache'
+STATE_FILE = 'state.json'
+FETCH_CHUNK = 50000 #rows streamed from the database at a time
+MAX_PARTS = 20 #part files per season before they're merged into one
+CACHE_FORMAT = 2 #bump when STATS_COLUMNS changes, 2 added GameId, TeamId and GameTime for point_in_time_features.py
+
+FIRST_SEASON = 2022 #2022-2023
+LAST_SEASON = 2025 #2025-2026
+
+#box score columns kept in the cache
+STATS_COLUMNS = ['StatId', 'Season', 'PlayerApiId', 'TeamName', 'ActualPoints', 'ActualRebounds', 'ActualAssists',
+                 'ActualSteals', 'ActualBlocks', 'ActualTurnovers', 'IsHome', 'OpponentTeam', 'GameId', 'TeamId', 'GameTime']
+TEXT_COLUMNS = ('Season', 'TeamName', 'OpponentTeam')
+TIME_COLUMNS = ('GameTime',)
+
+#"2022-2023", "2023-2024", ... for every season starting in first through last
+def season_range(first=FIRST_SEASON, last=LAST_SEASON):
+    return [f'{year}-{year + 1}' for year in range(int(first), int(last) + 1)]
+
+#reads "2022:2025" or "2022-2023:2025-2026" (or a single season) into a season list
+def parse_seasons(text):
+    if not text:
+        return season_range()
+    first, _, last = text.partition(':')
+    first_year = int(first.split('-')[0])
+    last_year = int((last or first).split('-')[0])
+    if last_year < first_year:
+        raise ValueError(f'Season range {text} ends before it starts')
+    return season_range(first_year, last_year)
+
+def placeholders(values):
+    return ', '.join('?' for _ in values)
+
+def season_dir(cache_dir, season):
+    return os.path.join(cache_dir, f'season={season}')
+
+def load_state(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, STATE_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'format': CACHE_FORMAT, 'seasons': {}}
+
+def save_state(cache_dir, state):
+    tmp = os.path.join(cache_dir, STATE_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, os.path.join(cache_dir, STATE_FILE))
+
+#box score rows with Stats.Id above the watermark, streamed in chunks
+#home/away and the opponent come from Games the same way the old query worked them out
+def stream_stats_rows(conn, seasons, after_id=0, chunk_size=FETCH_CHUNK):
+    query = f"""
+    SELECT
+        s.Id as StatId,
+        s.Season,
+        s.PlayerApiId,
+        s.TeamName,
+        s.Points as ActualPoints,
+        s.TotalRebounds as ActualRebounds,
+        s.Assists as ActualAssists,
+        s.Steals as ActualSteals,
+        s.Blocks as ActualBlocks,
+        s.Turnovers as ActualTurnovers,
+        CASE
+            WHEN s.TeamName = g.HomeTeam THEN 1
+            ELSE 0
+        END as IsHome,
+        CASE
+            WHEN s.TeamName = g.HomeTeam THEN g.AwayTeam
+            ELSE g.HomeTeam
+        END as OpponentTeam,
+        s.GameId,
+        s.TeamId,
+        COALESCE(g.StartTime, s.CreatedDate) as GameTime
+    FROM Stats s
+    LEFT JOIN Games g ON s.GameId = g.Id
+    WHERE s.Season IN ({placeholders(seasons)})
+        AND s.Id > ?
+        AND s.Points IS NOT NULL
+    ORDER BY s.Id
+    """
+    cursor = conn.cursor()
+    cursor.execute(query, *seasons, after_id)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield pd.DataFrame.from_records([tuple(row) for row in rows], columns=STATS_COLUMNS)
+
+#rows and largest Id per season in the database, to check the cache against
+def database_counts(conn, seasons):
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT Season, COUNT(*), MAX(Id)
+        FROM Stats
+        WHERE Season IN ({placeholders(seasons)}) AND Points IS NOT NULL
+        GROUP BY Season
+    """, *seasons)
+    return {season: (count, max_id) for season, count, max_id in cursor.fetchall()}
+
+def to_arrow(df):
+    df = df.copy()
+    for column in STATS_COLUMNS:
+        if column in TEXT_COLUMNS:
+            df[column] = df[column].astype('string')
+        elif column in TIME_COLUMNS:
+            df[column] = pd.to_datetime(df[column])
+        else:
+            df[column] = pd.to_numeric(df[column]).astype('Int64') #nullable ints, steals/blocks can be NULL
+    return pa.Table.from_pandas(df[STATS_COLUMNS], preserve_index=False)
+
+def write_part(cache_dir, season, df, state):
+    folder = season_dir(cache_dir, season)
+    os.makedirs(folder, exist_ok=True)
+    info = state['seasons'].setdefault(season, {'rows': 0, 'watermark': 0, 'parts': 0})
+    info['parts'] += 1
+    tmp = os.path.join(folder, f'part-{info["parts"]:05d}.parquet.tmp')
+    pq.write_table(to_arrow(df), tmp)
+    os.replace(tmp, tmp[:-len('.tmp')])
+    info['rows'] += len(df)
+    info['watermark'] = max(info['watermark'], int(df['StatId'].max()))
+
+#merges a season's part files into one once there are too many
+def compact_season(cache_dir, season, state):
+    folder = season_dir(cache_dir, season)
+    parts = sorted(name for name in os.listdir(folder) if name.endswith('.parquet'))
+    if len(parts) <= MAX_PARTS:
+        return
+    table = pq.read_table([os.path.join(folder, name) for name in parts])
+    info = state['seasons'][season]
+    info['parts'] += 1
+    merged = f'part-{info["parts"]:05d}.parquet'
+    pq.write_table(table.sort_by('StatId'), os.path.join(folder, merged + '.tmp'))
+    os.replace(os.path.join(folder, merged + '.tmp'), os.path.join(folder, merged))
+    for name in parts:
+        os.remove(os.path.join(folder, name))
+
+def drop_season(cache_dir, season, state):
+    shutil.rmtree(season_dir(cache_dir, season), ignore_errors=True)
+    state['seasons'].pop(season, None)
+
+#brings the cache up to date for the given seasons, returns {season: rows added}
+def sync_training_cache(conn, seasons, cache_dir=CACHE_DIR, rebuild=False, chunk_size=FETCH_CHUNK):
+    if not rebuild and load_state(cache_dir).get('format') != CACHE_FORMAT and os.path.isdir(cache_dir):
+        print("  training cache is from an older format, fetching everything again")
+        rebuild = True
+    if rebuild:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    state = load_state(cache_dir)
+    added = {season: 0 for season in seasons}
+
+    def fetch(fetch_seasons, after_id, skip_to=None):
+        for chunk in stream_stats_rows(conn, fetch_seasons, after_id, chunk_size):
+            for season, rows in chunk.groupby('Season', sort=False):
+                if skip_to:
+                    rows = rows[rows['StatId'] > skip_to.get(season, 0)]
+                if len(rows):
+                    write_part(cache_dir, season, rows, state)
+                    added[season] += len(rows)
+            save_state(cache_dir, state) #after every chunk, so an interrupted run keeps what it fetched
+
+    # 1. new rows above the watermark. seasons already cached are fetched together from their lowest
+    #    watermark (rows at or below a season's own watermark are skipped), new seasons from the start
+    watermarks = {season: state['seasons'].get(season, {}).get('watermark', 0) for season in seasons}
+    cached = [season for season in seasons if watermarks[season]]
+    missing = [season for season in seasons if not watermarks[season]]
+    for fetch_seasons in (cached, missing):
+        if fetch_seasons:
+            fetch(fetch_seasons, min(watermarks[season] for season in fetch_seasons), watermarks)
+
+    # 2. any season whose row count no longer matches the database gets fetched again from scratch
+    counts = database_counts(conn, seasons)
+    for season in seasons:
+        expected = counts.get(season, (0, None))[0]
+        cached = state['seasons'].get(season, {}).get('rows', 0)
+        if expected != cached:
+            print(f"  {season}: cache has {cached} rows, database has {expected}, fetching the season again")
+            drop_season(cache_dir, season, state)
+            added[season] = 0
+            if expected:
+                fetch([season], 0)
+        if season in state['seasons']:
+            compact_season(cache_dir, season, state)
+    save_state(cache_dir, state)
+    return added
+
+#every cached box score row for the given seasons, in Stats.Id order
+def read_cached_rows(seasons, cache_dir=CACHE_DIR):
+    tables = []
+    for season in seasons:
+        folder = season_dir(cache_dir, season)
+        if not os.path.isdir(folder):
+            continue
+        parts = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.parquet'))
+        if parts:
+            tables.append(pq.read_table(parts))
+    if not tables:
+        return pd.DataFrame(columns=STATS_COLUMNS)
+    df = pa.concat_tables(tables).to_pandas()
+    #back to the plain dtypes pd.read_sql gives: ints, floats where there are NULLs, strings as objects
+    for column in STATS_COLUMNS:
+        if column in TEXT_COLUMNS:
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+        elif column in TIME_COLUMNS:
+            continue
+        else:
+            df[column] = df[column].astype('float64' if df[column].isna().any() else 'int64')
+    #an interrupted run can leave a part file behind that the state doesn't know about yet
+    df = df.drop_duplicates('StatId')
+    return df.sort_values('StatId', kind='stable').reset_index(drop=True)
+
+#joins the cached box scores with fresh season averages, opponent defense and matchup history
+#gives the same columns and values as the old single query in fetch_training_data()
+def build_training_frame(conn, stats_df, seasons):
+    season_params = placeholders(seasons)
+    aggregates = pd.read_sql(f"""
+        SELECT PlayerApiId, Season,
+            AvgPoints as SeasonAvgPoints,
+            AvgRebounds as SeasonAvgRebounds,
+            AvgAssists as SeasonAvgAssists,
+            AvgSteals as SeasonAvgSteals,
+            AvgBlocks as SeasonAvgBlocks,
+            AvgTurnovers as SeasonAvgTurnovers,
+            Last5AvgPoints,
+            Last10AvgPoints,
+            GamesPlayed
+        FROM PlayerAggregates
+        WHERE Season IN ({season_params})
+            AND AvgPoints IS NOT NULL
+            AND GamesPlayed >= 5
+    """, conn, params=seasons)
+    defense = pd.read_sql(f"""
+        SELECT TeamId, Season, AvgPointsAllowed, AvgReboundsAllowed
+        FROM OpponentDefensiveStats
+        WHERE Season IN ({season_params})
+    """, conn, params=seasons)
+    teams = pd.read_sql("SELECT Id, TeamName FROM Teams", conn)
+
+    # join PlayerAggregates on player + season (inner join, like the old query)
+    df = stats_df.merge(aggregates, on=['PlayerApiId', 'Season'], how='inner')
+
+    # the opponent's Teams.Id by name, one lookup table instead of a subquery per row
+    team_ids = teams.sort_values('Id').drop_duplicates('TeamName').set_index('TeamName')['Id']
+    df['OpponentTeamId'] = df['OpponentTeam'].map(team_ids)
+    df = df.merge(defense.rename(columns={'TeamId': 'OpponentTeamId'}), on=['OpponentTeamId', 'Season'], how='left')
+    df['OppDefenseRating'] = df['AvgPointsAllowed'].fillna(110)
+    df['OppReboundsAllowed'] = df['AvgReboundsAllowed'].fillna(43)
+    df = df.drop(columns=['OpponentTeamId', 'AvgPointsAllowed', 'AvgReboundsAllowed'])
+    return df
+
+#matchup history for the seasons, same query the old fetch_training_data() ran
+def fetch_matchups(conn, seasons):
+    return pd.read_sql(f"""
+    SELECT
+        pvt.PlayerApiId,
+        t.TeamName as OpponentTeam,
+        pvt.AvgPoints as VsTeamAvgPoints,
+        pvt.AvgRebounds as VsTeamAvgRebounds,
+        pvt.AvgAssists as VsTeamAvgAssists,
+        pvt.GamesPlayed as VsTeamGames
+    FROM PlayerVsTeam pvt
+    JOIN Teams t ON pvt.OpponentTeamId = t.Id
+    WHERE pvt.Season IN ({placeholders(seasons)})
+    """, conn, params=seasons)
+
+#updates the cache and returns the training rows (before the matchup merge)
+#point_in_time builds the averages from the box scores before each game instead of joining the aggregate
+#tables, see point_in_time_features.py (the matchup columns are then already there)
+#profiler (training_profile.TrainingProfiler) times each step when given
+def load_training_rows(conn, seasons, cache_dir=CACHE_DIR, rebuild=False, profiler=None, point_in_time=False):
+    start = time.perf_counter()
+    with stage(profiler, 'sync_cache') as info:
+        added = sync_training_cache(conn, seasons, cache_dir, rebuild)
+        info['rows'] = sum(added.values())
+    with stage(profiler, 'read_cache') as info:
+        stats_df = read_cached_rows(seasons, cache_dir)
+        info['rows'] = len(stats_df)
+    print(f"Training cache: {len(stats_df)} box score rows ({sum(added.values())} new) in {time.perf_counter() - start:.1f}s")
+    if point_in_time:
+        with stage(profiler, 'point_in_time_features') as info:
+            df = build_point_in_time_frame(stats_df)
+            info['rows'] = len(df)
+        return df
+    with stage(profiler, 'join_aggregates') as info:
+        df = build_training_frame(conn, stats_df, seasons)
+        info['rows'] = len(df)
+    return df
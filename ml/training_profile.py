@@ -0,0 +1,175 @@
+# training_profile.py - times every stage of a training run and saves the numbers next to the models
+# usage: python3 training_profile.py [--runs 5]   compares the last few runs stage by stage
+import argparse
+import json #writes the report
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+"""
+when training gets slower this says where: every stage of train_model.py (the sql fetch, the joins,
+prepare_features, the fits, the reports, saving) records
+    wallSeconds  - clock time
+    cpuSeconds   - cpu time of this process plus any worker processes that finished during the stage
+                   (more than wallSeconds means several cores were busy)
+    peakRssMb    - highest memory use of this process during the stage, sampled in a background thread
+    rows         - rows going out of the stage, where that makes sense
+and each model gets its own fit/eval seconds, cpu seconds and worker memory from train_parallel.py
+
+the report is saved as training_profile.json next to the model files (so every folder under
+model_versions/ has the profile of the run that made it) and appended to training_profiles.jsonl,
+which this file prints as a table to compare runs
+"""
+
+PROFILE_FILE = 'training_profile.json'
+HISTORY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'training_profiles.jsonl')
+SAMPLE_INTERVAL = 0.05 #seconds between memory samples while a stage runs
+
+#highest rss so far in MB, of this process or (RUSAGE_CHILDREN) the largest finished child process
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss #kilobytes on linux, bytes on mac
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+#current rss in MB, from /proc when there is one
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+#cpu seconds used by this process and its finished child processes
+def cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+class TrainingProfiler:
+    def __init__(self, sample_interval=SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.started_at = datetime.now()
+        self.stages = []
+        self.models = {}
+        self._start = time.perf_counter()
+        self._peak = 0.0
+        self._open = [] #names of the stages running right now, outermost first
+        self._sampling = threading.Event()
+        self._sampler = None
+
+    def _sample(self):
+        while not self._sampling.wait(self.sample_interval):
+            self._peak = max(self._peak, current_rss_mb())
+
+    #with profiler.stage('name') as info: ... info['rows'] = n
+    #stages can be nested, the inner ones are listed with their parent's name in front
+    @contextmanager
+    def stage(self, name, rows=None):
+        info = {'rows': rows}
+        #added now and filled in at the end, so stages are listed in the order they started
+        entry = {'stage': '/'.join(self._open + [name])}
+        self.stages.append(entry)
+        self._open.append(name)
+        outer_peak = self._peak
+        self._peak = current_rss_mb()
+        top = self._sampler is None
+        if top:
+            self._sampling.clear()
+            self._sampler = threading.Thread(target=self._sample, name='profile-memory', daemon=True)
+            self._sampler.start()
+        wall = time.perf_counter()
+        cpu = cpu_seconds()
+        try:
+            yield info
+        finally:
+            peak = max(self._peak, current_rss_mb())
+            if top:
+                self._sampling.set()
+                self._sampler.join()
+                self._sampler = None
+            self._open.pop()
+            self._peak = max(outer_peak, peak) #the parent's peak includes this stage
+            entry.update({
+                'wallSeconds': round(time.perf_counter() - wall, 3),
+                'cpuSeconds': round(cpu_seconds() - cpu, 3),
+                'peakRssMb': peak,
+                'rows': info.get('rows')
+            })
+
+    #per model numbers from train_all / train_incremental
+    def add_models(self, results):
+        for stat, result in results.items():
+            metrics = result['metrics']
+            self.models[stat] = {key: metrics.get(key) for key in
+                                 ['train_rows', 'test_rows', 'seconds', 'fit_seconds', 'eval_seconds',
+                                  'cpu_seconds', 'worker_peak_rss_mb', 'n_jobs', 'trees'] if key in metrics}
+
+    def report(self, **extra):
+        return {
+            'startedAt': self.started_at.isoformat(timespec='seconds'),
+            'wallSeconds': round(time.perf_counter() - self._start, 3),
+            'peakRssMb': peak_rss_mb(),
+            'childPeakRssMb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'cores': os.cpu_count(),
+            **extra,
+            'stages': self.stages,
+            'models': self.models
+        }
+
+    #writes the report next to the model files and adds it to the history, returns the report
+    def save(self, directory='.', history=HISTORY_FILE, **extra):
+        report = self.report(**extra)
+        tmp = os.path.join(directory, PROFILE_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp, os.path.join(directory, PROFILE_FILE))
+        if history:
+            try:
+                with open(history, 'a') as f:
+                    f.write(json.dumps(report) + '\n')
+            except OSError as e:
+                print(f"Warning: could not add the training profile to {history}: {e}")
+        return report
+
+    def print_summary(self):
+        print(f"\n{'stage':32s} {'wall s':>8s} {'cpu s':>8s} {'peak MB':>8s} {'rows':>9s}")
+        for s in self.stages:
+            rows = '' if s['rows'] is None else str(s['rows'])
+            print(f"{s['stage']:32s} {s['wallSeconds']:8.2f} {s['cpuSeconds']:8.2f} {s['peakRssMb']:8.1f} {rows:>9s}")
+
+#profiler.stage(name) when there is a profiler, a do-nothing block otherwise
+def stage(profiler, name, rows=None):
+    return profiler.stage(name, rows) if profiler else nullcontext({})
+
+#the last few runs from the history file, stage wall times side by side
+def main():
+    parser = argparse.ArgumentParser(description='Compare the stage timings of recent training runs')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--history', default=HISTORY_FILE)
+    args = parser.parse_args()
+
+    try:
+        with open(args.history, 'r') as f:
+            runs = [json.loads(line) for line in f if line.strip()][-args.runs:]
+    except OSError:
+        print(f"No training runs recorded in {args.history} yet")
+        return
+    names = []
+    for run in runs:
+        for s in run['stages']:
+            if s['stage'] not in names:
+                names.append(s['stage'])
+    print(f"{'stage (wall seconds)':32s}" + ''.join(f"{run.get('version') or run['startedAt']:>21s}" for run in runs))
+    for name in names + ['total']:
+        cells = []
+        for run in runs:
+            if name == 'total':
+                cells.append(run['wallSeconds'])
+            else:
+                cells.append(next((s['wallSeconds'] for s in run['stages'] if s['stage'] == name), None))
+        print(f"{name:32s}" + ''.join(f"{'-' if c is None else f'{c:.2f}':>21s}" for c in cells))
+
+if __name__ == "__main__":
+    main()
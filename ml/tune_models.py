@@ -0,0 +1,265 @@
+# tune_models.py - searches for forest settings that are both accurate and fast to predict with
+# usage: python3 tune_models.py [--candidates 24] [--cores N] [--seasons 2022:2025] [--dry-run]
+import argparse
+import json #writes the report
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np #math operations
+from forest_compiler import compile_forest
+from train_model import (MODEL_SPECS, STATS, TUNED_PARAMS_FILE, fit_stat_model, fetch_training_data,
+                         prepare_features, parse_seasons)
+from train_parallel import build_training_arrays, split_rows, _attach, _shared, _to_shared
+
+"""
+the forest settings in MODEL_SPECS were picked by hand. more trees and deeper trees usually lower the
+mae a little, but every tree and every level is more work on each prediction, so this looks for the
+settings where paying more latency stops buying accuracy
+
+successive halving, separately for each stat:
+    - CANDIDATES random settings (plus the current ones) are each fit on a small slice of the training rows
+    - every candidate gets an mae on the test rows and a latency: microseconds per row for the compiled
+      forest (forest_compiler.py), which is what predict_services.py actually runs
+    - the best 1/ETA by (pareto rank on mae and latency, then mae) go on to the next round with ETA times
+      more rows, until FINAL_CANDIDATES are left and those are fit on all of the training rows
+      (the current settings are carried along to the end too, as the baseline)
+    - the last round's latencies are measured again one at a time in this process, so they aren't
+      slowed down by the other fits running alongside
+
+the pareto front is every final candidate that no other candidate beats on both mae and latency.
+the chosen settings are the fastest ones on the front whose mae is within MAE_TOLERANCE of the best mae.
+they're saved to tuned_params.json, which train_model.py uses from then on and records in model_metadata.json
+"""
+
+#values tried for each setting, min_samples_split and random_state stay as they are in MODEL_SPECS
+SEARCH_SPACE = {
+    'n_estimators': [50, 100, 150, 200, 300],
+    'max_depth': [8, 10, 12, 15, 20],
+    'min_samples_leaf': [1, 2, 4, 8],
+    'max_features': [1.0, 'sqrt', 0.5],
+}
+CANDIDATES = 24 #settings tried per stat in the first round
+ETA = 3 #each round keeps 1/ETA of the candidates and gives them ETA times more rows
+FINAL_CANDIDATES = 4 #candidates fit on all of the rows at the end
+MIN_ROWS = 5000 #fewest training rows a first round candidate gets
+LATENCY_ROWS = 1000 #rows predicted when timing a candidate
+LATENCY_REPEATS = 3 #timed this many times, the fastest counts
+MAE_TOLERANCE = 0.01 #chosen = fastest on the pareto front within 1% of the best mae
+REPORT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tuning_report.json')
+
+#random settings for one stat, the current MODEL_SPECS settings are always candidate 0
+def sample_candidates(stat, n=CANDIDATES, seed=0):
+    current = dict(MODEL_SPECS[stat]['params'])
+    fixed = {key: value for key, value in current.items() if key not in SEARCH_SPACE}
+    rng = np.random.default_rng(seed + STATS.index(stat))
+    candidates = [current]
+    seen = {json.dumps(current, sort_keys=True)}
+    combinations = math.prod(len(values) for values in SEARCH_SPACE.values())
+    while len(candidates) < min(n, combinations + 1):
+        params = dict(fixed)
+        for key, values in SEARCH_SPACE.items():
+            params[key] = values[rng.integers(len(values))]
+        params = {key: (value.item() if isinstance(value, np.generic) else value) for key, value in params.items()}
+        key = json.dumps(params, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+#how many rows each round trains on, the last round gets all of them
+def round_sizes(n_candidates, n_rows, eta=ETA, final=FINAL_CANDIDATES, min_rows=MIN_ROWS):
+    rounds = 0
+    while n_candidates > final:
+        n_candidates = max(final, math.ceil(n_candidates / eta))
+        rounds += 1
+    return [max(min(min_rows, n_rows), n_rows // eta ** (rounds - i)) for i in range(rounds + 1)]
+
+#microseconds per row for a compiled forest, fastest of a few runs
+def measure_latency(compiled, X, repeats=LATENCY_REPEATS):
+    compiled.predict(X[:10]) #warm up
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        compiled.predict(X)
+        best = min(best, time.perf_counter() - start)
+    return best / len(X) * 1e6
+
+#fits and scores one candidate on the shared arrays, runs in a worker process
+def _evaluate(stat, index, params, train_rows, test_rows, feature_cols, target_col, return_model):
+    start = time.perf_counter()
+    X = _shared['X'][1]
+    targets = _shared['targets'][1]
+    model, metrics = fit_stat_model(stat, X[np.ix_(train_rows, feature_cols)], targets[train_rows, target_col],
+                                    X[np.ix_(test_rows, feature_cols)], targets[test_rows, target_col],
+                                    n_jobs=1, params=params)
+    metrics['fit_seconds'] = round(time.perf_counter() - start, 2)
+    compiled = compile_forest(model)
+    metrics['nodes'] = int(compiled.n_nodes)
+    metrics['latency_us'] = measure_latency(compiled, X[np.ix_(test_rows[:LATENCY_ROWS], feature_cols)])
+    return stat, index, metrics, (model if return_model else None)
+
+#pareto rank of every point (0 = on the front), lower mae and lower latency are both better
+def pareto_ranks(points):
+    ranks = [None] * len(points)
+    remaining = set(range(len(points)))
+    rank = 0
+    while remaining:
+        front = {i for i in remaining
+                 if not any(points[j][0] <= points[i][0] and points[j][1] <= points[i][1] and points[j] != points[i]
+                            for j in remaining)}
+        for i in front:
+            ranks[i] = rank
+        remaining -= front
+        rank += 1
+    return ranks
+
+#indexes of the candidates that go on to the next round
+def keep_best(results, keep):
+    points = [(r['mae'], r['latency_us']) for r in results]
+    ranks = pareto_ranks(points)
+    order = sorted(range(len(results)), key=lambda i: (ranks[i], points[i][0]))
+    return order[:keep]
+
+#fastest pareto candidate within tolerance of the best mae
+def choose(final, tolerance=MAE_TOLERANCE):
+    best_mae = min(r['mae'] for r in final)
+    ranks = pareto_ranks([(r['mae'], r['latency_us']) for r in final])
+    for r, rank in zip(final, ranks):
+        r['pareto'] = rank == 0
+    good = [r for r in final if r['pareto'] and r['mae'] <= best_mae * (1 + tolerance)]
+    return min(good, key=lambda r: (r['latency_us'], r['mae']))
+
+def tune(df, cores=None, n_candidates=CANDIDATES, seed=0):
+    cores = max(1, cores or os.cpu_count() or 1)
+    X, columns, targets = build_training_arrays(df)
+    splits = split_rows(df)
+    column_index = {name: i for i, name in enumerate(columns)}
+    rng = np.random.default_rng(seed)
+
+    candidates = {stat: sample_candidates(stat, n_candidates, seed) for stat in STATS}
+    alive = {stat: list(range(len(candidates[stat]))) for stat in STATS}
+    #shuffled once so every round's slice of rows is a random sample and the bigger slices contain the smaller ones
+    train_order = {stat: rng.permutation(splits[stat][0]) for stat in STATS}
+    sizes = {stat: round_sizes(len(candidates[stat]), len(train_order[stat])) for stat in STATS}
+    n_rounds = max(len(s) for s in sizes.values())
+    history = {stat: [] for stat in STATS}
+    final_models = {}
+
+    x_shm, x_spec = _to_shared(X)
+    t_shm, t_spec = _to_shared(targets)
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=cores, mp_context=context,
+                                 initializer=_attach, initargs=({'X': x_spec, 'targets': t_spec},)) as pool:
+            for round_no in range(n_rounds):
+                start = time.perf_counter()
+                futures = []
+                for stat in STATS:
+                    if round_no >= len(sizes[stat]):
+                        continue
+                    last = round_no == len(sizes[stat]) - 1
+                    rows = np.sort(train_order[stat][:sizes[stat][round_no]])
+                    for index in alive[stat]:
+                        futures.append(pool.submit(
+                            _evaluate, stat, index, candidates[stat][index], rows, splits[stat][1],
+                            [column_index[f] for f in MODEL_SPECS[stat]['features']], STATS.index(stat), last))
+                results = {stat: {} for stat in STATS}
+                for future in as_completed(futures):
+                    stat, index, metrics, model = future.result()
+                    results[stat][index] = metrics
+                    if model is not None:
+                        final_models[(stat, index)] = model
+                print(f"Round {round_no + 1}/{n_rounds}: {len(futures)} candidates in {time.perf_counter() - start:.1f}s")
+
+                for stat in STATS:
+                    if not results[stat]:
+                        continue
+                    evaluated = [dict(results[stat][i], candidate=i, round=round_no + 1,
+                                      params=candidates[stat][i]) for i in alive[stat]]
+                    history[stat].extend(evaluated)
+                    if round_no < len(sizes[stat]) - 1:
+                        keep = max(FINAL_CANDIDATES, math.ceil(len(evaluated) / ETA))
+                        alive[stat] = [evaluated[i]['candidate'] for i in keep_best(evaluated, keep)]
+                        #the current settings always reach the last round so the report can compare against them
+                        if 0 not in alive[stat]:
+                            alive[stat].append(0)
+    finally:
+        for shm in (x_shm, t_shm):
+            shm.close()
+            shm.unlink()
+
+    #time the finalists again one at a time, nothing else running
+    report = {}
+    for stat in STATS:
+        features = [column_index[f] for f in MODEL_SPECS[stat]['features']]
+        X_latency = X[np.ix_(splits[stat][1][:LATENCY_ROWS], features)]
+        final = [r for r in history[stat] if r['round'] == len(sizes[stat])]
+        for r in final:
+            r['latency_us'] = measure_latency(compile_forest(final_models[(stat, r['candidate'])]), X_latency)
+        chosen = choose(final)
+        current = next(r for r in final if r['candidate'] == 0)
+        report[stat] = {'chosen': chosen, 'current': current, 'final': final, 'history': history[stat]}
+    return report
+
+def _describe(params):
+    return (f"{params['n_estimators']:>3d} trees, depth {params['max_depth']!s:>2s}, "
+            f"leaf {params.get('min_samples_leaf', 1)}, features {params.get('max_features', 1.0)}")
+
+def print_pareto_report(report):
+    for stat in STATS:
+        entry = report[stat]
+        print(f"\n{stat.capitalize()} ({entry['final'][0]['train_rows']} training rows)")
+        print(f"   {'settings':58s} {'mae':>7s} {'µs/row':>8s} {'nodes':>9s} {'fit s':>7s}")
+        for r in sorted(entry['final'], key=lambda r: r['latency_us']):
+            mark = '→' if r is entry['chosen'] else ('*' if r['pareto'] else ' ')
+            label = _describe(r['params']) + (' (current)' if r['candidate'] == 0 else '')
+            print(f" {mark} {label:58s} {r['mae']:7.3f} {r['latency_us']:8.2f} {r['nodes']:9d} {r['fit_seconds']:7.1f}")
+        current = entry['current']
+        if current is not entry['chosen']:
+            chosen = entry['chosen']
+            print(f"   chosen vs current: mae {chosen['mae'] - current['mae']:+.3f}, "
+                  f"{current['latency_us'] / chosen['latency_us']:.1f}x the speed")
+    print("\n* = on the pareto front (nothing else is both more accurate and faster), → = chosen")
+
+#saves the chosen settings for train_model.py and the full search for looking at later
+def save_tuning(report, n_rows, path=TUNED_PARAMS_FILE, report_path=REPORT_FILE):
+    tuned_at = datetime.now().isoformat(timespec='seconds')
+    tuned = {
+        'tuned_at': tuned_at,
+        'rows': n_rows,
+        'params': {stat: report[stat]['chosen']['params'] for stat in STATS},
+        'scores': {stat: {'mae': report[stat]['chosen']['mae'], 'latency_us': report[stat]['chosen']['latency_us']}
+                   for stat in STATS}
+    }
+    for target, data in [(path, tuned), (report_path, {'tuned_at': tuned_at, 'stats': report})]:
+        tmp = target + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f, indent=2, default=str)
+        os.replace(tmp, target)
+    print(f"\n✓ Chosen settings saved to {path}, the next retrain uses them")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search forest settings for the six stat models')
+    parser.add_argument('--cores', type=int, default=None, help='candidates fit at the same time (default: all cores)')
+    parser.add_argument('--candidates', type=int, default=CANDIDATES, help=f'settings tried per stat (default: {CANDIDATES})')
+    parser.add_argument('--seasons', default=None, help='season range to tune on, e.g. 2022:2025')
+    parser.add_argument('--point-in-time', action='store_true', help='averages from the games before each game, like train_model.py --point-in-time')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true', help="print the report but don't save the chosen settings")
+    args = parser.parse_args(argv)
+
+    #the box scores come from the local training cache, so repeated tuning runs don't hit the database much
+    df = prepare_features(fetch_training_data(parse_seasons(args.seasons), point_in_time=args.point_in_time))
+    print(f"Tuning on {len(df)} game records, {args.candidates} candidates per stat\n")
+    start = time.perf_counter()
+    report = tune(df, cores=args.cores, n_candidates=args.candidates, seed=args.seed)
+    print(f"\nSearch took {time.perf_counter() - start:.1f}s")
+    print_pareto_report(report)
+    if not args.dry_run:
+        save_tuning(report, len(df))
+
+if __name__ == "__main__":
+    main()
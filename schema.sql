@@ -15,6 +15,7 @@
 --   - TeamGameStats: Team-level game statistics
 --   - Schedule: Upcoming game schedules
 --   - MLPredictions: Machine learning prediction tracking
+--   - MLAccuracyRollups: Running prediction error sums per model version, stat and day
 
 -- CORE TABLES
 
@@ -244,5 +245,42 @@ CREATE TABLE [dbo].[MLPredictions] (
     [AssistsError]      FLOAT (53)     NULL,
     [CreatedDate]       DATETIME       DEFAULT (getdate()) NULL,
     [GameCompleted]     BIT            DEFAULT ((0)) NULL,
+    [PredictedSteals]    FLOAT (53)    NULL,
+    [PredictedBlocks]    FLOAT (53)    NULL,
+    [PredictedTurnovers] FLOAT (53)    NULL,
+    [ActualSteals]       INT           NULL,
+    [ActualBlocks]       INT           NULL,
+    [ActualTurnovers]    INT           NULL,
+    [StealsError]        FLOAT (53)    NULL,
+    [BlocksError]        FLOAT (53)    NULL,
+    [TurnoversError]     FLOAT (53)    NULL,
+    [PlayerApiId]        INT           NULL,  -- resolved when the prediction is made
+    [OpponentTeamId]     INT           NULL,  -- Teams.Id of the opponent
+    [GameId]             INT           NULL,  -- the game it was checked against, filled in by reconciliation
+    [ModelVersion]       NVARCHAR (64) NULL,  -- version of the models that made the prediction
+    [RolledUp]           BIT           DEFAULT ((0)) NOT NULL,  -- counted in MLAccuracyRollups
     PRIMARY KEY CLUSTERED ([Id] ASC)
 );
+
+-- Pending predictions are matched to box scores in batches of Ids
+CREATE NONCLUSTERED INDEX [IX_MLPredictions_Pending]
+    ON [dbo].[MLPredictions]([GameCompleted] ASC, [Id] ASC);
+
+CREATE NONCLUSTERED INDEX [IX_MLPredictions_NotRolledUp]
+    ON [dbo].[MLPredictions]([Id] ASC)
+    WHERE [GameCompleted] = 1 AND [RolledUp] = 0;
+
+-- MLAccuracyRollups Table
+-- Running error sums per (model version, stat, game day), updated as predictions are reconciled
+-- MAE = SumAbsError / Predictions, bias = SumError / Predictions (positive = predicted too high)
+CREATE TABLE [dbo].[MLAccuracyRollups] (
+    [ModelVersion]    NVARCHAR (64) NOT NULL,
+    [Stat]            NVARCHAR (20) NOT NULL,  -- 'points', 'rebounds', ...
+    [Day]             DATE          NOT NULL,
+    [Predictions]     INT           NOT NULL,
+    [SumAbsError]     FLOAT (53)    NOT NULL,
+    [SumError]        FLOAT (53)    NOT NULL,
+    [SumSquaredError] FLOAT (53)    NOT NULL,
+    [LastUpdated]     DATETIME      DEFAULT (getdate()) NULL,
+    PRIMARY KEY CLUSTERED ([ModelVersion] ASC, [Stat] ASC, [Day] ASC)
+);